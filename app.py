@@ -1,57 +1,152 @@
-from flask import Flask, render_template, request, session, send_file, redirect
+from flask import Blueprint, Flask, current_app, render_template, request, session, send_file, redirect, Response, jsonify, stream_with_context
 from flask_session import Session
 from tempfile import mkdtemp
-from helpers import login_required, check_access
+from werkzeug.local import LocalProxy
+from helpers import DATABASE, login_required, check_access, form_etag, not_modified, with_validators
 from errors import error, AppError
+import click
 import csv
+import logging
+import math
 import os
 import threading
 import time
-import requests
-from pip._vendor import cachecontrol
 import pathlib
 
-from google.oauth2 import id_token
-from google_auth_oauthlib.flow import Flow
-import google.auth.transport.requests
-
-import pandas as pd
-
-from database_helper import Database
+from database_helper import Database, PERIODS, SERIES_SPANS
+from live_updates import FormListener, stream
+from fragment_cache import FragmentCache
+from session_store import PostgresSessionInterface
+import archives
+import partitions
+import profiling
+import records
+import retention
+import rollups
+import storage
+import uploads
+from markupsafe import Markup
 
 import datetime
 from io import BytesIO
-import base64
-import imghdr
 
-# Create Flask Application
-app = Flask(__name__)
-
-# Configure session to use filesystem (instead of signed cookies)
-app.config["SESSION_FILE_DIR"] = mkdtemp()
-app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+# pandas (export), Pillow (transcode-images) and the Google auth libraries
+# (login) are imported where they are used, so workers boot without them.
 
 GOOGLE_CLIENT_ID = '1057751202385-pj5q05o3kobbsbujjg15lnt9iim0ps11.apps.googleusercontent.com'
-app.secret_key = os.environ['client_secret']
-
-os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1" # to allow Http traffic for local dev
 
 client_secrets_file = os.path.join(pathlib.Path(__file__).parent, "client_secret.json")
 URL =  'http://127.0.0.1:5000'
 
-flow = Flow.from_client_secrets_file(
-    client_secrets_file=client_secrets_file,
-    scopes=["https://www.googleapis.com/auth/userinfo.profile", "https://www.googleapis.com/auth/userinfo.email", "openid"],
-    redirect_uri=f"{URL}/callback"
-)
+# Entry pages only change if the form's questions do, which changes their ETag
+ENTRY_CACHE_CONTROL = 'private, max-age=31536000'
+
+# Part of the dashboard ETag, bumped when the page's script changes so
+# browsers holding the old one refetch it
+DASHBOARD_REVISION = 3
+
+# Rendered dashboard row cells keyed by (form_submission_id, schema version)
+ROW_CACHE = LocalProxy(lambda: current_app.extensions['row_cache'])
+
+views = Blueprint('views', __name__, cli_group=None)
+
+
+def create_app(config=None, database=None) -> Flask:
+    """Builds the app. Nothing here connects to Postgres or Google: the pool
+    opens on the first query and the OAuth flow on the first login. Pass
+    `database` to share an existing Database."""
+    app = Flask(__name__)
+    app.config.from_mapping(
+        SESSION_PERMANENT=False,
+        SESSION_BACKEND=os.environ.get('SESSION_BACKEND', 'filesystem'),
+        # Whole request bodies above this are refused before being read, single
+        # images are limited while they stream into the database (uploads.py)
+        MAX_CONTENT_LENGTH=uploads.MAX_REQUEST_BYTES,
+        ROW_CACHE_MAX_BYTES=int(os.environ.get('ROW_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+        TEST_LOGIN=os.environ.get('TEST_LOGIN') == '1',
+    )
+    app.config.update(config or {})
+    app.secret_key = app.config.get('SECRET_KEY') or os.environ['client_secret']
+
+    database = database or Database()
+    app.extensions['database'] = database
+    app.extensions['form_listener'] = FormListener(database)
+    app.extensions['row_cache'] = FragmentCache(app.config['ROW_CACHE_MAX_BYTES'])
+
+    # Configure server-side sessions (instead of signed cookies). The filesystem
+    # store is private to one process, use SESSION_BACKEND=postgres when running
+    # more than one worker.
+    if app.config['SESSION_BACKEND'] == 'postgres':
+        app.session_interface = PostgresSessionInterface(app, database, permanent=False)
+    else:
+        app.config["SESSION_FILE_DIR"] = mkdtemp()
+        app.config["SESSION_TYPE"] = "filesystem"
+        Session(app)
+
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1" # to allow Http traffic for local dev
+
+    # Pool connections are lent per request, not kept by the thread that
+    # served it
+    @app.teardown_appcontext
+    def release_connection(exc):
+        database.release()
+
+    # Keeps monthly partitions created ahead of time, exits at once on
+    # unpartitioned tables
+    partitions.start_maintenance(database)
+    # Folds the dashboard chart's pending deltas into its rollups
+    rollups.start_compaction(database)
 
-DATABASE = Database()
+    # Off unless PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+    profiling.init_app(app)
+
+    app.register_blueprint(views)
+
+    # Stand-in for Google sign-in so load tests can reach the routes behind
+    # login_required. Never set TEST_LOGIN on a server anyone else can reach.
+    if app.config['TEST_LOGIN']:
+        app.logger.warning('TEST_LOGIN=1: /test-login signs anyone in without Google')
+        app.add_url_rule("/test-login", view_func=test_login)
+
+    return app
+
+
+def oauth_flow():
+    # Built on the first login, which is also when client_secret.json is read
+    if 'oauth_flow' not in current_app.extensions:
+        from google_auth_oauthlib.flow import Flow
+        current_app.extensions['oauth_flow'] = Flow.from_client_secrets_file(
+            client_secrets_file=client_secrets_file,
+            scopes=["https://www.googleapis.com/auth/userinfo.profile", "https://www.googleapis.com/auth/userinfo.email", "openid"],
+            redirect_uri=f"{URL}/callback"
+        )
+    return current_app.extensions['oauth_flow']
+
+
+def token_verifier():
+    # Shared by every login, verifies ID tokens against locally cached Google certs
+    if 'token_verifier' not in current_app.extensions:
+        from token_verifier import TokenVerifier, GOOGLE_CERTS_URL, GOOGLE_ISSUERS
+        current_app.extensions['token_verifier'] = TokenVerifier(
+            GOOGLE_CLIENT_ID, certs_url=os.environ.get('GOOGLE_CERTS_URL', GOOGLE_CERTS_URL),
+            issuers=os.environ.get('GOOGLE_ISSUERS', ','.join(GOOGLE_ISSUERS)).split(','))
+    return current_app.extensions['token_verifier']
+
+
+@views.app_errorhandler(413)
+def too_large(e):
+    return error('Upload is too large', 413), 413
+
+
+@views.before_app_request
+def route_reads():
+    # Read-your-writes: replicas only serve this user once they have replayed
+    # the user's last submission or deletion
+    DATABASE.read_after(session.get('write_lsn'))
 
 
 # Home Directory
-@app.route("/")
+@views.route("/")
 @login_required
 def index():
     session['last_visited'] = '/'
@@ -62,34 +157,25 @@ def index():
         return render_template("index.html", form_id=2, forms=forms)
 
 
-@app.route("/login")
+@views.route("/login")
 def login():
-    authorization_url, state = flow.authorization_url()
+    authorization_url, state = oauth_flow().authorization_url()
     session["state"] = state
-    print('login Attempt')
     return redirect(authorization_url)
 
 
-@app.route("/callback")
+@views.route("/callback")
 def callback():
-    print('calling back')
+    flow = oauth_flow()
     flow.fetch_token(authorization_response=request.url)
 
     if not session["state"] == request.args["state"]:
         return error('Login Error')
 
     credentials = flow.credentials
-    request_session = requests.session()
-    cached_session = cachecontrol.CacheControl(request_session)
-    token_request = google.auth.transport.requests.Request(session=cached_session)
-
-    id_info = id_token.verify_oauth2_token(
-        id_token=credentials._id_token,
-        request=token_request,
-        audience=GOOGLE_CLIENT_ID
-    )
+    id_info = token_verifier().verify(credentials._id_token)
 
-    print(id_info.get("email"), id_info.get('picture'), id_info.get("name"), id_info.get("sub"))
+    current_app.logger.debug('signed in google user %s', id_info.get("sub"))
 
     session["google_id"] = id_info.get("sub")
     session["name"] = id_info.get("name")
@@ -100,83 +186,301 @@ def callback():
     session["user_id"] = user
     session['photo_uri'] = id_info.get('picture')
 
-    print('got user')
-
     return redirect(session['last_visited'] if 'last_visited' in session else '/')
 
 
-@app.route("/<form_id>/dashboard")
+def test_login():
+    # Registered by create_app when TEST_LOGIN is on
+    email = request.args.get('email', 'loadtest@example.com')
+    google_id = f'test:{email}'
+
+    user = DATABASE.get_user_id(google_id)
+    if user is None:
+        DATABASE.sign_up_user(google_id, '', email, email)
+        user = DATABASE.get_user_id(google_id)
+    if user is None:
+        return error('Login Error')
+
+    session["google_id"] = google_id
+    session["name"] = email
+    session["user_id"] = user
+    session['photo_uri'] = ''
+    return redirect('/')
+
+
+@views.route("/<form_id>/dashboard")
 @login_required
 @check_access
 def dashboard(form_id):
     session['last_visited'] = f'/{form_id}/dashboard'
 
+    version = DATABASE.get_form_version(form_id)
+    if version is not None:
+        etag = form_etag('dashboard', DASHBOARD_REVISION, form_id, version['last_submission_id'], version['delete_count'],
+                         version['schema_version'])
+        cached = not_modified(etag, version['last_modified'])
+        if cached is not None:
+            return cached
+
     try:
-        qns, res = DATABASE.get_all_responses(form_id, session['user_id'])
+        if version is None:
+            qns, res = DATABASE.get_all_responses(form_id, session['user_id'], images=False)
+            rows = render_rows(res, qns)
+        else:
+            schema_version = version['schema_version']
+            qns, res = DATABASE.get_all_responses(form_id, session['user_id'], images=False,
+                                                  is_cached=lambda sub_id: (sub_id, schema_version) in ROW_CACHE)
+            rows = render_rows(res, qns, schema_version)
 
         form_name = DATABASE.get_form_name(form_id)
 
-        return render_template("dashboard.html", form_id=form_id, site_url=URL, photo_uri=session['photo_uri'],
-                            form_name=form_name, questions=qns, responses=res)
+        page = render_template("dashboard.html", form_id=form_id, site_url=URL, photo_uri=session['photo_uri'],
+                            form_name=form_name, questions=qns, question_types=[q.type for q in qns], rows=rows,
+                            etag=etag if version is not None else None)
+        if version is None:
+            return page
+        return with_validators(page, etag, version['last_modified'])
     
     except AppError as e:
         return e.render()
 
 
-@app.route("/<form_id>/response/<submission_id>", methods=["GET", "POST"])
+def render_rows(responses, questions, schema_version=None):
+    # Submissions are immutable, so a row's cells only need rendering once per
+    # schema version. Only the row number depends on the rest of the table.
+    # Images are links to /<form_id>/image/<answer_id>, keeping cached cells small.
+    row_template = current_app.jinja_env.get_template('dashboard_row.html')
+    rows = []
+
+    for res in responses:
+        key = (res.submission_id, schema_version)
+        cells = ROW_CACHE.get(key) if schema_version is not None else None
+
+        if cells is None:
+            if res.answers is None:
+                # Evicted between the lookup and now
+                sub = DATABASE.get_submission(request.view_args['form_id'], res.submission_id, images=False)
+                if sub is None:
+                    continue
+                res.answers = sub.answers
+            cells = row_template.render(answers=res.answers, questions=questions, form_id=request.view_args['form_id'])
+            if schema_version is not None:
+                ROW_CACHE.put(key, cells)
+
+        rows.append(f'<tr class="row-link-h"><th scope="row" class="data row-link" id="{int(res.submission_id)}">{len(rows) + 1}</th>{cells}</tr>')
+
+    return Markup(''.join(rows))
+
+
+@views.route("/<form_id>/series")
+@login_required
+@check_access
+def submission_series(form_id):
+    # Dashboard chart data: /<form_id>/series?bucket=day&split=<dropdown question id>
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in SERIES_SPANS:
+        return jsonify({'error': f'bucket must be one of {", ".join(SERIES_SPANS)}'}), 400
+    split = request.args.get('split', type=int)
+
+    try:
+        series = DATABASE.get_submission_series(form_id, session['user_id'], bucket, split)
+    except AppError as e:
+        return jsonify({'error': e.message}), 400
+
+    return jsonify(series)
+
+
+@views.route("/<form_id>/stream")
+@login_required
+@check_access
+def dashboard_stream(form_id):
+    # Server-Sent Events: pushes rows submitted or deleted after the page loaded
+    session['last_visited'] = f'/{form_id}/dashboard'
+    listener = current_app.extensions['form_listener']
+    if not listener.has_room():
+        # Every stream this process allows is open. A 204 stops EventSource
+        # from reconnecting and the dashboard polls instead.
+        return Response(status=204)
+    return Response(stream(listener, form_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@views.route("/<form_id>/response/<submission_id>", methods=["GET", "POST"])
 @login_required
 @check_access
 def view_entry(form_id, submission_id):
     session['last_visited'] = f'/{form_id}/{submission_id}'
 
     if request.method == "GET":
+        # Submissions never change after insert, only the question list can
+        version = DATABASE.get_submission_version(form_id, submission_id)
+        if version is not None:
+            etag = form_etag('entry', form_id, submission_id, version['schema_version'])
+            cached = not_modified(etag, version['submitted_at'], ENTRY_CACHE_CONTROL)
+            if cached is not None:
+                return cached
+
         try:
             qns, res, sub_details = DATABASE.get_response(form_id, session['user_id'], submission_id)
             form_name = DATABASE.get_form_name(form_id)
 
-            return render_template("entry.html", form_id=form_id, site_url="/"+URL, photo_uri=session['photo_uri'],
+            page = render_template("entry.html", form_id=form_id, site_url="/"+URL, photo_uri=session['photo_uri'],
                                 form_name=form_name, questions=qns, response=res, submission_details=sub_details, submission_id=submission_id)
+            if version is None:
+                return page
+            return with_validators(page, etag, version['submitted_at'], ENTRY_CACHE_CONTROL)
         
         except AppError as e:
             return e.render()
         
     DATABASE.delete_entry(form_id, submission_id)
+    session['write_lsn'] = DATABASE.write_position()
     
     return redirect(f'/{form_id}/dashboard')
 
 
-@app.route("/<form_id>/image/<answer_id>")
+@views.route("/<form_id>/image/<answer_id>")
 @login_required
 @check_access
 def get_image(form_id, answer_id):
     session['last_visited'] = f'/{form_id}/image/{answer_id}'
-    
-    # Decode the base64 string
-    image_str = DATABASE.get_image(session['user_id'], form_id, answer_id)
-    
-    # Convert the bytes to a BytesIO object
-    image_data = base64.b64decode(image_str)
-    image = BytesIO(image_data)
-    image_type = imghdr.what(None, h=image_data)
 
-    # Send the image as a response
-    return send_file(image, mimetype=f'image/{image_type}')
+    image = DATABASE.get_image(session['user_id'], form_id, answer_id, original=request.args.get('original') == '1')
+    if image is None:
+        return error('Image not found', 404), 404
+    if not image:
+        return error('Could not load the image', 500), 500
+
+    data, mime_type = image
+    return send_file(BytesIO(data), mimetype=mime_type)
+
+
+@views.route("/<form_id>/map")
+@login_required
+@check_access
+def map_view(form_id):
+    # Without a bbox this is the map page, which then asks for clusters of
+    # whatever is in view: /<form_id>/map?bbox=west,south,east,north&zoom=z
+    if 'bbox' not in request.args:
+        session['last_visited'] = f'/{form_id}/map'
+        form_name = DATABASE.get_form_name(form_id)
+        return render_template("map.html", form_id=form_id, photo_uri=session['photo_uri'], form_name=form_name, site_url=URL)
+
+    try:
+        bbox = [float(v) for v in request.args['bbox'].split(',')]
+        zoom = int(request.args.get('zoom', 0))
+        if len(bbox) != 4 or not all(math.isfinite(v) for v in bbox):
+            raise ValueError
+        # Longitudes may run past +-180 on a wrapped map, split_bbox folds them back
+        west, south, east, north = bbox
+        if not (-90 <= south <= north <= 90 and west <= east):
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+
+    try:
+        clusters = DATABASE.get_map_clusters(form_id, session['user_id'], bbox, max(0, min(zoom, 22)))
+    except AppError as e:
+        return jsonify({'error': e.message}), 500
+
+    return jsonify({'zoom': zoom, 'clusters': clusters})
+
+
+@views.cli.command("backfill-coordinates")
+def backfill_coordinates():
+    # Parse coordinates answers submitted before the spatial index existed
+    print(DATABASE.backfill_coordinates(), 'coordinates indexed')
+
+
+@views.cli.command("partition-tables")
+@click.option("--months-ahead", default=3)
+def partition_tables(months_ahead):
+    # One-time switch to monthly partitions, see partitions.py
+    try:
+        converted = partitions.convert(DATABASE, months_ahead)
+    except AppError as e:
+        raise click.ClickException(e.message)
+    if converted:
+        print('Tables partitioned by month, the *_unpartitioned copies can be dropped once checked')
+    else:
+        print('Nothing done, tables are already partitioned or the conversion failed')
+
+
+@views.cli.command("create-partitions")
+@click.option("--months-ahead", default=3)
+def create_partitions(months_ahead):
+    print(partitions.create_partitions(DATABASE, months_ahead), 'months ensured')
+
+
+@views.cli.command("detach-month")
+@click.argument("month", type=click.DateTime(formats=["%Y-%m"]))
+@click.option("--drop", is_flag=True, help="Drop the partitions instead of moving them to the archive schema")
+def detach_month(month, drop):
+    if partitions.detach_month(DATABASE, month.date(), drop):
+        print(f'{month:%Y-%m} detached')
+    else:
+        print(f'{month:%Y-%m} not detached, it must be a past month of a partitioned layout')
+
+
+@views.cli.command("migrate-storage")
+@click.argument("form_id", type=int)
+@click.argument("mode", type=click.Choice(storage.MODES))
+@click.option("--batch-size", default=500)
+def migrate_storage(form_id, mode, batch_size):
+    # Switch a form between typed answer tables and JSONB documents, see storage.py
+    print(storage.migrate_form(DATABASE, form_id, mode, batch_size), f'submissions moved to {mode} storage')
 
 
-@app.route("/<form_id>/export")
+@views.cli.command("retention")
+@click.argument("form_id", type=int)
+@click.argument("days", type=click.IntRange(min=0))
+def retention_policy(form_id, days):
+    # Archive the form's submissions once they are DAYS old, 0 to stop, see retention.py
+    if retention.set_policy(DATABASE, form_id, days):
+        print(f'form {form_id}: ' + (f'submissions archived after {days} days' if days else 'retention policy removed'))
+
+
+@views.cli.command("archive-submissions")
+@click.option("--batch-size", default=5000, help="Submissions per archive file")
+@click.option("--interval", type=int, default=None, help="Keep running, applying the policies every this many seconds")
+def archive_submissions(batch_size, interval):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    print(retention.run(DATABASE, batch_size, interval), 'submissions archived')
+
+
+@views.cli.command("compact-rollups")
+def compact_rollups():
+    # The app does this every ROLLUP_COMPACT_INTERVAL seconds, see rollups.py
+    print(rollups.compact(DATABASE), 'deltas folded into the chart rollups')
+
+
+@views.cli.command("transcode-images")
+@click.option("--processes", type=int, default=None, help="Worker processes, one per CPU by default")
+@click.option("--once", is_flag=True, help="Exit once nothing is left to transcode")
+def transcode_images(processes, once):
+    # Long-running worker making the compact copies get_image serves, see transcoder.py
+    import transcoder
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    print(transcoder.Transcoder(DATABASE, processes).run(once))
+
+
+@views.route("/<form_id>/export")
 @login_required
 @check_access
 def export(form_id):
     session['last_visited'] = f'/{form_id}/export'
     return render_template("export.html", form_id=form_id, photo_uri=session['photo_uri'], site_url=URL)
 
-@app.route("/<form_id>/exportfile")
+@views.route("/<form_id>/exportfile")
 @login_required
 @check_access
 def exportfile(form_id):
 
+    import pandas as pd
+
     period = request.args.get('period')
-    qns, res = DATABASE.get_all_responses(form_id, session['user_id'], period)
+    # Images go in as links, their bytes are never loaded
+    qns, res = DATABASE.get_all_responses(form_id, session['user_id'], period, images=False)
 
     form_name = DATABASE.get_form_name(form_id)
 
@@ -184,19 +488,18 @@ def exportfile(form_id):
     file = open(fname, 'w', newline='')
 
     writer = csv.writer(file)
-    writer.writerow(qns)
+    writer.writerow([q.text for q in qns])
 
     for row in res:
         answers = []
-        for answer in row['answers']:
-            if not isinstance(answer, str) and 'value' in answer:
-                if answer['type'] == 'text':
-                    answers.append(answer['value'])
-                elif answer['type'] == 'image':
-                    url = URL
-                    answers.append(f"{url}{form_id}/image/{answer['answer_id']}")
-            else:
+        for answer in row.answers:
+            if answer is None:
                 answers.append('')
+            elif isinstance(answer, records.Image):
+                url = URL
+                answers.append(f"{url}{form_id}/image/{answer.answer_id}")
+            else:
+                answers.append(answer)
         writer.writerow(answers)
 
     file.close()
@@ -217,7 +520,41 @@ def exportfile(form_id):
 
     return send_file(file_out)
 
-@app.route("/<form_id>/access", methods=["GET", "POST"])
+@views.route("/<form_id>/responses.json")
+@login_required
+@check_access
+def responses_json(form_id):
+    # {"questions": [...], "responses": [[submission_id, [values]], ...]}, see
+    # records.py. Images are [answer_id, null], fetched from /<form_id>/image/<answer_id>
+    period = request.args.get('period', 'at')
+    if period not in PERIODS:
+        return jsonify({'error': f'period must be one of {", ".join(PERIODS)}'}), 400
+
+    try:
+        qns, res = DATABASE.get_all_responses(form_id, session['user_id'], period, images=False)
+    except AppError as e:
+        return jsonify({'error': e.message}), 400
+
+    return Response(records.ENCODER.encode({'questions': qns, 'responses': res}), mimetype='application/json')
+
+@views.route("/<form_id>/images.zip")
+@login_required
+@check_access
+def images_zip(form_id):
+    # Built while it downloads, nothing is kept in memory or written to disk
+    period = request.args.get('period', 'at')
+    if period not in PERIODS:
+        return error('Unknown period')
+
+    try:
+        entries = DATABASE.iter_images(form_id, session['user_id'], period, original=request.args.get('original') == '1')
+    except AppError as e:
+        return e.render()
+
+    return Response(stream_with_context(archives.stream_zip(entries)), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="form-{form_id}-images.zip"'})
+
+@views.route("/<form_id>/access", methods=["GET", "POST"])
 @login_required
 @check_access
 def access(form_id):
@@ -234,7 +571,7 @@ def access(form_id):
     return redirect(f'/{form_id}/dashboard', site_url=URL)
 
 
-@app.route("/<form_id>/settings")
+@views.route("/<form_id>/settings")
 @login_required
 @check_access
 def settings(form_id):
@@ -242,16 +579,15 @@ def settings(form_id):
     return render_template('settings.html', form_id=form_id, photo_uri=session['photo_uri'], form_name=form_name, site_url=URL)
 
 
-@app.route("/<form_id>/duplicate")
+@views.route("/<form_id>/duplicate")
 @login_required
 @check_access
 def duplicate(form_id):
     form_name = request.args.get('form_name')
-    print(form_name, "form name")
     new_form_id = DATABASE.duplicate(form_id, form_name, session['user_id'])
     return redirect(f"/{new_form_id}/dashboard")
 
-@app.route("/<form_id>/edit", methods=["GET", "POST"])
+@views.route("/<form_id>/edit", methods=["GET", "POST"])
 @login_required
 @check_access
 def edit(form_id):
@@ -267,13 +603,13 @@ def edit(form_id):
     return redirect(f"/{form_id}/dashboard")
 
 
-@app.route("/logout")
+@views.route("/logout")
 def logout():
     session.clear()
     return redirect("/")
 
 
-@app.route("/<form_id>/form", methods=['POST', 'GET'])
+@views.route("/<form_id>/form", methods=['POST', 'GET'])
 @login_required
 def answer_form(form_id):
     
@@ -288,13 +624,17 @@ def answer_form(form_id):
             return error('Form Does Not Exist or No Access')
         return render_template('form.html', questions=questions, form_name=form_name, form_id=form_id, photo_uri=session['photo_uri'])
     
-    print('FILES:', request.files['26'])
-    DATABASE.submit_form(int(form_id), session['user_id'], request.form, request.files)
+    try:
+        if not DATABASE.submit_form(int(form_id), session['user_id'], request.form, request.files):
+            return error('Submission Failed')
+    except AppError as e:
+        return e.render(), e.code or 400
+    session['write_lsn'] = DATABASE.write_position()
 
     return render_template('form_submitted.html', photo_uri=session['photo_uri'])
 
 
-@app.route("/getform")
+@views.route("/getform")
 @login_required
 def get_form():
     form_id = request.args.get("form_id")
@@ -302,4 +642,4 @@ def get_form():
 
 # Run The Application
 if __name__ == "__main__":
-    app.run(host="0.0.0.0")
\ No newline at end of file
+    create_app().run(host="0.0.0.0")
\ No newline at end of file
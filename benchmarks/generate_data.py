@@ -0,0 +1,229 @@
+"""Synthetic forms and submissions for load tests, loaded with COPY.
+
+Creates --forms forms owned by --email with the --questions mix, then
+--submissions submissions per form spread over the last --days days.
+Everything the app keeps up to date on submit (home page counters, chart
+rollups, map index) is filled in too. Images are a tiny PNG stored inline.
+
+    python benchmarks/generate_data.py --forms 1 --submissions 1000000 \\
+        --questions text:3,numeric:2,date:1,coordinates:1,dropdown:1,image:1
+
+Ids are reserved from the sequences up front, so run it against a database
+nobody else is writing to. Sign in as --email with /test-login (TEST_LOGIN=1).
+"""
+import argparse
+import datetime
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import geo
+import partitions
+import rollups
+from database_helper import Database
+
+# Same 1x1 PNG as storage_layouts.py, as a COPY text-format bytea
+PNG = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082')
+PNG_COPY = '\\\\x' + PNG.hex()
+
+TYPES = {'text': 1, 'numeric': 2, 'date': 3, 'coordinates': 4, 'dropdown': 5, 'image': 6}
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+
+
+def parse_mix(text):
+    # 'text:3,image:1' -> ['text', 'text', 'text', 'image']
+    mix = []
+    for part in text.split(','):
+        kind, _, count = part.partition(':')
+        if kind not in TYPES:
+            raise SystemExit(f'unknown question type {kind}, expected one of {", ".join(TYPES)}')
+        mix += [kind] * int(count or 1)
+    return mix
+
+
+def reserve(cursor, table, column, n) -> int:
+    # First of n consecutive ids taken from the table's sequence
+    cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, column))
+    sequence = cursor.fetchone()[0]
+    cursor.execute("SELECT setval(%s, nextval(%s) + %s - 1)", (sequence, sequence, n))
+    return cursor.fetchone()[0] - n + 1
+
+
+def copy(cursor, table, columns, rows) -> None:
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(r'\N' if v is None else str(v) for v in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def create_user(db, email) -> int:
+    # The account /test-login signs in as
+    google_id = f'test:{email}'
+    if db.get_user_id(google_id) is None:
+        db.sign_up_user(google_id, '', email, email)
+    return db.get_user_id(google_id)
+
+
+def create_form(cursor, name, user_id, mix, options) -> tuple:
+    cursor.execute("INSERT INTO forms (form_name) VALUES (%s) RETURNING form_id", (name,))
+    form_id = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO forms_access (form_id, user_id, user_role_id) VALUES (%s, %s, 1)", (form_id, user_id))
+
+    questions = []
+    for position, kind in enumerate(mix, 1):
+        cursor.execute("INSERT INTO questions (form_id, question_text, question_type_id, position) "
+                       "VALUES (%s, %s, %s, %s) RETURNING question_id",
+                       (form_id, f'{kind.capitalize()} {position}', TYPES[kind], position))
+        question_id = cursor.fetchone()[0]
+        option_ids = []
+        if kind == 'dropdown':
+            for n in range(1, options + 1):
+                cursor.execute("INSERT INTO dropdown_question_options (question_id, dropdown_question_option, position) "
+                               "VALUES (%s, %s, %s) RETURNING dropdown_question_option_id", (question_id, f'Option {n}', n))
+                option_ids.append(cursor.fetchone()[0])
+        questions.append((question_id, kind, option_ids))
+    return form_id, questions
+
+
+def answer(kind, option_ids):
+    # Typed value for one answer row, None for image (stored as PNG_COPY)
+    if kind == 'text':
+        return ' '.join(random.choices(WORDS, k=random.randint(1, 6)))
+    if kind == 'numeric':
+        return random.randint(0, 10000)
+    if kind == 'date':
+        return datetime.date(2020, 1, 1) + datetime.timedelta(days=random.randint(0, 2000))
+    if kind == 'coordinates':
+        return f'{random.uniform(-60, 60):.5f}, {random.uniform(-170, 170):.5f}'
+    if kind == 'dropdown':
+        return random.choice(option_ids)
+    return None
+
+
+def load_batch(cursor, form_id, user_id, questions, n, days) -> None:
+    first_submission = reserve(cursor, 'form_submissions', 'form_submission_id', n)
+    first_answer = reserve(cursor, 'form_answers', 'form_answer_id', n * len(questions))
+    now = datetime.datetime.now()
+
+    submissions, answers = [], []
+    typed = {'text_answers': [], 'numeric_answers': [], 'date_answers': [], 'dropdown_answers': [], 'image_answers': []}
+    points = []
+    answer_id = first_answer
+
+    for submission_id in range(first_submission, first_submission + n):
+        submitted_at = now - datetime.timedelta(seconds=random.randint(0, days * 86400))
+        submissions.append((submission_id, form_id, user_id, submitted_at))
+
+        for question_id, kind, option_ids in questions:
+            answers.append((answer_id, question_id, submission_id, submitted_at))
+            value = answer(kind, option_ids)
+            if kind in ('text', 'coordinates'):
+                typed['text_answers'].append((answer_id, value, submitted_at))
+            elif kind == 'image':
+                typed['image_answers'].append((answer_id, PNG_COPY, 'image/png', len(PNG), submitted_at))
+            else:
+                typed[f'{kind}_answers'].append((answer_id, value, submitted_at))
+
+            if kind == 'coordinates':
+                lat, lon = geo.parse_coordinates(value)
+                points.append((answer_id, form_id, submission_id, lat, lon, geo.encode(lat, lon)))
+            answer_id += 1
+
+    copy(cursor, 'form_submissions', ('form_submission_id', 'form_id', 'user_id', 'submitted_at'), submissions)
+    copy(cursor, 'form_answers', ('form_answer_id', 'question_id', 'form_submission_id', 'submitted_at'), answers)
+    copy(cursor, 'text_answers', ('answer_id', 'answer', 'submitted_at'), typed['text_answers'])
+    copy(cursor, 'numeric_answers', ('answer_id', 'answer', 'submitted_at'), typed['numeric_answers'])
+    copy(cursor, 'date_answers', ('answer_id', 'answer', 'submitted_at'), typed['date_answers'])
+    copy(cursor, 'dropdown_answers', ('answer_id', 'dropdown_question_option_id', 'submitted_at'), typed['dropdown_answers'])
+    copy(cursor, 'image_answers', ('answer_id', 'answer', 'mime_type', 'size', 'submitted_at'), typed['image_answers'])
+    copy(cursor, 'coordinate_answers', ('answer_id', 'form_id', 'form_submission_id', 'lat', 'lon', 'geohash'), points)
+
+
+def summarize(cursor, form_id) -> None:
+    # What submit_form would have maintained row by row
+    cursor.execute("INSERT INTO form_counters (form_id, submission_count, last_submitted_at) "
+                   "SELECT form_id, count(*), max(submitted_at) FROM form_submissions WHERE form_id=%s GROUP BY form_id",
+                   (form_id,))
+    cursor.execute("INSERT INTO form_hourly_counts (form_id, hour, count) "
+                   "SELECT form_id, date_trunc('hour', submitted_at), count(*) FROM form_submissions "
+                   "WHERE form_id=%s AND submitted_at >= date_trunc('hour', LOCALTIMESTAMP - INTERVAL '24 hours') "
+                   "GROUP BY 1, 2", (form_id,))
+    cursor.execute("INSERT INTO submission_rollups (form_id, bucket, option_id, period_start, count) "
+                   "SELECT form_id, b.bucket, option_id, date_trunc(b.bucket, submitted_at), count(*) "
+                   "FROM (SELECT s.form_id, s.submitted_at, 0 AS option_id FROM form_submissions s WHERE s.form_id=%s "
+                   "UNION ALL SELECT s.form_id, s.submitted_at, dd.dropdown_question_option_id FROM dropdown_answers dd "
+                   "JOIN form_answers fa ON fa.form_answer_id = dd.answer_id "
+                   "JOIN form_submissions s ON s.form_submission_id = fa.form_submission_id WHERE s.form_id=%s) counted, "
+                   "(VALUES ('hour'), ('day'), ('week')) b (bucket) "
+                   "WHERE b.bucket <> 'hour' OR submitted_at >= date_trunc('hour', LOCALTIMESTAMP - make_interval(days => %s)) "
+                   "GROUP BY 1, 2, 3, 4", (form_id, form_id, rollups.HOURLY_DAYS))
+    cursor.execute("INSERT INTO coordinate_clusters (form_id, precision, cell, count, sum_lat, sum_lon) "
+                   "SELECT form_id, p, left(geohash, p), count(*), sum(lat), sum(lon) "
+                   "FROM coordinate_answers, generate_series(1, %s) p WHERE form_id=%s GROUP BY 1, 2, 3",
+                   (geo.ROLLUP_PRECISION, form_id))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', default='loadtest@example.com', help='owner of the generated forms')
+    parser.add_argument('--forms', type=int, default=1)
+    parser.add_argument('--submissions', type=int, default=10000, help='per form')
+    parser.add_argument('--questions', default='text:3,numeric:2,date:1,coordinates:1,dropdown:1,image:1')
+    parser.add_argument('--options', type=int, default=5, help='per dropdown question')
+    parser.add_argument('--days', type=int, default=365, help='submissions are spread over this many past days')
+    parser.add_argument('--batch-size', type=int, default=20000, help='submissions per COPY and commit')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = parse_mix(args.questions)
+
+    db = Database(replicas='')
+    connection = db.connection
+    cursor = connection.cursor()
+
+    if db.partitioned:
+        # Every month the submissions fall in needs its partition
+        month = partitions.month_start(datetime.date.today() - datetime.timedelta(days=args.days))
+        while month <= datetime.date.today():
+            partitions._create_month(cursor, month)
+            month = partitions.add_months(month, 1)
+
+    connection.commit()
+    user_id = create_user(db, args.email)
+
+    for n in range(args.forms):
+        start = time.perf_counter()
+        form_id, questions = create_form(cursor, f'Load test {n + 1} ({len(mix)} questions)', user_id, mix, args.options)
+        connection.commit()
+
+        left = args.submissions
+        while left > 0:
+            batch = min(left, args.batch_size)
+            load_batch(cursor, form_id, user_id, questions, batch, args.days)
+            connection.commit()
+            left -= batch
+            print(f'form {form_id}: {args.submissions - left}/{args.submissions}', end='\r', flush=True)
+
+        summarize(cursor, form_id)
+        connection.commit()
+        elapsed = time.perf_counter() - start
+        print(f'form {form_id}: {args.submissions} submissions in {elapsed:.1f}s '
+              f'({args.submissions / elapsed:.0f}/s), user {user_id} ({args.email})')
+
+    cursor.execute("ANALYZE")
+    connection.commit()
+    cursor.close()
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Load driver for a running app started with TEST_LOGIN=1.
+
+Each of --concurrency client threads signs in through /test-login as
+--email, then for --duration seconds picks a route by the --mix weights
+(dashboard, entry, image, submit, export) against --form-id. Entry and
+image ids are sampled from the database up front. Prints the request count,
+errors, throughput and p50/p95/p99 latency per route.
+
+    TEST_LOGIN=1 flask run --port 5000
+    python benchmarks/generate_data.py --submissions 100000
+    python benchmarks/load.py --form-id 2 --concurrency 16 --duration 30
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database_helper import Database
+from storage_layouts import sample
+
+ROUTES = ('dashboard', 'entry', 'image', 'submit', 'export')
+
+
+def parse_mix(text):
+    # 'dashboard:4,submit:1' -> {'dashboard': 4, 'submit': 1}
+    mix = {}
+    for part in text.split(','):
+        route, _, weight = part.partition(':')
+        if route not in ROUTES:
+            raise SystemExit(f'unknown route {route}, expected one of {", ".join(ROUTES)}')
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def targets(form_id, email, limit=1000):
+    # Submission and image answer ids to request, and the questions to answer
+    db = Database(replicas='')
+    user_id = db.get_user_id(f'test:{email}')
+    if user_id is None:
+        raise SystemExit(f'{email} has no account yet, run generate_data.py or sign in through /test-login once')
+
+    cursor = db.connection.cursor()
+    cursor.execute("SELECT form_submission_id FROM form_submissions WHERE form_id=%s "
+                   "ORDER BY form_submission_id DESC LIMIT %s", (form_id, limit))
+    submissions = [r[0] for r in cursor.fetchall()]
+    cursor.execute("SELECT i.answer_id FROM image_answers i JOIN form_answers fa ON fa.form_answer_id = i.answer_id "
+                   "JOIN form_submissions s ON s.form_submission_id = fa.form_submission_id "
+                   "WHERE s.form_id=%s ORDER BY i.answer_id DESC LIMIT %s", (form_id, limit))
+    images = [r[0] for r in cursor.fetchall()]
+    cursor.close()
+
+    questions = db.get_questions(form_id, user_id)
+    db.close()
+    return submissions, images, questions
+
+
+def request(http, base, route, form_id, submissions, images, questions):
+    if route == 'dashboard':
+        return http.get(f'{base}/{form_id}/dashboard')
+    if route == 'entry' and submissions:
+        return http.get(f'{base}/{form_id}/response/{random.choice(submissions)}')
+    if route == 'image' and images:
+        return http.get(f'{base}/{form_id}/image/{random.choice(images)}')
+    if route == 'submit':
+        answers, files = sample(questions)
+        return http.post(f'{base}/{form_id}/form', data={str(k): v for k, v in answers.items()},
+                         files={str(k): ('image.png', f, 'image/png') for k, f in files.items()})
+    if route == 'export':
+        return http.get(f'{base}/{form_id}/exportfile', params={'period': 'pw'})
+    return None
+
+
+def client(base, email, form_id, mix, targets, duration, results, lock):
+    http = requests.Session()
+    http.get(f'{base}/test-login', params={'email': email}, allow_redirects=False)
+    routes, weights = list(mix), list(mix.values())
+    timings = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        route = random.choices(routes, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = request(http, base, route, form_id, *targets)
+            if response is None:
+                continue
+            ok = response.status_code in (200, 304)
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        if ok:
+            timings[route].append(elapsed)
+        else:
+            errors[route] += 1
+
+    with lock:
+        for route in routes:
+            results[route][0].extend(timings[route])
+            results[route][1] += errors[route]
+
+
+def percentiles(times):
+    if len(times) < 2:
+        return [times[0] if times else 0] * 3
+    cuts = statistics.quantiles(times, n=100)
+    return cuts[49], cuts[94], cuts[98]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--form-id', type=int, required=True)
+    parser.add_argument('--email', default='loadtest@example.com')
+    parser.add_argument('--mix', default='dashboard:2,entry:4,image:2,submit:2,export:1')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--duration', type=float, default=30)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    sampled = targets(args.form_id, args.email)
+    results = {route: [[], 0] for route in mix}
+    lock = threading.Lock()
+
+    threads = [threading.Thread(target=client, args=(args.url.rstrip('/'), args.email, args.form_id, mix, sampled,
+                                                     args.duration, results, lock))
+               for _ in range(args.concurrency)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    print(f'{"route":>10} {"requests":>9} {"errors":>7} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    total = failed = 0
+    for route, (times, errors) in results.items():
+        p50, p95, p99 = percentiles(times)
+        total += len(times)
+        failed += errors
+        print(f'{route:>10} {len(times):>9} {errors:>7} {len(times) / elapsed:>8.1f} '
+              f'{p50 * 1000:>8.1f} {p95 * 1000:>8.1f} {p99 * 1000:>8.1f}')
+    everything = [t for times, _ in results.values() for t in times]
+    p50, p95, p99 = percentiles(everything)
+    print(f'{"all":>10} {total:>9} {failed:>7} {total / elapsed:>8.1f} '
+          f'{p50 * 1000:>8.1f} {p95 * 1000:>8.1f} {p99 * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
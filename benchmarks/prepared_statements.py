@@ -0,0 +1,112 @@
+"""Per-call latency of the hot statements, parsed and planned on every call
+versus PREPAREd once per connection, and of writing a submission's answers
+one round trip per statement versus pipelined.
+
+    python benchmarks/prepared_statements.py --form-id 1 --user-id 1 --submission-id 10
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from psycopg2.extras import RealDictCursor
+
+from database_helper import Database, STATEMENTS
+
+
+def plain(sql):
+    # $n placeholders as named psycopg2 parameters
+    return re.sub(r'\$(\d+)', r'%(p\1)s', sql)
+
+
+def per_call(fn, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e6
+
+
+def compare(cursor, registry, name, params, iterations):
+    named = {f'p{i + 1}': p for i, p in enumerate(params)}
+
+    def unprepared():
+        cursor.execute(plain(STATEMENTS[name]), named)
+        cursor.fetchall()
+
+    def prepared():
+        registry.execute(cursor, name, params)
+        cursor.fetchall()
+
+    return per_call(unprepared, iterations), per_call(prepared, iterations)
+
+
+def per_question(cursor, questions, submission_id):
+    # The lookups _read_answers used to make: form_answers, then the typed table
+    tables = {'text': 'text_answers', 'coordinates': 'text_answers', 'numeric': 'numeric_answers',
+              'date': 'date_answers', 'dropdown': 'dropdown_answers', 'image': 'image_answers'}
+    for q in questions:
+        cursor.execute("SELECT * FROM form_answers WHERE question_id=%s AND form_submission_id=%s",
+                       (q['question_id'], submission_id))
+        a = cursor.fetchone()
+        if a is not None and q['type'] in tables:
+            cursor.execute(f"SELECT * FROM {tables[q['type']]} WHERE answer_id=%s", (a['form_answer_id'],))
+            cursor.fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--form-id', type=int, required=True)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--submission-id', type=int, required=True)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    db = Database(replicas='')
+    connection = db.connection
+    cursor = connection.cursor(cursor_factory=RealDictCursor)
+    registry = db.statements
+    questions = [db.get_question(q['question_id']) for q in db.get_questions(args.form_id, args.user_id)]
+
+    print(f'{"statement":>28} {"plain us":>10} {"prepared us":>12} {"saved":>7}')
+    for name, params in [('user_role', (args.user_id, args.form_id)),
+                         ('question', (questions[0]['question_id'],)),
+                         ('submission_answers', (args.submission_id,))]:
+        before, after = compare(cursor, registry, name, params, args.iterations)
+        print(f'{name:>28} {before:>10.1f} {after:>12.1f} {1 - after / before:>7.0%}')
+
+    before = per_call(lambda: per_question(cursor, questions, args.submission_id), args.iterations // 10)
+    after = per_call(lambda: db._read_answers(cursor, questions, args.submission_id), args.iterations // 10)
+    print(f'{"answers of a submission":>28} {before:>10.1f} {after:>12.1f} {1 - after / before:>7.0%}')
+
+    # Ten text answers for the submission, rolled back after each run
+    cursor.execute("SELECT submitted_at FROM form_submissions WHERE form_submission_id=%s", (args.submission_id,))
+    submitted_at = cursor.fetchone()['submitted_at']
+    text = next(q for q in questions if q['type'] == 'text')
+    batch = [('insert_text_answer', (text['question_id'], args.submission_id, submitted_at, f'answer {i}')) for i in range(10)]
+
+    def one_by_one():
+        for name, params in batch:
+            registry.execute(cursor, name, params)
+        connection.rollback()
+
+    def pipelined():
+        registry.pipeline(cursor, batch)
+        connection.rollback()
+
+    before = per_call(one_by_one, args.iterations // 10)
+    after = per_call(pipelined, args.iterations // 10)
+    print(f'{"10 answer inserts":>28} {before:>10.1f} {after:>12.1f} {1 - after / before:>7.0%}')
+
+    connection.rollback()
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
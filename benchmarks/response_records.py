@@ -0,0 +1,90 @@
+"""Dashboard rows as records.Response against the dict per row / dict per
+cell they replaced, for the same responses.
+
+    python benchmarks/response_records.py --form-id 2 --user-id 3 --runs 10
+
+Reads the form once (images as links only, like /responses.json), builds both
+shapes from the same values and prints the memory each one holds
+(tracemalloc, values shared by both are not counted) and the median time to
+encode it to JSON: json.dumps as /stream did before against records.ENCODER.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database_helper import Database
+from records import ENCODER, Image, Response
+
+
+def legacy_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, Image):
+        return {'type': 'image', 'answer_id': value.answer_id}
+    return {'type': 'text', 'value': value}
+
+
+def build_legacy(rows):
+    return [{'answers': [legacy_cell(v) for v in answers], 'submission_id': sub_id} for sub_id, answers in rows]
+
+
+def build_records(rows):
+    return [Response(sub_id, [Image(v.answer_id) if isinstance(v, Image) else v for v in answers])
+            for sub_id, answers in rows]
+
+
+def held(build, rows):
+    # Bytes still allocated once the structure is built
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build(rows)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return built, size
+
+
+def timed(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--form-id', type=int, required=True)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    db = Database(replicas='')
+    questions, responses = db.get_all_responses(args.form_id, args.user_id, images=False)
+    db.close()
+    rows = [(res.submission_id, res.answers) for res in responses]
+    print(f'{len(rows)} responses, {len(questions)} questions')
+
+    legacy, legacy_bytes = held(build_legacy, rows)
+    compact, compact_bytes = held(build_records, rows)
+
+    legacy_ms = timed(lambda: json.dumps({'questions': [q.text for q in questions], 'responses': legacy}, default=str),
+                      args.runs)
+    compact_ms = timed(lambda: ENCODER.encode({'questions': questions, 'responses': compact}), args.runs)
+
+    print(f'{"shape":>8} {"held KiB":>9} {"encode ms":>10} {"JSON KiB":>9}')
+    print(f'{"dicts":>8} {legacy_bytes / 1024:>9.0f} {legacy_ms:>10.2f} '
+          f'{len(json.dumps(legacy, default=str)) / 1024:>9.0f}')
+    print(f'{"records":>8} {compact_bytes / 1024:>9.0f} {compact_ms:>10.2f} '
+          f'{len(ENCODER.encode(compact)) / 1024:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Dashboard chart data: the rollups behind /<form_id>/series against
+counting form_submissions for the same buckets.
+
+    python benchmarks/series.py --form-id 2 --user-id 3 --runs 20
+
+Prints the median time per bucket for both, and how many rows each one
+reads (EXPLAIN ANALYZE).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database_helper import Database, SERIES_SPANS
+
+SCAN = ("SELECT date_trunc(%(bucket)s, submitted_at), count(*) FROM form_submissions "
+        "WHERE form_id=%(form_id)s AND submitted_at >= date_trunc(%(bucket)s, LOCALTIMESTAMP - %(span)s) GROUP BY 1")
+ROLLUP = ("SELECT period_start, count FROM submission_rollups WHERE form_id=%(form_id)s AND bucket=%(bucket)s "
+          "AND option_id = 0 AND period_start >= date_trunc(%(bucket)s, LOCALTIMESTAMP - %(span)s)")
+
+
+def timed(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def rows_read(cursor, query, params) -> int:
+    # Rows coming out of the scan nodes
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+    plan = cursor.fetchone()[0][0]['Plan']
+
+    def walk(node):
+        if 'Scan' in node['Node Type']:
+            return node['Actual Rows'] * node.get('Actual Loops', 1)
+        return sum(walk(child) for child in node.get('Plans', []))
+    return walk(plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--form-id', type=int, required=True)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    db = Database(replicas='')
+    cursor = db.connection.cursor()
+
+    print(f'{"bucket":>6} {"series ms":>10} {"scan ms":>8} {"rollup rows":>12} {"scanned rows":>13}')
+    for bucket, span in SERIES_SPANS.items():
+        params = {'form_id': args.form_id, 'bucket': bucket, 'span': span}
+
+        def scan():
+            cursor.execute(SCAN, params)
+            cursor.fetchall()
+
+        series_ms = timed(lambda: db.get_submission_series(args.form_id, args.user_id, bucket), args.runs)
+        scan_ms = timed(scan, args.runs)
+        print(f'{bucket:>6} {series_ms:>10.2f} {scan_ms:>8.2f} {rows_read(cursor, ROLLUP, params):>12} '
+              f'{rows_read(cursor, SCAN, params):>13}')
+
+    db.connection.rollback()
+    cursor.close()
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Worker cold start: time to import the app and run create_app(), then to
+serve the first request and the first request that needs the database.
+
+Each run is a fresh interpreter, like a newly forked gunicorn worker. Also
+lists which of the heavy optional libraries were loaded by boot.
+
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('pandas', 'PIL', 'google_auth_oauthlib', 'google.auth.jwt')
+
+# Runs in the child interpreter
+WORKER = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+booted = time.perf_counter()
+loaded = [m for m in %r if m in sys.modules]
+
+client = app.test_client()
+client.get('/logout')
+first = time.perf_counter()
+client.get('/test-login', query_string={'email': 'loadtest@example.com'})
+database = time.perf_counter()
+print(json.dumps({'boot': booted - start, 'first': first - booted, 'database': database - first, 'loaded': loaded}))
+''' % (HEAVY,)
+
+
+def run_once():
+    # TEST_LOGIN gives a route that queries the database without Google
+    env = dict(os.environ, TEST_LOGIN='1')
+    out = subprocess.run([sys.executable, '-c', WORKER], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    print(f'{"":>24} {"median ms":>10} {"max ms":>8}')
+    for key, label in (('boot', 'import + create_app'), ('first', 'first request'), ('database', 'first database request')):
+        times = [r[key] * 1000 for r in runs]
+        print(f'{label:>24} {statistics.median(times):>10.1f} {max(times):>8.1f}')
+    print('heavy modules loaded at boot:', ', '.join(runs[-1]['loaded']) or 'none')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compares the eav and document answer layouts on one form.
+
+Duplicates --form-id twice (one copy per layout), submits --submissions
+generated responses to each copy as --user-id, then times submit_form,
+get_all_responses and get_response. The copies are left in place.
+
+    python benchmarks/storage_layouts.py --form-id 1 --user-id 1 --submissions 500
+"""
+import argparse
+import datetime
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database_helper import Database
+
+# Smallest valid PNG, for image questions
+PNG = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082')
+
+
+def sample(questions):
+    answers, files = {}, {}
+    for q in questions:
+        if q['type'] == 'image':
+            files[q['question_id']] = io.BytesIO(PNG)
+        elif q['type'] == 'numeric':
+            answers[q['question_id']] = str(random.randint(0, 1000))
+        elif q['type'] == 'date':
+            answers[q['question_id']] = str(datetime.date(2024, 1, 1) + datetime.timedelta(days=random.randint(0, 365)))
+        elif q['type'] == 'coordinates':
+            answers[q['question_id']] = f'{random.uniform(-60, 60):.5f}, {random.uniform(-170, 170):.5f}'
+        elif q['type'] == 'dropdown':
+            answers[q['question_id']] = random.choice(q['options'])['option_id'] if q['options'] else ''
+        else:
+            answers[q['question_id']] = 'answer %d' % random.randint(0, 10 ** 6)
+    return answers, files
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def run(db, form_id, user_id, submissions, reads):
+    questions = db.get_questions(form_id, user_id)
+    submit = [timed(db.submit_form, form_id, user_id, *sample(questions)) for _ in range(submissions)]
+
+    _, responses = db.get_all_responses(form_id, user_id)
+    ids = [r.submission_id for r in responses]
+    dashboard = [timed(db.get_all_responses, form_id, user_id) for _ in range(reads)]
+    entry = [timed(db.get_response, form_id, user_id, random.choice(ids)) for _ in range(reads * 10)]
+    return submit, dashboard, entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--form-id', type=int, required=True)
+    parser.add_argument('--user-id', type=int, required=True, help='creator of the form')
+    parser.add_argument('--submissions', type=int, default=500)
+    parser.add_argument('--reads', type=int, default=10)
+    args = parser.parse_args()
+
+    db = Database()
+    stamp = int(time.time())
+
+    print(f'{"layout":>9} {"submit ms":>10} {"dashboard ms":>13} {"entry ms":>9}')
+    for mode in ('eav', 'document'):
+        form_id = db.duplicate(args.form_id, f'{mode} storage benchmark {stamp}', args.user_id)
+        cursor = db.connection.cursor()
+        cursor.execute("UPDATE forms SET storage_mode=%s WHERE form_id=%s", (mode, form_id))
+        db.connection.commit()
+        cursor.close()
+
+        submit, dashboard, entry = run(db, form_id, args.user_id, args.submissions, args.reads)
+        print(f'{mode:>9} {statistics.median(submit) * 1000:>10.2f} {statistics.median(dashboard) * 1000:>13.1f} '
+              f'{statistics.median(entry) * 1000:>9.2f}')
+
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
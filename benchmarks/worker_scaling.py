@@ -0,0 +1,115 @@
+"""Throughput of the app under gunicorn as the worker count grows.
+
+Starts `gunicorn -c gunicorn.conf.py wsgi:app` once per worker count with the
+shared Postgres session store, logs in by writing a session row for
+--user-id straight into flask_sessions, then hammers --path from several
+client processes for --duration seconds.
+
+    python benchmarks/worker_scaling.py --user-id 1 --workers 1,2,4,8
+"""
+import argparse
+import multiprocessing
+import os
+import secrets
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import msgspec
+import psycopg2
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database_helper import Database
+
+
+def create_session(user_id) -> str:
+    sid = secrets.token_urlsafe(32)
+    data = msgspec.msgpack.encode({'user_id': user_id, 'photo_uri': '', '_permanent': False})
+
+    db = Database()
+    cursor = db.connection.cursor()
+    cursor.execute("INSERT INTO flask_sessions (session_id, data, expiry) VALUES (%s, %s, %s)",
+                   ('session:' + sid, psycopg2.Binary(data), datetime.utcnow() + timedelta(hours=1)))
+    db.connection.commit()
+    db.close()
+    return sid
+
+
+def client(args):
+    url, sid, duration = args
+    http = requests.Session()
+    http.cookies.set('session', sid)
+    done = errors = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        try:
+            if http.get(url, allow_redirects=False, timeout=30).status_code == 200:
+                done += 1
+            else:
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+    return done, errors
+
+
+def wait_until_up(url, timeout=30) -> None:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'server at {url} did not start')
+
+
+def run(workers, threads, port, path, sid, concurrency, duration):
+    env = dict(os.environ, SESSION_BACKEND='postgres', WEB_WORKERS=str(workers), WEB_THREADS=str(threads),
+               BIND=f'127.0.0.1:{port}')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        wait_until_up(base + '/logout')
+        # Let every worker finish booting before measuring
+        time.sleep(2)
+
+        with multiprocessing.Pool(concurrency) as pool:
+            results = pool.map(client, [(base + path, sid, duration)] * concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+    done = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    return done / duration, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=32, help='client processes')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--port', type=int, default=8123)
+    args = parser.parse_args()
+
+    sid = create_session(args.user_id)
+    baseline = None
+
+    print(f'{"workers":>8} {"req/s":>10} {"errors":>8} {"speedup":>8} {"efficiency":>10}')
+    for workers in [int(w) for w in args.workers.split(',')]:
+        rps, errors = run(workers, args.threads, args.port, args.path, sid, args.concurrency, args.duration)
+        baseline = baseline or rps / workers
+        speedup = rps / baseline if baseline else 0
+        print(f'{workers:>8} {rps:>10.1f} {errors:>8} {speedup:>8.2f} {speedup / workers:>10.0%}')
+
+
+if __name__ == '__main__':
+    main()
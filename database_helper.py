@@ -1,41 +1,356 @@
 import psycopg2, os
-from psycopg2.extras import RealDictCursor
-import base64
+from psycopg2.extras import NamedTupleCursor, RealDictCursor, Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from functools import wraps
+import datetime
+import json
+import logging
+import re
+import threading
+import weakref
 from errors import AppError
+from replicas import ReplicaSet, parse_lsn
+from profiling import CountingConnection
+from records import Image, Question, Response
+import uploads
+import geo
+
+logger = logging.getLogger(__name__)
+
+FORM_UPDATES_CHANNEL = 'form_updates'
+
+# Export and dashboard time periods, by where they start
+PERIOD_STARTS = {
+    'pd': 'CURRENT_DATE',
+    'pw': "CURRENT_DATE - INTERVAL '7 days'",
+    'py': "CURRENT_DATE - INTERVAL '1 year'",
+    'at': None
+}
+# The same as filters on form_submissions
+PERIODS = {period: f'AND submitted_at >= {start}' if start else '' for period, start in PERIOD_STARTS.items()}
+
+# Column of the submission_answers statement holding each question type's value
+ANSWER_COLUMNS = {'text': 'text', 'coordinates': 'text', 'numeric': 'numeric', 'date': 'date', 'dropdown': 'option'}
+
+# Dashboard chart buckets and how far back each one goes, see rollups.py
+SERIES_SPANS = {
+    'hour': datetime.timedelta(days=7),
+    'day': datetime.timedelta(days=365),
+    'week': datetime.timedelta(weeks=104),
+}
+
+# Statements run for nearly every request or answer, prepared server-side on
+# each connection the first time it runs them. Parameters are $1, $2, ...
+STATEMENTS = {
+    'user_role': "SELECT * FROM user_role WHERE user_role_id=(SELECT user_role_id FROM forms_access WHERE user_id = $1 AND form_id = $2)",
+    'question': "SELECT * FROM questions LEFT JOIN question_types ON question_types.question_type_id = questions.question_type_id WHERE question_id=$1",
+    'storage_mode': "SELECT storage_mode FROM forms WHERE form_id=$1",
+
+    # Every answer of a submission in one round trip, instead of one
+    # form_answers lookup plus one typed select per question. Image bytes
+    # are loaded separately, for many submissions at once
+    'submission_answers': (
+        "SELECT fa.question_id, fa.form_answer_id, t.answer AS text, n.answer AS numeric, d.answer AS date, "
+        "o.dropdown_question_option AS option "
+        "FROM form_answers fa "
+        "LEFT JOIN text_answers t ON t.answer_id = fa.form_answer_id "
+        "LEFT JOIN numeric_answers n ON n.answer_id = fa.form_answer_id "
+        "LEFT JOIN date_answers d ON d.answer_id = fa.form_answer_id "
+        "LEFT JOIN dropdown_answers dd ON dd.answer_id = fa.form_answer_id "
+        "LEFT JOIN dropdown_question_options o ON o.dropdown_question_option_id = dd.dropdown_question_option_id "
+        "WHERE fa.form_submission_id = $1 ORDER BY fa.form_answer_id"),
+    # Same, pruned to the submission's month when the tables are partitioned
+    'submission_answers_in_month': (
+        "SELECT fa.question_id, fa.form_answer_id, t.answer AS text, n.answer AS numeric, d.answer AS date, "
+        "o.dropdown_question_option AS option "
+        "FROM form_answers fa "
+        "LEFT JOIN text_answers t ON t.answer_id = fa.form_answer_id AND t.submitted_at = $2 "
+        "LEFT JOIN numeric_answers n ON n.answer_id = fa.form_answer_id AND n.submitted_at = $2 "
+        "LEFT JOIN date_answers d ON d.answer_id = fa.form_answer_id AND d.submitted_at = $2 "
+        "LEFT JOIN dropdown_answers dd ON dd.answer_id = fa.form_answer_id AND dd.submitted_at = $2 "
+        "LEFT JOIN dropdown_question_options o ON o.dropdown_question_option_id = dd.dropdown_question_option_id "
+        "WHERE fa.form_submission_id = $1 AND fa.submitted_at = $2 ORDER BY fa.form_answer_id"),
+
+    # Home page counters, see migrations/006_form_counters.sql
+    'count_submission': (
+        "WITH c AS (INSERT INTO form_counters (form_id, submission_count, last_submitted_at) VALUES ($1, 1, $2) "
+        "ON CONFLICT (form_id) DO UPDATE SET submission_count = form_counters.submission_count + 1, "
+        "last_submitted_at = GREATEST(form_counters.last_submitted_at, EXCLUDED.last_submitted_at)), "
+        "old AS (DELETE FROM form_hourly_counts WHERE form_id = $1 AND hour < date_trunc('hour', $2::timestamp) - INTERVAL '1 day') "
+        "INSERT INTO form_hourly_counts (form_id, hour, count) VALUES ($1, date_trunc('hour', $2::timestamp), 1) "
+        "ON CONFLICT (form_id, hour) DO UPDATE SET count = form_hourly_counts.count + 1"),
+    'uncount_submission': (
+        "WITH c AS (UPDATE form_counters SET submission_count = GREATEST(submission_count - 1, 0), "
+        "last_submitted_at = (SELECT max(submitted_at) FROM form_submissions WHERE form_id = $1) WHERE form_id = $1) "
+        "UPDATE form_hourly_counts SET count = GREATEST(count - 1, 0) WHERE form_id = $1 AND hour = date_trunc('hour', $2::timestamp)"),
+    # Dashboard chart, see rollups.py. $3: dropdown option ids, 0 for the submission itself
+    'rollup_submission': (
+        "INSERT INTO submission_rollup_deltas (form_id, hour, option_id, delta) "
+        "SELECT $1, date_trunc('hour', $2::timestamp), unnest($3::integer[]), $4"),
+
+    # One statement per answer, form_answers row and typed row together
+    'insert_answer': "INSERT INTO form_answers (question_id, form_submission_id, submitted_at) VALUES ($1, $2, $3)",
+    'insert_text_answer': (
+        "WITH a AS (INSERT INTO form_answers (question_id, form_submission_id, submitted_at) VALUES ($1, $2, $3) RETURNING form_answer_id) "
+        "INSERT INTO text_answers (answer_id, answer, submitted_at) VALUES ((SELECT form_answer_id FROM a), $4, $3)"),
+    'insert_numeric_answer': (
+        "WITH a AS (INSERT INTO form_answers (question_id, form_submission_id, submitted_at) VALUES ($1, $2, $3) RETURNING form_answer_id) "
+        "INSERT INTO numeric_answers (answer_id, answer, submitted_at) VALUES ((SELECT form_answer_id FROM a), $4, $3)"),
+    'insert_date_answer': (
+        "WITH a AS (INSERT INTO form_answers (question_id, form_submission_id, submitted_at) VALUES ($1, $2, $3) RETURNING form_answer_id) "
+        "INSERT INTO date_answers (answer_id, answer, submitted_at) VALUES ((SELECT form_answer_id FROM a), $4, $3)"),
+    'insert_dropdown_answer': (
+        "WITH a AS (INSERT INTO form_answers (question_id, form_submission_id, submitted_at) VALUES ($1, $2, $3) RETURNING form_answer_id) "
+        "INSERT INTO dropdown_answers (answer_id, dropdown_question_option_id, submitted_at) VALUES ((SELECT form_answer_id FROM a), $4, $3)"),
+}
+
+class StatementRegistry:
+    """Named statements, PREPAREd on a connection the first time they run on it.
+    Prepared statements live as long as the connection, rollbacks included."""
+
+    def __init__(self, statements) -> None:
+        self.statements = statements
+        self.prepared = weakref.WeakKeyDictionary()
+        # Connections where a failed pipeline left an unknown set of statements
+        # prepared, cleared with DEALLOCATE ALL before their next PREPARE
+        self.stale = weakref.WeakSet()
+        self.lock = threading.Lock()
+
+    def _unprepared(self, connection, names) -> list:
+        with self.lock:
+            done = self.prepared.setdefault(connection, set())
+        return [name for name in dict.fromkeys(names) if name not in done]
+
+    def _forget(self, connection) -> None:
+        with self.lock:
+            self.prepared[connection] = set()
+            self.stale.add(connection)
+
+    def _reset(self, connection) -> list:
+        # Statements to run before the next PREPAREs on the connection
+        with self.lock:
+            if connection not in self.stale:
+                return []
+            self.stale.discard(connection)
+        return ["DEALLOCATE ALL"]
+
+    def _call(self, cursor, name, params) -> str:
+        if not params:
+            return f"EXECUTE {name}"
+        return f"EXECUTE {name} (" + ', '.join(['%s'] * len(params)) + ")"
+
+    def execute(self, cursor, name, params=()) -> None:
+        missing = self._unprepared(cursor.connection, [name])
+        if missing:
+            for statement in self._reset(cursor.connection):
+                cursor.execute(statement)
+            cursor.execute(f"PREPARE {name} AS {self.statements[name]}")
+            self.prepared[cursor.connection].add(name)
+        cursor.execute(self._call(cursor, name, params), params)
+
+    def pipeline(self, cursor, calls) -> None:
+        # Sends [(name, params), ...] plus any PREPAREs they need as one
+        # round trip. Only the last statement's rows can be fetched.
+        if not calls:
+            return
+        missing = self._unprepared(cursor.connection, [name for name, _ in calls])
+        batch = self._reset(cursor.connection) if missing else []
+        batch += [f"PREPARE {name} AS {self.statements[name]}" for name in missing]
+        batch += [cursor.mogrify(self._call(cursor, name, params), params).decode() for name, params in calls]
+        try:
+            cursor.execute(';\n'.join(batch))
+        except (psycopg2.Error):
+            if missing:
+                # PREPAREs that ran before the failing statement outlive the
+                # rollback, but which ones did is unknown
+                self._forget(cursor.connection)
+            raise
+        self.prepared[cursor.connection].update(missing)
+
+def read_only(method):
+    # Runs the whole call, including nested lookups, on a replica when one is
+    # healthy and has replayed this thread's last write; otherwise on the primary
+    @wraps(method)
+    def routed(self, *args, **kwargs):
+        if self.replicas is None or getattr(self._local, 'replica', None) is not None:
+            return method(self, *args, **kwargs)
+
+        replica = self.replicas.choose(getattr(self._local, 'min_lsn', None), getattr(self._local, 'pinned', None))
+        # The rest of the request stays on the same replica, so an ETag is
+        # never newer than the page it validates
+        self._local.pinned = self._local.replica = replica
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._local.replica = None
+    return routed
 
 class Database:
 
 
-    def __init__(self, dbname='test', user='postgres', password=os.environ['DB_password'], host='localhost', port='5432') -> None:
+    def __init__(self, dbname='test', user='postgres', password=os.environ['DB_password'], host='localhost', port='5432',
+                 pool_size=int(os.environ.get('DB_POOL_SIZE', 10)), dsn=os.environ.get('DATABASE_URL'),
+                 replicas=os.environ.get('DB_REPLICAS', ''), max_replica_lag=float(os.environ.get('DB_MAX_REPLICA_LAG', 5))) -> None:
+        # One pool per process. Each request thread gets its own connection
+        # from it, so concurrent requests never share a transaction, and gives
+        # it back at the end of the request (release). Background threads use
+        # dedicated() connections instead of pool slots.
+        # dsn, when given, replaces the individual settings. replicas is a
+        # comma separated list of connection URIs.
+        self.dbname = dbname
+        self.user=user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.pool = None
+        self._partitioned = None
+        self._local = threading.local()
+        self.statements = StatementRegistry(STATEMENTS)
+        # Set once this process has appended submission_rollup_deltas, see rollups.py
+        self.rollups_pending = threading.Event()
+
+        if isinstance(replicas, str):
+            replicas = [r.strip() for r in replicas.split(',') if r.strip()]
+
+        # The pool opens on first use, so a process can start before the database is up
+        self._pool_lock = threading.Lock()
+        self.replicas = ReplicaSet(self, replicas, pool_size, max_replica_lag) if replicas else None
+
+    @property
+    def connection(self):
+        dedicated = getattr(self._local, 'dedicated', None)
+        if dedicated is not None:
+            if dedicated.closed:
+                # Closed after an error, the rest of the block gets a fresh one
+                dedicated = self._local.dedicated = self.connect(dedicated.autocommit)
+            return dedicated
+
+        replica = getattr(self._local, 'replica', None)
+        if replica is not None:
+            try:
+                return self.replicas.getconn(replica)
+            except (psycopg2.Error) as error:
+                # Unreachable since the last health check, finish on the primary
+                logger.exception(error)
+                self.replicas.mark_down(replica)
+                self._local.replica = self._local.pinned = None
+
+        if self.pool is None:
+            self.reconnect()
+            if self.pool is None:
+                raise psycopg2.OperationalError('Database unavailable')
+        return self.pool.getconn(key=threading.get_ident())
+
+    def connect(self, autocommit=False):
+        # A connection of its own, outside the pool
+        if self.dsn:
+            connection = psycopg2.connect(self.dsn, connection_factory=CountingConnection)
+        else:
+            connection = psycopg2.connect(dbname=self.dbname, user=self.user, password=self.password, host=self.host,
+                                          port=self.port, connection_factory=CountingConnection)
+        connection.autocommit = autocommit
+        return connection
+
+    @contextmanager
+    def dedicated(self, autocommit=False, connection=None):
+        # Runs the block, including every Database method called in it, on a
+        # connection opened for it and closed afterwards, or on `connection`,
+        # which is left open. For background threads, which would otherwise
+        # keep a pool slot for good.
+        previous = getattr(self._local, 'dedicated', None)
+        self._local.dedicated = connection or self.connect(autocommit)
         try:
-            self.dbname = dbname
-            self.user=user
-            self.password = password
-            self.host = host
-            self.port = port
-            self.connection = psycopg2.connect(
-                dbname=dbname,
-                user=user,
-                password=password,
-                host=host,
-                port=port
-            )
-        
+            yield self._local.dedicated
+        finally:
+            used, self._local.dedicated = self._local.dedicated, previous
+            if used is not connection:
+                used.close()
+
+    def release(self) -> None:
+        # Gives this thread's pooled connections back, rolling back anything
+        # left open. Called when each request ends.
+        key = threading.get_ident()
+        try:
+            if self.pool is not None and key in self.pool._used:
+                self.pool.putconn(self.pool._used[key], key=key)
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
+        if self.replicas is not None:
+            self.replicas.release(key)
+
+    @property
+    def partitioned(self) -> bool:
+        # True once partitions.convert() has turned form_submissions into a
+        # range-partitioned table
+        if self._partitioned is None:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('form_submissions')")
+            row = cursor.fetchone()
+            cursor.close()
+            self._partitioned = row is not None and row[0] == 'p'
+        return self._partitioned
 
     def reconnect(self):
         try:
-            self.connection = psycopg2.connect(
-                dbname=self.dbname,
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                port=self.port
-            )
+            if getattr(self._local, 'dedicated', None) is not None:
+                # connection opens a new one once the broken one is closed
+                return
+
+            replica = getattr(self._local, 'replica', None)
+            if replica is not None:
+                # The failed read was on a replica, take it out of rotation
+                self.replicas.mark_down(replica)
+                return
+
+            if self.pool is None:
+                with self._pool_lock:
+                    # Another thread may have opened it meanwhile
+                    if self.pool is None and self.dsn:
+                        self.pool = ThreadedConnectionPool(1, self.pool_size, self.dsn, connection_factory=CountingConnection)
+                    elif self.pool is None:
+                        self.pool = ThreadedConnectionPool(
+                            1, self.pool_size,
+                            dbname=self.dbname,
+                            user=self.user,
+                            password=self.password,
+                            host=self.host,
+                            port=self.port,
+                            connection_factory=CountingConnection
+                        )
+                return
+
+            # Drop this thread's broken connection, the next use opens a fresh one
+            key = threading.get_ident()
+            if key in self.pool._used:
+                self.pool.putconn(self.pool._used[key], key=key, close=True)
 
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
+
+    def read_after(self, lsn) -> None:
+        # Called at the start of each request with the user's last write position
+        self._local.min_lsn = parse_lsn(lsn)
+        self._local.pinned = None
+
+    def write_position(self):
+        # WAL position that covers everything committed so far, None without replicas
+        if self.replicas is None:
+            return None
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT pg_current_wal_lsn()::text")
+            lsn = cursor.fetchone()[0]
+            cursor.close()
+            return lsn
+
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            self.connection.close()
+            self.reconnect()
+            return None
 
     def get_user_id(self, google_id: str) -> int:
         try:
@@ -51,7 +366,7 @@ class Database:
             return None
 
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return None
@@ -74,13 +389,16 @@ class Database:
             return True
 
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
 
     def close(self) -> None:
-        self.connection.close()
+        if self.pool is not None:
+            self.pool.closeall()
+        if self.replicas is not None:
+            self.replicas.close()
 
 
     def get_form_name(self, form_id) -> str:
@@ -92,7 +410,7 @@ class Database:
             return cursor.fetchone()['form_name']
 
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return 'Forms'
@@ -101,8 +419,7 @@ class Database:
     def has_access(self, form_id: int, user_id: int) -> bool:
         cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
-        select_query = "SELECT * FROM user_role WHERE user_role_id=(SELECT user_role_id FROM forms_access WHERE user_id = %s AND form_id = %s)"
-        cursor.execute(select_query, (user_id, form_id))
+        self.statements.execute(cursor, 'user_role', (user_id, form_id))
 
         role = cursor.fetchone()
 
@@ -115,8 +432,7 @@ class Database:
         try:
             cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
-            select_query = "SELECT * FROM user_role WHERE user_role_id=(SELECT user_role_id FROM forms_access WHERE user_id = %s AND form_id = %s)"
-            cursor.execute(select_query, (user_id, form_id))
+            self.statements.execute(cursor, 'user_role', (user_id, form_id))
 
             role = cursor.fetchone()
 
@@ -124,13 +440,14 @@ class Database:
                 return False
             return True
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
         
 
 
+    @read_only
     def get_questions(self, form_id: int, user_id: int) -> list[dict]:
         try:
 
@@ -166,7 +483,7 @@ class Database:
             return questions
 
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
@@ -176,8 +493,7 @@ class Database:
 
         cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
-        select_query = "SELECT * FROM questions LEFT JOIN question_types ON question_types.question_type_id = questions.question_type_id WHERE question_id=%s ORDER BY questions.position"
-        cursor.execute(select_query, (question_id,))
+        self.statements.execute(cursor, 'question', (question_id,))
 
         q = cursor.fetchone()
 
@@ -193,254 +509,523 @@ class Database:
         return question
 
 
-    def submit_form(self, form_id: int, user_id: int, answers:dict, files:dict) -> bool:
+    def _form_questions(self, cursor, form_id) -> list:
+        # The form's questions as records.Question, shared by all its rows
+        select_query = ("SELECT q.question_id, q.question_text, t.question_type, q.form_id FROM questions q "
+                        "LEFT JOIN question_types t ON t.question_type_id = q.question_type_id "
+                        "WHERE q.form_id=%s ORDER BY q.position")
+        cursor.execute(select_query, (form_id,))
+        return [Question(*row) for row in cursor.fetchall()]
+
+    def _read_answers(self, cursor, questions, submission_id, submitted_at=None) -> list:
+        # One value per question, see records.py. cursor returns tuples.
+        # Images are Image(answer_id) until _load_images.
+        # With partitioned tables the submission time lets the lookup prune
+        # to a single month
+        if submitted_at is not None and self.partitioned:
+            self.statements.execute(cursor, 'submission_answers_in_month', (submission_id, submitted_at))
+        else:
+            self.statements.execute(cursor, 'submission_answers', (submission_id,))
+
+        # First answer row per question, as the per-question lookups did
+        found = {}
+        for row in cursor.fetchall():
+            found.setdefault(row.question_id, row)
+
+        answers = []
+        for question in questions:
+            a = found.get(question.question_id)
+            if a is None:
+                answers.append(None)
+            elif question.type == 'image':
+                answers.append(Image(a.form_answer_id))
+            else:
+                column = ANSWER_COLUMNS.get(question.type)
+                value = getattr(a, column) if column else None
+                answers.append(value if value is not None else '')
+
+        return answers
+
+
+    def _dropdown_options(self, cursor, form_id) -> dict:
+        select_query = ("SELECT o.dropdown_question_option_id, o.dropdown_question_option FROM dropdown_question_options o "
+                        "JOIN questions q ON q.question_id = o.question_id WHERE q.form_id=%s")
+        cursor.execute(select_query, (form_id,))
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def _document_answers(self, questions, document, options) -> list:
+        # Same values as _read_answers, from one submission_documents row
+        answers = []
+        for question in questions:
+            key = str(question.question_id)
+            if key not in document:
+                answers.append(None)
+                continue
+            value = document[key]
+
+            if question.type == 'image':
+                answers.append(Image(value['image']) if isinstance(value, dict) else None)
+            elif question.type == 'dropdown':
+                answers.append(options.get(value) or '')
+            else:
+                answers.append(value if value is not None else '')
+
+        return answers
+
+    def _load_images(self, cursor, form_id, rows, original=False) -> None:
+        # Fills in Image.data across rows (lists of values) with one query,
+        # then from the archive files for images no longer in image_answers
+        images = {}
+        for answers in rows:
+            for value in answers:
+                if isinstance(value, Image):
+                    images.setdefault(value.answer_id, []).append(value)
+        if not images:
+            return
+
+        if original:
+            select_query = "SELECT answer_id, COALESCE(answer, lo_get(content_oid), lo_get(compact_oid)) FROM image_answers WHERE answer_id = ANY(%s)"
+        else:
+            select_query = "SELECT answer_id, COALESCE(lo_get(compact_oid), answer, lo_get(content_oid)) FROM image_answers WHERE answer_id = ANY(%s)"
+        cursor.execute(select_query, (list(images),))
+        found = {row[0]: bytes(row[1]) for row in cursor.fetchall() if row[1] is not None}
+
+        missing = [a_id for a_id in images if a_id not in found]
+        if missing:
+            import retention
+            with self.connection.cursor(cursor_factory=RealDictCursor) as archive_cursor:
+                found.update(retention.read_images(archive_cursor, form_id, missing, original))
+
+        for a_id, data in found.items():
+            for image in images[a_id]:
+                image.data = data
+
+    def notify_form_update(self, cursor, form_id, submission_id, event) -> None:
+        # Delivered to LISTENers when the surrounding transaction commits
+        payload = json.dumps({'form_id': int(form_id), 'submission_id': int(submission_id), 'event': event})
+        cursor.execute("SELECT pg_notify(%s, %s)", (FORM_UPDATES_CHANNEL, payload))
+
+
+    def index_coordinates(self, cursor, form_id, submission_id, answer_id, text) -> bool:
+        point = geo.parse_coordinates(text)
+        if point is None:
+            return False
+        lat, lon = point
+        geohash = geo.encode(lat, lon)
+
+        insert_query = ("INSERT INTO coordinate_answers (answer_id, form_id, form_submission_id, lat, lon, geohash) "
+                        "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (answer_id) DO NOTHING RETURNING answer_id")
+        cursor.execute(insert_query, (answer_id, form_id, submission_id, lat, lon, geohash))
+        if cursor.fetchone() is None:
+            return False
+
+        insert_query = ("INSERT INTO coordinate_clusters (form_id, precision, cell, count, sum_lat, sum_lon) VALUES %s "
+                        "ON CONFLICT (form_id, precision, cell) DO UPDATE SET count = coordinate_clusters.count + 1, "
+                        "sum_lat = coordinate_clusters.sum_lat + EXCLUDED.sum_lat, sum_lon = coordinate_clusters.sum_lon + EXCLUDED.sum_lon")
+        execute_values(cursor, insert_query,
+                       [(form_id, p, geohash[:p], 1, lat, lon) for p in range(1, geo.ROLLUP_PRECISION + 1)])
+        return True
+
+    def unindex_coordinates(self, cursor, answer_id) -> None:
+        select_query = "DELETE FROM coordinate_answers WHERE answer_id=%s RETURNING form_id, lat, lon, geohash"
+        cursor.execute(select_query, (answer_id,))
+        point = cursor.fetchone()
+        if point is None:
+            return
+
+        update_query = ("UPDATE coordinate_clusters SET count = count - 1, sum_lat = sum_lat - %s, sum_lon = sum_lon - %s "
+                        "WHERE form_id=%s AND precision=%s AND cell=%s")
+        for p in range(1, geo.ROLLUP_PRECISION + 1):
+            cursor.execute(update_query, (point['lat'], point['lon'], point['form_id'], p, point['geohash'][:p]))
+
+    def backfill_coordinates(self, batch_size=1000) -> int:
+        # Index coordinates answers written before coordinate_answers existed
+        indexed = 0
+        last_id = 0
         try:
+            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+            while True:
+                select_query = ("SELECT ta.answer_id, ta.answer, fs.form_id, fs.form_submission_id FROM text_answers ta "
+                                "JOIN form_answers fa ON fa.form_answer_id = ta.answer_id "
+                                "JOIN form_submissions fs ON fs.form_submission_id = fa.form_submission_id "
+                                "JOIN questions q ON q.question_id = fa.question_id "
+                                "JOIN question_types qt ON qt.question_type_id = q.question_type_id "
+                                "WHERE qt.question_type = 'coordinates' AND ta.answer_id > %s "
+                                "AND NOT EXISTS (SELECT 1 FROM coordinate_answers ca WHERE ca.answer_id = ta.answer_id) "
+                                "ORDER BY ta.answer_id LIMIT %s")
+                cursor.execute(select_query, (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                for row in rows:
+                    if self.index_coordinates(cursor, row['form_id'], row['form_submission_id'], row['answer_id'], row['answer']):
+                        indexed += 1
+                last_id = rows[-1]['answer_id']
+                self.connection.commit()
+
+            cursor.close()
+            return indexed
 
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            self.connection.close()
+            self.reconnect()
+            return indexed
+
+    @read_only
+    def get_map_clusters(self, form_id, user_id, bbox, zoom) -> list:
+        try:
             cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
-            if not self.has_access(form_id, user_id):
-                return False
-            
-            insert_query = "INSERT INTO form_submissions (form_id, user_id) VALUES (%s, %s)"
-            cursor.execute(insert_query, (form_id, user_id))
-            self.connection.commit()
+            if not self.has_read_access(form_id, user_id):
+                raise AppError('No Access')
 
-            select_query = "SELECT * FROM form_submissions WHERE form_id=%s AND user_id=%s ORDER BY form_submission_id DESC LIMIT 1"
-            cursor.execute(select_query, (form_id, user_id))
-            form_sub_id = int(cursor.fetchone()['form_submission_id'])
-            
-            for question_id in answers:
-                q = self.get_question(question_id)
-                q['answer'] = answers[question_id] if q['type'] != 'image' else files[q['question_id']].read()
+            precision = geo.precision_for_zoom(zoom)
+            clusters = []
+
+            for west, south, east, north in geo.split_bbox(*bbox):
+                prefixes = geo.covering_prefixes((west, south, east, north), precision)
+                column = 'cell' if precision <= geo.ROLLUP_PRECISION else 'geohash'
+                ranges = ' OR '.join([f'({column} >= %s AND {column} < %s)'] * len(prefixes))
+                params = [form_id]
+                for prefix in prefixes:
+                    params += [prefix, prefix + '~']
+
+                if precision <= geo.ROLLUP_PRECISION:
+                    select_query = ("SELECT cell, count, sum_lat / count AS lat, sum_lon / count AS lon, NULL AS submission_id "
+                                    f"FROM coordinate_clusters WHERE form_id=%s AND precision={precision} AND count > 0 AND ({ranges}) "
+                                    "AND sum_lat / count BETWEEN %s AND %s AND sum_lon / count BETWEEN %s AND %s")
+                else:
+                    select_query = (f"SELECT left(geohash, {precision}) AS cell, count(*) AS count, avg(lat) AS lat, avg(lon) AS lon, "
+                                    "min(form_submission_id) AS submission_id "
+                                    f"FROM coordinate_answers WHERE form_id=%s AND ({ranges}) "
+                                    "AND lat BETWEEN %s AND %s AND lon BETWEEN %s AND %s GROUP BY 1")
+                cursor.execute(select_query, params + [south, north, west, east])
+
+                for row in cursor.fetchall():
+                    clusters.append({
+                        'cell': row['cell'],
+                        'count': row['count'],
+                        'lat': row['lat'],
+                        'lon': row['lon'],
+                        # Only meaningful for single points
+                        'submission_id': row['submission_id'] if row['count'] == 1 else None
+                    })
 
-                print(q)
+            cursor.close()
+            return clusters
 
-                if q['form_id'] != form_id:
-                    print('Wrong Form Submission!')
-                    return False
-                
-                insert_query = "INSERT INTO form_answers (question_id, form_submission_id) VALUES (%s, %s)"
-                cursor.execute(insert_query, (question_id, form_sub_id))
-                self.connection.commit()
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            self.connection.close()
+            self.reconnect()
+            raise AppError('PSQL Error')
 
-                select_query = "SELECT * FROM form_answers WHERE question_id=%s AND form_submission_id=%s ORDER BY form_answer_id DESC LIMIT 1"
-                cursor.execute(select_query, (question_id, form_sub_id))
-                form_ans_id = int(cursor.fetchone()['form_answer_id'])
 
-                if q['type'] == 'text':
+    @read_only
+    def get_submission_series(self, form_id, user_id, bucket='day', split=None) -> dict:
+        """Submissions per bucket over SERIES_SPANS[bucket], from the rollups
+        plus deltas not compacted yet. With split, a dropdown question id, one
+        series per option instead of the overall count. Lists the form's
+        dropdown questions as 'splits'."""
+        try:
+            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
-                    insert_query = "INSERT INTO text_answers (answer_id, answer) VALUES (%s, %s)"
-                    cursor.execute(insert_query, (form_ans_id, q['answer']))
-                    self.connection.commit()
+            if not self.has_read_access(form_id, user_id):
+                raise AppError('No Access')
 
-                elif q['type'] == 'numeric':
+            select_query = ("SELECT q.question_id, q.question_text FROM questions q "
+                            "JOIN question_types t ON t.question_type_id = q.question_type_id "
+                            "WHERE q.form_id=%s AND t.question_type = 'dropdown' ORDER BY q.position")
+            cursor.execute(select_query, (form_id,))
+            splits = [{'question_id': row['question_id'], 'text': row['question_text']} for row in cursor.fetchall()]
 
-                    insert_query = "INSERT INTO numeric_answers (answer_id, answer) VALUES (%s, %s)"
-                    if q['answer']:
-                        cursor.execute(insert_query, (form_ans_id, q['answer']))
-                        self.connection.commit()
+            if split is None:
+                names = {0: 'Submissions'}
+            else:
+                if int(split) not in [q['question_id'] for q in splits]:
+                    raise AppError('Not a dropdown question of this form')
+                select_query = ("SELECT dropdown_question_option_id, dropdown_question_option FROM dropdown_question_options "
+                                "WHERE question_id=%s ORDER BY position")
+                cursor.execute(select_query, (split,))
+                names = {row['dropdown_question_option_id']: row['dropdown_question_option'] for row in cursor.fetchall()}
+
+            select_query = ("WITH periods AS (SELECT generate_series(date_trunc(%(bucket)s, LOCALTIMESTAMP - %(span)s), "
+                            "date_trunc(%(bucket)s, LOCALTIMESTAMP), ('1 ' || %(bucket)s)::interval) AS period_start), "
+                            "counts AS (SELECT period_start, option_id, count FROM submission_rollups "
+                            "WHERE form_id=%(form_id)s AND bucket=%(bucket)s AND option_id = ANY(%(options)s) "
+                            "AND period_start >= (SELECT min(period_start) FROM periods) "
+                            "UNION ALL SELECT date_trunc(%(bucket)s, hour), option_id, delta FROM submission_rollup_deltas "
+                            "WHERE form_id=%(form_id)s AND option_id = ANY(%(options)s) "
+                            "AND hour >= (SELECT min(period_start) FROM periods)) "
+                            "SELECT p.period_start, c.option_id, sum(c.count) AS count "
+                            "FROM periods p LEFT JOIN counts c ON c.period_start = p.period_start "
+                            "GROUP BY 1, 2 ORDER BY 1")
+            cursor.execute(select_query, {'form_id': form_id, 'bucket': bucket, 'span': SERIES_SPANS[bucket],
+                                          'options': list(names)})
+
+            periods = {}
+            for row in cursor.fetchall():
+                counts = periods.setdefault(row['period_start'], {})
+                if row['option_id'] is not None:
+                    counts[row['option_id']] = int(row['count'])
+            cursor.close()
+
+            return {
+                'bucket': bucket,
+                'periods': [p.isoformat() for p in periods],
+                'series': [{'name': name, 'counts': [counts.get(option_id, 0) for counts in periods.values()]}
+                           for option_id, name in names.items()],
+                'splits': splits,
+            }
 
-                elif q['type'] == 'date':
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            self.connection.close()
+            self.reconnect()
+            raise AppError('PSQL Error')
 
-                    insert_query = "INSERT INTO date_answers (answer_id, answer) VALUES (%s, %s)"
-                    cursor.execute(insert_query, (form_ans_id, q['answer']))
-                    self.connection.commit()
+    def get_storage_mode(self, cursor, form_id) -> str:
+        # 'eav': one typed row per answer, 'document': one JSONB row per submission
+        self.statements.execute(cursor, 'storage_mode', (form_id,))
+        row = cursor.fetchone()
+        return row['storage_mode'] if row is not None else 'eav'
+
+    def _new_answer_id(self, cursor) -> int:
+        # Answer ids for rows outside form_answers, unique across both layouts
+        cursor.execute("SELECT nextval(pg_get_serial_sequence('form_answers', 'form_answer_id')) AS answer_id")
+        return int(cursor.fetchone()['answer_id'])
+
+    def _write_image(self, cursor, question_id, submission_id, submitted_at, image) -> int:
+        # image: an uploads.StoredUpload already streamed into a large object
+        insert_query = "INSERT INTO form_answers (question_id, form_submission_id, submitted_at) VALUES (%s, %s, %s) RETURNING form_answer_id"
+        cursor.execute(insert_query, (question_id, submission_id, submitted_at))
+        form_ans_id = int(cursor.fetchone()['form_answer_id'])
+
+        insert_query = ("INSERT INTO image_answers (answer_id, content_oid, content_hash, mime_type, size, submitted_at) "
+                        "VALUES (%s, %s, %s, %s, %s, %s)")
+        cursor.execute(insert_query, (form_ans_id, image.oid, image.sha256, image.mime_type, image.size, submitted_at))
+
+        # Picked up by transcoder.py
+        cursor.execute("INSERT INTO image_transcode_queue (answer_id) VALUES (%s)", (form_ans_id,))
+        return form_ans_id
+
+    def _eav_statement(self, submission_id, submitted_at, q, answer):
+        # (statement, params) for answers that need nothing back from the
+        # insert, None for images and coordinates
+        key = (q['question_id'], submission_id, submitted_at)
+
+        if q['type'] in ('image', 'coordinates'):
+            return None
+        if q['type'] == 'numeric' and not answer:
+            return ('insert_answer', key)
+        if q['type'] in ('text', 'numeric', 'date', 'dropdown'):
+            return (f"insert_{q['type']}_answer", (*key, answer))
+        return ('insert_answer', key)
+
+    def _write_eav_answer(self, cursor, form_id, submission_id, submitted_at, q, answer) -> None:
+        statement = self._eav_statement(submission_id, submitted_at, q, answer)
+        if statement is not None:
+            self.statements.execute(cursor, *statement)
+            return
+
+        if q['type'] == 'image':
+            # An int is an image that is already stored
+            if not isinstance(answer, int):
+                self._write_image(cursor, q['question_id'], submission_id, submitted_at, answer)
+            return
+
+        insert_query = "INSERT INTO form_answers (question_id, form_submission_id, submitted_at) VALUES (%s, %s, %s) RETURNING form_answer_id"
+        cursor.execute(insert_query, (q['question_id'], submission_id, submitted_at))
+        form_ans_id = int(cursor.fetchone()['form_answer_id'])
+
+        insert_query = "INSERT INTO text_answers (answer_id, answer, submitted_at) VALUES (%s, %s, %s)"
+        cursor.execute(insert_query, (form_ans_id, answer, submitted_at))
+        self.index_coordinates(cursor, form_id, submission_id, form_ans_id, answer)
+
+    def _write_document(self, cursor, form_id, submission_id, submitted_at, answers) -> None:
+        # answers: [(question, value)]. Images keep their own image_answers row
+        # and the document points at it.
+        document = {}
+        for q, answer in answers:
+            key = str(q['question_id'])
+
+            if q['type'] == 'image':
+                if not isinstance(answer, int):
+                    answer = self._write_image(cursor, q['question_id'], submission_id, submitted_at, answer)
+                document[key] = {'image': answer}
+
+            elif q['type'] == 'numeric':
+                document[key] = str(answer) if answer not in ('', None) else None
+
+            elif q['type'] == 'date':
+                document[key] = str(answer) if answer is not None else None
+
+            elif q['type'] == 'dropdown':
+                document[key] = int(answer) if answer not in ('', None) else None
+
+            elif q['type'] == 'coordinates':
+                document[key] = answer
+                self.index_coordinates(cursor, form_id, submission_id, self._new_answer_id(cursor), answer)
 
-                elif q['type'] == 'coordinates':
+            else:
+                document[key] = answer
 
-                    insert_query = "INSERT INTO text_answers (answer_id, answer) VALUES (%s, %s)"
-                    cursor.execute(insert_query, (form_ans_id, q['answer']))
-                    self.connection.commit()
+        insert_query = "INSERT INTO submission_documents (form_submission_id, form_id, answers) VALUES (%s, %s, %s)"
+        cursor.execute(insert_query, (submission_id, form_id, Json(document)))
 
-                elif q['type'] == 'dropdown':
+    def submit_form(self, form_id: int, user_id: int, answers:dict, files:dict) -> bool:
+        try:
 
-                    insert_query = "INSERT INTO dropdown_answers (answer_id, dropdown_question_option_id) VALUES (%s, %s)"
-                    cursor.execute(insert_query, (form_ans_id, q['answer']))
-                    self.connection.commit()
+            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
-                elif q['type'] == 'image':
+            if not self.has_access(form_id, user_id):
+                return False
 
-                    print('Image found')
+            collected = []
+            for question_id in answers:
+                q = self.get_question(question_id)
+                q['answer'] = answers[question_id] if q['type'] != 'image' else files[q['question_id']]
 
-                    insert_query = "INSERT INTO image_answers (answer_id, answer) VALUES (%s, %s)"
-                    cursor.execute(insert_query, (form_ans_id, q['answer']))
-                    self.connection.commit()
+                if q['form_id'] != form_id:
+                    logger.warning('Wrong Form Submission!')
+                    return False
+                collected.append((q, q['answer']))
 
             for question_id in files:
                 q = self.get_question(question_id)
-                q['answer'] = files[question_id].read()
-
-                #print(q)
 
                 if q['form_id'] != form_id:
-                    print('Wrong Form Submission!')
+                    logger.warning('Wrong Form Submission!')
                     return False
-                
-                insert_query = "INSERT INTO form_answers (question_id, form_submission_id) VALUES (%s, %s)"
-                cursor.execute(insert_query, (question_id, form_sub_id))
-                self.connection.commit()
+                if q['type'] == 'image':
+                    collected.append((q, files[question_id]))
 
-                select_query = "SELECT * FROM form_answers WHERE question_id=%s AND form_submission_id=%s ORDER BY form_answer_id DESC LIMIT 1"
-                cursor.execute(select_query, (question_id, form_sub_id))
-                form_ans_id = int(cursor.fetchone()['form_answer_id'])
+            insert_query = "INSERT INTO form_submissions (form_id, user_id) VALUES (%s, %s) RETURNING form_submission_id, submitted_at"
+            cursor.execute(insert_query, (form_id, user_id))
+            sub = cursor.fetchone()
 
-                if q['type'] == 'image':
+            form_sub_id = int(sub['form_submission_id'])
+            # Partition key of every answer row when the tables are partitioned
+            submitted_at = sub['submitted_at']
 
-                    print('Image found')
+            # Uploads go straight from the request stream into large objects,
+            # never whole in memory. Empty file fields count as unanswered.
+            remaining = uploads.MAX_REQUEST_BYTES
+            streamed = []
+            for q, answer in collected:
+                if q['type'] == 'image':
+                    answer = uploads.store(self.connection, answer, min(uploads.MAX_FILE_BYTES, remaining))
+                    if answer is None:
+                        continue
+                    remaining -= answer.size
+                streamed.append((q, answer))
+            collected = streamed
 
-                    insert_query = "INSERT INTO image_answers (answer_id, answer) VALUES (%s, %s)"
-                    cursor.execute(insert_query, (form_ans_id, q['answer']))
-                    self.connection.commit()
+            if self.get_storage_mode(cursor, form_id) == 'document':
+                self._write_document(cursor, form_id, form_sub_id, submitted_at, collected)
+            else:
+                # Plain answers go to the server together in one round trip
+                batch = []
+                for q, answer in collected:
+                    statement = self._eav_statement(form_sub_id, submitted_at, q, answer)
+                    if statement is not None:
+                        batch.append(statement)
+                    else:
+                        self._write_eav_answer(cursor, form_id, form_sub_id, submitted_at, q, answer)
+                self.statements.pipeline(cursor, batch)
+
+            options = [int(answer) for q, answer in collected if q['type'] == 'dropdown' and answer not in ('', None)]
+            self.statements.pipeline(cursor, [('count_submission', (form_id, submitted_at)),
+                                              ('rollup_submission', (form_id, submitted_at, [0, *options], 1))])
+            self.notify_form_update(cursor, form_id, form_sub_id, 'submitted')
+            self.connection.commit()
+            self.rollups_pending.set()
 
-            print('done')
             cursor.close()
             return True
 
+        except AppError:
+            # Rejected upload, nothing of the submission is kept
+            self.connection.rollback()
+            raise
 
         except (Exception, psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
 
 
-    def get_all_responses(self, form_id: int, user_id: int, period='at'):
+    @read_only
+    def get_all_responses(self, form_id: int, user_id: int, period='at', is_cached=None, images=True):
+        # (questions, responses) as records.Question and records.Response.
+        # is_cached(submission_id) -> True leaves that row's answers as None so
+        # callers holding an already rendered copy skip loading it. images=False
+        # leaves Image.data unset, for callers that only link to them
 
         try:
 
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+            cursor = self.connection.cursor(cursor_factory=NamedTupleCursor)
 
             if not self.has_read_access(form_id, user_id):
                 raise AppError('No Access')
-            
-            select_query = "SELECT * FROM questions WHERE form_id=%s ORDER BY position"
-            cursor.execute(select_query, (form_id,))
-            questions = cursor.fetchall()
-            form_questions = [q['question_text'] for q in questions]
-            questions = [self.get_question(question['question_id']) for question in questions]
-
-            date_opt = {
-                'pd': 'AND submitted_at >= CURRENT_DATE',
-                'pw': "AND submitted_at >= CURRENT_DATE - INTERVAL '7 days'",
-                'py': "AND submitted_at >= CURRENT_DATE - INTERVAL '1 year'",
-                'at': ''
-            }
 
-            select_query = f"SELECT * FROM form_submissions WHERE form_id=%s {date_opt[period]} ORDER BY submitted_at DESC"
+            questions = self._form_questions(cursor, form_id)
+
+            # Forms can hold both layouts while being migrated
+            select_query = ("SELECT s.form_submission_id, s.submitted_at, d.answers AS document FROM form_submissions s "
+                            "LEFT JOIN submission_documents d ON d.form_submission_id = s.form_submission_id "
+                            f"WHERE s.form_id=%s {PERIODS[period]} ORDER BY submitted_at DESC")
             cursor.execute(select_query, (form_id,))
             submissions = cursor.fetchall()
 
 
             form_responses = []
+            options = None
 
             for sub in submissions:
-                answers = []
-                for question in questions:
-                    
-                    select_query = 'SELECT * FROM form_answers WHERE question_id=%s AND form_submission_id=%s'
-                    cursor.execute(select_query, (question['question_id'], sub['form_submission_id']))
-                    a = cursor.fetchone()
-
-                    if a is None:
-                        answers.append('')
-                        continue
+                if is_cached is not None and is_cached(sub.form_submission_id):
+                    answers = None
+                elif sub.document is not None:
+                    if options is None:
+                        options = self._dropdown_options(cursor, form_id)
+                    answers = self._document_answers(questions, sub.document, options)
+                else:
+                    answers = self._read_answers(cursor, questions, sub.form_submission_id, sub.submitted_at)
+
+                form_responses.append(Response(sub.form_submission_id, answers))
+
+            # Older submissions moved to archive files, see retention.py
+            import retention
+            live = {sub.form_submission_id for sub in submissions}
+            with self.connection.cursor(cursor_factory=RealDictCursor) as archive_cursor:
+                archived = [sub for sub in retention.read_submissions(archive_cursor, form_id, period, skip=is_cached)
+                            if sub['form_submission_id'] not in live]
+            for sub in archived:
+                answers = None
+                if is_cached is None or not is_cached(sub['form_submission_id']):
+                    if options is None:
+                        options = self._dropdown_options(cursor, form_id)
+                    answers = self._document_answers(questions, json.loads(sub['answers']), options)
+                form_responses.append(Response(sub['form_submission_id'], answers))
+
+            if images:
+                self._load_images(cursor, form_id, [res.answers for res in form_responses if res.answers is not None])
 
-                    a_id = a['form_answer_id']
-
-                    if question['type'] == 'text':
-                        select_query = "SELECT * FROM text_answers WHERE answer_id=%s"
-                        cursor.execute(select_query, (a_id,))
-                        val = {
-                            'type': 'text',
-                            'value': cursor.fetchone()['answer'] or ''
-                        }
-                        answers.append(val)
-
-                    elif question['type'] == 'numeric':
-                        select_query = "SELECT * FROM numeric_answers WHERE answer_id=%s"
-                        cursor.execute(select_query, (a_id,))
-                        ans = cursor.fetchone()
-
-                        val = {
-                            'type': 'text',
-                            'value': ans['answer'] if ans is not None else ''
-                        }
-
-                        answers.append(val)
-
-                    elif question['type'] == 'date':
-                        select_query = "SELECT * FROM date_answers WHERE answer_id=%s"
-                        cursor.execute(select_query, (a_id,))
-                        ans = cursor.fetchone()
-
-                        val = {
-                            'type': 'text',
-                            'value': ans['answer'] if ans is not None else ''
-                        }
-                        
-                        answers.append(val)
-                    
-                    elif question['type'] == 'coordinates':
-                        select_query = "SELECT * FROM text_answers WHERE answer_id=%s"
-                        cursor.execute(select_query, (a_id,))
-                        ans = cursor.fetchone()
-
-                        val = {
-                            'type': 'text',
-                            'value': ans['answer'] if ans is not None else ''
-                        }
-
-                        answers.append(val)
-
-                    elif question['type'] == 'dropdown':
-                        select_query = "SELECT * FROM dropdown_answers WHERE answer_id=%s"
-                        cursor.execute(select_query, (a_id,))
-                        ddq_id = cursor.fetchone()['dropdown_question_option_id']
-
-                        select_query = "SELECT * FROM dropdown_question_options WHERE dropdown_question_option_id=%s"
-                        cursor.execute(select_query, (ddq_id,))
-
-                        val = {
-                            'type': 'text',
-                            'value': cursor.fetchone()['dropdown_question_option'] or ''
-                        }
-
-                        answers.append(val)
-
-                    elif question['type'] == 'image':
-                        select_query = "SELECT * FROM image_answers WHERE answer_id=%s"
-                        cursor.execute(select_query, (a_id,))
-                        ans = cursor.fetchone()
-
-                        if ans is None:
-                            answers.append({'type': 'none'})
-                            continue
-                        img = base64.b64encode(ans['answer'])
-
-                        val = {
-                            'type': 'image',
-                            'value': img.decode('utf-8'),
-                            'answer_id': a_id
-                        }
-                        answers.append(val)
-
-                form_responses.append({
-                    'answers': answers,
-                    'submission_id': sub['form_submission_id']
-                })
-
-            print('done')
             cursor.close()
-            return form_questions, form_responses
+            return questions, form_responses
 
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             raise AppError('PSQL Error')
 
 
+    @read_only
     def get_response(self, form_id, user_id, submission_id):
         try:
 
@@ -448,17 +1033,14 @@ class Database:
 
             if not self.has_read_access(form_id, user_id):
                 return False
-            
-            select_query = "SELECT * FROM questions WHERE form_id=%s ORDER BY position"
-            cursor.execute(select_query, (form_id,))
-            questions = cursor.fetchall()
-            form_questions = [q['question_text'] for q in questions]
-
-            questions = [self.get_question(question['question_id']) for question in questions]
 
-            select_query = "SELECT * FROM form_submissions WHERE form_submission_id=%s"
+            select_query = ("SELECT s.*, d.answers AS document FROM form_submissions s "
+                            "LEFT JOIN submission_documents d ON d.form_submission_id = s.form_submission_id "
+                            "WHERE s.form_submission_id=%s")
             cursor.execute(select_query, (submission_id,))
             sub = cursor.fetchone()
+            if sub is None:
+                sub = self._archived_submission(cursor, form_id, submission_id)
             if sub is None:
                 raise AppError('Submission Does Not Exist')
 
@@ -470,130 +1052,241 @@ class Database:
                 'email': user['email'],
                 'submission time': sub['submitted_at']
             }
+            cursor.close()
 
-            answers = []
-            for question in questions:
-                
-                select_query = 'SELECT * FROM form_answers WHERE question_id=%s AND form_submission_id=%s'
-                cursor.execute(select_query, (question['question_id'], sub['form_submission_id']))
-                a = cursor.fetchone()
-
-                if a is None:
-                    answers.append('')
-                    continue
-
-                a_id = a['form_answer_id']
-
-                if question['type'] == 'text':
-                    select_query = "SELECT * FROM text_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
-                    val = {
-                        'type': 'text',
-                        'value': cursor.fetchone()['answer'] or ''
-                    }
-                    answers.append(val)
-
-                elif question['type'] == 'numeric':
-                    select_query = "SELECT * FROM numeric_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
-                    ans = cursor.fetchone()
-
-                    val = {
-                        'type': 'text',
-                        'value': ans['answer'] if ans is not None else ''
-                    }
+            cursor = self.connection.cursor(cursor_factory=NamedTupleCursor)
+            questions = self._form_questions(cursor, form_id)
+            # The entry page links to its images
+            answers = self._answers(cursor, form_id, questions, sub)
+            cursor.close()
 
-                    answers.append(val)
+            return questions, answers, submission_details
 
-                elif question['type'] == 'date':
-                    select_query = "SELECT * FROM date_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
-                    ans = cursor.fetchone()
-
-                    val = {
-                        'type': 'text',
-                        'value': ans['answer'] if ans is not None else ''
-                    }
-                    
-                    answers.append(val)
-                
-                elif question['type'] == 'coordinates':
-                    select_query = "SELECT * FROM text_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
-                    ans = cursor.fetchone()
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            self.connection.close()
+            self.reconnect()
+            return False
 
-                    val = {
-                        'type': 'text',
-                        'value': ans['answer'] if ans is not None else ''
-                    }
+    def get_submission(self, form_id, submission_id, images=True):
+        # Single dashboard row, same as an entry of get_all_responses.
+        # Access is checked by the caller.
+        try:
 
-                    answers.append(val)
+            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
-                elif question['type'] == 'dropdown':
-                    select_query = "SELECT * FROM dropdown_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
-                    ddq_id = cursor.fetchone()['dropdown_question_option_id']
+            select_query = ("SELECT s.*, d.answers AS document FROM form_submissions s "
+                            "LEFT JOIN submission_documents d ON d.form_submission_id = s.form_submission_id "
+                            "WHERE s.form_submission_id=%s AND s.form_id=%s")
+            cursor.execute(select_query, (submission_id, form_id))
+            sub = cursor.fetchone()
+            if sub is None:
+                sub = self._archived_submission(cursor, form_id, submission_id)
+            if sub is None:
+                return None
+            cursor.close()
 
-                    select_query = "SELECT * FROM dropdown_question_options WHERE dropdown_question_option_id=%s"
-                    cursor.execute(select_query, (ddq_id,))
+            cursor = self.connection.cursor(cursor_factory=NamedTupleCursor)
+            answers = self._answers(cursor, form_id, self._form_questions(cursor, form_id), sub)
+            if images:
+                self._load_images(cursor, form_id, [answers])
+            cursor.close()
+            return Response(sub['form_submission_id'], answers)
 
-                    val = {
-                        'type': 'text',
-                        'value': cursor.fetchone()['dropdown_question_option'] or ''
-                    }
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            self.connection.close()
+            self.reconnect()
+            return None
 
-                    answers.append(val)
+    def _answers(self, cursor, form_id, questions, sub) -> list:
+        # sub: a form_submissions row with its document, if any
+        if sub['document'] is not None:
+            return self._document_answers(questions, sub['document'], self._dropdown_options(cursor, form_id))
+        return self._read_answers(cursor, questions, sub['form_submission_id'], sub['submitted_at'])
+
+    def _archived_submission(self, cursor, form_id, submission_id):
+        # A submission moved to the archive files, shaped like a
+        # form_submissions row with its document
+        import retention
+        sub = retention.find_submission(cursor, form_id, submission_id)
+        if sub is None:
+            return None
+        sub['document'] = json.loads(sub.pop('answers'))
+        return sub
 
-                elif question['type'] == 'image':
-                    select_query = "SELECT * FROM image_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
-                    ans = cursor.fetchone()
+    @read_only
+    def get_form_version(self, form_id):
+        # Everything a cached dashboard depends on, without touching any answers
+        try:
+            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+            select_query = ("SELECT s.last_submission_id, s.last_submitted_at, "
+                            "COALESCE(v.delete_count, 0) AS delete_count, COALESCE(v.schema_version, 0) AS schema_version, v.updated_at "
+                            "FROM (SELECT MAX(form_submission_id) AS last_submission_id, MAX(submitted_at) AS last_submitted_at "
+                            "FROM form_submissions WHERE form_id=%s) s "
+                            "LEFT JOIN form_versions v ON v.form_id=%s")
+            cursor.execute(select_query, (form_id, form_id))
+            version = cursor.fetchone()
+            cursor.close()
 
-                    if ans is None:
-                        answers.append({'type': 'none'})
-                        continue
-                    img = base64.b64encode(ans['answer'])
+            modified = [t for t in (version['last_submitted_at'], version['updated_at']) if t is not None]
+            version['last_modified'] = max(modified) if modified else None
+            return version
 
-                    val = {
-                        'type': 'image',
-                        'value': img.decode('utf-8')
-                    }
-                    answers.append(val)
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            self.connection.close()
+            self.reconnect()
+            return None
 
-            return form_questions, answers, submission_details
+    @read_only
+    def get_submission_version(self, form_id, submission_id):
+        try:
+            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+            select_query = ("SELECT s.form_submission_id, s.submitted_at, COALESCE(v.schema_version, 0) AS schema_version "
+                            "FROM form_submissions s LEFT JOIN form_versions v ON v.form_id = s.form_id "
+                            "WHERE s.form_submission_id=%s AND s.form_id=%s")
+            cursor.execute(select_query, (submission_id, form_id))
+            version = cursor.fetchone()
+            cursor.close()
+            return version
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
-            return False
-        
-    def get_image(self, user_id, form_id, answer_id):
+            return None
+
+    @read_only
+    def get_image(self, user_id, form_id, answer_id, original=False):
+        # (bytes, mime type) of the compact copy when there is one, unless the
+        # original is asked for. None when there is no such image.
 
         try:
 
             cursor = self.connection.cursor(cursor_factory=RealDictCursor)
 
             if not self.has_read_access(form_id, user_id):
-                return False
+                return None
 
-            select_query = "SELECT * FROM image_answers WHERE answer_id=%s"
+            if original:
+                select_query = ("SELECT COALESCE(answer, lo_get(content_oid), lo_get(compact_oid)) AS answer, "
+                                "CASE WHEN answer IS NULL AND content_oid IS NULL THEN compact_mime_type ELSE mime_type END AS mime_type "
+                                "FROM image_answers WHERE answer_id=%s")
+            else:
+                select_query = ("SELECT COALESCE(lo_get(compact_oid), answer, lo_get(content_oid)) AS answer, "
+                                "CASE WHEN compact_oid IS NULL THEN mime_type ELSE compact_mime_type END AS mime_type "
+                                "FROM image_answers WHERE answer_id=%s")
             cursor.execute(select_query, (answer_id,))
             ans = cursor.fetchone()
 
             if ans is None:
-                return False
-
-            img = base64.b64encode(ans['answer'])
-
-            return img.decode('utf-8')
+                import retention
+                image = retention.read_images(cursor, form_id, [answer_id], original).get(int(answer_id))
+                if image is None:
+                    return None
+                ans = {'answer': image, 'mime_type': None}
+
+            if ans['answer'] is None:
+                return None
+            data = bytes(ans['answer'])
+            # Rows stored before uploads recorded a type, and archived images
+            return data, ans['mime_type'] or uploads.sniff(data[:16]) or 'application/octet-stream'
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
         
+    def iter_images(self, form_id, user_id, period='at', original=False, batch_size=50):
+        """Every image answered on the form in the period, as (name, submitted_at,
+        chunks) for archives.stream_zip. Rows come from a server-side cursor
+        batch_size at a time and large objects are read in CHUNK_SIZE pieces,
+        so memory use does not grow with the form."""
+        # Checked before the first chunk is sent, while an error can still be shown
+        if not self.has_read_access(form_id, user_id):
+            raise AppError('No Access')
+        return self._iter_images(form_id, period, original, batch_size)
+
+    def _iter_images(self, form_id, period, original, batch_size):
+        # Runs on the primary: the transaction stays open while the archive
+        # streams, which a standby would cancel on replication conflicts
+        connection = self.connection
+        cursor = connection.cursor(f'images_{form_id}_{threading.get_ident()}', cursor_factory=RealDictCursor)
+        cursor.itersize = batch_size
+        # Rows written before migration 004 may have no submitted_at unless
+        # the tables were partitioned, which backfills it
+        same_month = (" AND fa.submitted_at = s.submitted_at", " AND i.submitted_at = s.submitted_at") if self.partitioned else ("", "")
+        try:
+            cursor.execute("SELECT s.form_submission_id, s.submitted_at, q.position, q.question_text, "
+                           "i.content_oid, i.mime_type, i.compact_oid, i.compact_mime_type, i.answer "
+                           f"FROM (SELECT * FROM form_submissions WHERE form_id=%s {PERIODS[period]}) s "
+                           f"JOIN form_answers fa ON fa.form_submission_id = s.form_submission_id{same_month[0]} "
+                           f"JOIN image_answers i ON i.answer_id = fa.form_answer_id{same_month[1]} "
+                           "JOIN questions q ON q.question_id = fa.question_id "
+                           "ORDER BY s.submitted_at, s.form_submission_id, q.position", (form_id,))
+
+            for row in cursor:
+                variants = [(row['compact_oid'], row['compact_mime_type']), (row['content_oid'], row['mime_type'])]
+                if original:
+                    variants.reverse()
+                oid, mime_type = next(((o, m) for o, m in variants if o is not None), (None, None))
+
+                if oid is not None:
+                    chunks = self._read_large_object(connection, oid)
+                elif row['answer'] is not None:
+                    # Stored before uploads went to large objects
+                    chunks = [bytes(row['answer'])]
+                    mime_type = uploads.sniff(chunks[0][:16])
+                else:
+                    continue
+
+                yield self._image_entry(row, row['position'], row['question_text'], mime_type), row['submitted_at'], chunks
+
+            # Then the ones moved to archive files, see retention.py
+            import retention
+            archive_cursor = connection.cursor(cursor_factory=RealDictCursor)
+            archive_cursor.execute("SELECT question_id, position, question_text FROM questions WHERE form_id=%s", (form_id,))
+            questions = {q['question_id']: q for q in archive_cursor.fetchall()}
+            for row in retention.iter_images(archive_cursor, form_id, period):
+                variants = [(row['compact'], row['compact_mime_type']), (row['data'], row['mime_type'])]
+                if original:
+                    variants.reverse()
+                data, mime_type = next(((d, m) for d, m in variants if d is not None), (None, None))
+                q = questions.get(row['question_id'])
+                if data is None or q is None:
+                    continue
+                yield self._image_entry(row, q['position'], q['question_text'], mime_type), row['submitted_at'], [data]
+
+        except (psycopg2.Error) as error:
+            # Too late for an error page, the archive just ends early
+            logger.exception(error)
+            connection.close()
+            self.reconnect()
+
+        finally:
+            if not connection.closed:
+                cursor.close()
+                connection.rollback()
+
+    def _image_entry(self, row, position, question_text, mime_type) -> str:
+        # Name of an image inside the archive
+        question = re.sub(r'[^\w\- ]+', '', question_text or '').strip()[:60] or 'image'
+        return (f"submission-{row['form_submission_id']}/q{position} {question}."
+                f"{uploads.EXTENSIONS.get(mime_type, 'bin')}")
+
+    def _read_large_object(self, connection, oid):
+        lobject = connection.lobject(oid, 'rb')
+        try:
+            while True:
+                chunk = lobject.read(uploads.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            lobject.close()
+
     def update_access(self, email, role, form_id):
 
         try:
@@ -629,7 +1322,7 @@ class Database:
             return True
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
@@ -639,49 +1332,94 @@ class Database:
         
         try:
             cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            select_query = "SELECT * FROM form_answers WHERE form_submission_id=%s"
-            cursor.execute(select_query, (submission_id,))
+            select_query = "SELECT submitted_at FROM form_submissions WHERE form_submission_id=%s AND form_id=%s"
+            cursor.execute(select_query, (submission_id, form_id))
+            sub = cursor.fetchone()
+            if sub is None:
+                return False
+
+            key, key_params = ('', ())
+            if self.partitioned:
+                key, key_params = (' AND submitted_at=%s', (sub['submitted_at'],))
+
+            select_query = "SELECT * FROM form_answers WHERE form_submission_id=%s" + key
+            cursor.execute(select_query, (submission_id, *key_params))
             questions = cursor.fetchall()
+            # Dropdown options chosen, taken off the chart rollups
+            options = []
 
             for q in questions:
                 question = self.get_question(q['question_id'])
                 a_id = q['form_answer_id']
 
                 if question['type'] == 'text':
-                    select_query = "DELETE FROM text_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
+                    select_query = "DELETE FROM text_answers WHERE answer_id=%s" + key
+                    cursor.execute(select_query, (a_id, *key_params))
 
                 elif question['type'] == 'numeric':
-                    select_query = "DELETE FROM numeric_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
+                    select_query = "DELETE FROM numeric_answers WHERE answer_id=%s" + key
+                    cursor.execute(select_query, (a_id, *key_params))
 
                 elif question['type'] == 'date':
-                    select_query = "DELETE FROM date_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
+                    select_query = "DELETE FROM date_answers WHERE answer_id=%s" + key
+                    cursor.execute(select_query, (a_id, *key_params))
 
                 elif question['type'] == 'coordinates':
-                    select_query = "DELETE FROM text_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
+                    self.unindex_coordinates(cursor, a_id)
+                    select_query = "DELETE FROM text_answers WHERE answer_id=%s" + key
+                    cursor.execute(select_query, (a_id, *key_params))
 
                 elif question['type'] == 'dropdown':
-                    select_query = "DELETE FROM dropdown_answers WHERE answer_id=%s"
-                    cursor.execute(select_query, (a_id,))
+                    select_query = "DELETE FROM dropdown_answers WHERE answer_id=%s" + key + " RETURNING dropdown_question_option_id"
+                    cursor.execute(select_query, (a_id, *key_params))
+                    options += [row['dropdown_question_option_id'] for row in cursor.fetchall()
+                                if row['dropdown_question_option_id'] is not None]
 
                 elif question['type'] == 'image':
-                    select_query = "DELETE FROM image_answers WHERE answer_id=%s"
+                    select_query = ("SELECT lo_unlink(v.oid) FROM image_answers, LATERAL (VALUES (content_oid), (compact_oid)) v(oid) "
+                                    "WHERE v.oid IS NOT NULL AND answer_id=%s") + key
+                    cursor.execute(select_query, (a_id, *key_params))
+                    select_query = "DELETE FROM image_transcode_queue WHERE answer_id=%s"
                     cursor.execute(select_query, (a_id,))
+                    select_query = "DELETE FROM image_answers WHERE answer_id=%s" + key
+                    cursor.execute(select_query, (a_id, *key_params))
            
-            select_query = "DELETE FROM form_answers WHERE form_submission_id=%s"
+            select_query = "DELETE FROM form_answers WHERE form_submission_id=%s" + key
+            cursor.execute(select_query, (submission_id, *key_params))
+
+            # Document layout: the row itself, plus map points that have no form_answers row
+            select_query = ("SELECT o.dropdown_question_option_id FROM submission_documents d "
+                            "JOIN questions q ON q.form_id = d.form_id "
+                            "JOIN dropdown_question_options o ON o.question_id = q.question_id "
+                            "AND o.dropdown_question_option_id::text = d.answers->>(q.question_id::text) "
+                            "WHERE d.form_submission_id=%s")
             cursor.execute(select_query, (submission_id,))
-
-            select_query = "DELETE FROM form_submissions WHERE form_submission_id=%s"
+            options += [row['dropdown_question_option_id'] for row in cursor.fetchall()]
+            select_query = "DELETE FROM submission_documents WHERE form_submission_id=%s"
             cursor.execute(select_query, (submission_id,))
+            select_query = "SELECT answer_id FROM coordinate_answers WHERE form_submission_id=%s"
+            cursor.execute(select_query, (submission_id,))
+            for point in cursor.fetchall():
+                self.unindex_coordinates(cursor, point['answer_id'])
+
+            select_query = "DELETE FROM form_submissions WHERE form_submission_id=%s" + key
+            cursor.execute(select_query, (submission_id, *key_params))
+
+            self.statements.pipeline(cursor, [('uncount_submission', (form_id, sub['submitted_at'])),
+                                              ('rollup_submission', (form_id, sub['submitted_at'], [0, *options], -1))])
+
+            update_query = ("INSERT INTO form_versions (form_id, delete_count, updated_at) VALUES (%s, 1, now()) "
+                            "ON CONFLICT (form_id) DO UPDATE SET delete_count = form_versions.delete_count + 1, updated_at = now()")
+            cursor.execute(update_query, (form_id,))
+
+            self.notify_form_update(cursor, form_id, submission_id, 'deleted')
             self.connection.commit()
+            self.rollups_pending.set()
 
             cursor.close()
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
@@ -691,8 +1429,8 @@ class Database:
 
         try:
             cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            select_query = "INSERT INTO forms (form_name) VALUES (%s)"
-            cursor.execute(select_query, (form_name,))
+            select_query = "INSERT INTO forms (form_name, storage_mode) SELECT %s, storage_mode FROM forms WHERE form_id=%s"
+            cursor.execute(select_query, (form_name, form_id))
             self.connection.commit()
             select_query = "SELECT * FROM forms WHERE form_name=%s"
             cursor.execute(select_query, (form_name,))
@@ -727,7 +1465,7 @@ class Database:
             return new_form_id
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
@@ -735,43 +1473,44 @@ class Database:
     def add_option(self, question_id, option_text):
         try:
             cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            print(question_id, 'qid')
             q = "SELECT * FROM dropdown_question_options WHERE question_id=%s ORDER BY position DESC LIMIT 1"
             cursor.execute(q, (question_id,))
             pos = int(cursor.fetchone()['position'])+1
 
             q = 'INSERT INTO dropdown_question_options (question_id, dropdown_question_option, position) VALUES (%s, %s, %s)'
             cursor.execute(q, (question_id, option_text, pos))
+
+            q = ("INSERT INTO form_versions (form_id, schema_version, updated_at) SELECT form_id, 1, now() FROM questions WHERE question_id=%s "
+                 "ON CONFLICT (form_id) DO UPDATE SET schema_version = form_versions.schema_version + 1, updated_at = now()")
+            cursor.execute(q, (question_id,))
             self.connection.commit()
             cursor.close()
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return False
 
+    @read_only
     def get_forms(self, user_id):
+        # Forms the user can view, with their counters, in one query
 
         try:
             cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            q = "SELECT * FROM forms_access WHERE user_id=%s AND user_role_id IN (1, 2)"
+            q = ("SELECT f.*, COALESCE(c.submission_count, 0) AS submission_count, c.last_submitted_at, "
+                 "(SELECT COALESCE(sum(h.count), 0) FROM form_hourly_counts h WHERE h.form_id = f.form_id "
+                 "AND h.hour >= date_trunc('hour', LOCALTIMESTAMP - INTERVAL '24 hours')) AS last_day_count "
+                 "FROM forms_access a JOIN forms f ON f.form_id = a.form_id "
+                 "LEFT JOIN form_counters c ON c.form_id = f.form_id "
+                 "WHERE a.user_id=%s AND a.user_role_id IN (1, 2) ORDER BY f.form_id")
             cursor.execute(q, (user_id,))
-            formrows = cursor.fetchall()
-
-            if formrows is None:
-                return []
-            
-            form_ids = [int(row['form_id']) for row in formrows]
-
-            q = 'SELECT * FROM forms WHERE form_id IN %s'
-            cursor.execute(q, (tuple(form_ids),))
             forms = cursor.fetchall()
             cursor.close()
             return forms
 
         except (psycopg2.Error) as error:
-            print(error)
+            logger.exception(error)
             self.connection.close()
             self.reconnect()
             return []
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+import threading
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered HTML fragments, bounded by their total
+    size in UTF-8 bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key, fragment) -> None:
+        # Characters undercount anything outside ASCII, so the size is measured
+        # encoded and kept next to the fragment for eviction
+        cost = len(fragment.encode('utf-8'))
+        if cost > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+            self.entries[key] = (fragment, cost)
+            self.size += cost
+
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def discard(self, key) -> None:
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
@@ -0,0 +1,97 @@
+import math
+import re
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Clusters up to this geohash precision (~1.2 km cells) are kept pre-aggregated
+# in coordinate_clusters. Finer zoom levels group the raw points.
+ROLLUP_PRECISION = 6
+MAX_PRECISION = 12
+
+COORDINATES = re.compile(r'^\s*\(?\s*([-+]?\d+(?:\.\d+)?)\s*[,; ]\s*([-+]?\d+(?:\.\d+)?)\s*\)?\s*$')
+
+
+def parse_coordinates(text):
+    # "lat, lon" as written by the form's locate button, None if unusable
+    if not text:
+        return None
+    match = COORDINATES.match(str(text))
+    if match is None:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def encode(lat, lon, precision=MAX_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            rng[0] = mid
+        else:
+            bits = bits * 2
+            rng[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    # (lat height, lon width) in degrees of one geohash cell
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def precision_for_zoom(zoom, cells_per_tile=4) -> int:
+    # Web map tiles span 360 / 2**zoom degrees of longitude
+    target = 360 / 2 ** zoom / cells_per_tile
+    for precision in range(1, MAX_PRECISION + 1):
+        if cell_size(precision)[1] <= target:
+            return precision
+    return MAX_PRECISION
+
+
+def split_bbox(west, south, east, north):
+    # Boxes crossing the antimeridian become two boxes
+    south, north = max(south, -90), min(north, 90)
+    if east - west >= 360:
+        return [(-180, south, 180, north)]
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180, north), (-180, south, east, north)]
+
+
+def _cells(bbox, precision):
+    west, south, east, north = bbox
+    height, width = cell_size(precision)
+    rows = range(int((south + 90) // height), int(min(north + 90, 180 - 1e-9) // height) + 1)
+    cols = range(int((west + 180) // width), int(min(east + 180, 360 - 1e-9) // width) + 1)
+    return rows, cols, height, width
+
+
+def covering_prefixes(bbox, precision, max_cells=32):
+    # Geohash prefixes that together cover bbox, as coarse as needed to stay
+    # within max_cells. Each prefix is one range scan on a geohash index.
+    for q in range(precision, 0, -1):
+        rows, cols, height, width = _cells(bbox, q)
+        if len(rows) * len(cols) <= max_cells or q == 1:
+            return sorted({encode(-90 + (r + 0.5) * height, -180 + (c + 0.5) * width, q) for r in rows for c in cols})
+    return []
@@ -0,0 +1,27 @@
+# Multi-worker production settings. Every worker imports the app itself
+# (no preload), so each gets its own database pool after the fork. Sessions
+# must be shared between workers, hence SESSION_BACKEND=postgres.
+import multiprocessing
+import os
+
+os.environ.setdefault('SESSION_BACKEND', 'postgres')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+# Each open dashboard event stream holds one of its worker's threads, so at
+# most half of them stream (MAX_EVENT_STREAMS, see live_updates.py) and
+# dashboards beyond that poll. Requests always keep threads to run on.
+worker_class = 'gthread'
+preload_app = False
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# A request holds at most one pooled connection and gives it back when it
+# ends, so the pool needs one per worker thread. The form update listener,
+# replica health check, partition maintenance, rollup compaction and session
+# sweep open connections of their own (Database.dedicated) and need no slots.
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+os.environ.setdefault('MAX_EVENT_STREAMS', str(max(threads // 2, 1)))
@@ -1,10 +1,12 @@
 from functools import wraps
-from flask import Flask, render_template, request, session, send_file, redirect
+from flask import Flask, render_template, request, session, send_file, redirect, make_response, current_app
 from flask_session import Session
-from database_helper import Database
+from werkzeug.local import LocalProxy
 from errors import error
 
-DATABASE = Database()
+# The app's one Database, created by create_app(). Access checks run outside
+# any @read_only call, so they read the primary.
+DATABASE = LocalProxy(lambda: current_app.extensions['database'])
 
 def login_required(f):
 
@@ -23,4 +25,27 @@ def check_access(f):
         if not DATABASE.has_read_access(kwargs['form_id'], session['user_id']):
             return error('No Access')
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+def form_etag(*parts) -> str:
+    # Pages embed the viewer's photo, so the viewer is part of the validator
+    return '-'.join(str(p) for p in (*parts, session['user_id']))
+
+def not_modified(etag, last_modified=None, cache_control='private, no-cache'):
+    # 304 for a matching If-None-Match, None when the page has to be rendered
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = make_response('', 304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+def with_validators(body, etag, last_modified=None, cache_control='private, no-cache'):
+    response = make_response(body)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
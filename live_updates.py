@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+
+import psycopg2
+
+from database_helper import Database, FORM_UPDATES_CHANNEL
+import records
+
+logger = logging.getLogger(__name__)
+
+# Each open stream holds a server thread for as long as the dashboard is open,
+# so only this many per process; dashboards beyond it poll instead
+MAX_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 4))
+
+
+class FormListener:
+    """One LISTEN connection per process, fanning form_updates notifications
+    out to every open dashboard stream of the matching form."""
+
+    def __init__(self, database: Database, queue_size=100, max_streams=MAX_STREAMS) -> None:
+        self.database = database
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def has_room(self) -> bool:
+        with self.lock:
+            return sum(len(clients) for clients in self.subscribers.values()) < self.max_streams
+
+    def subscribe(self, form_id):
+        # None once max_streams streams are open
+        q = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            if sum(len(clients) for clients in self.subscribers.values()) >= self.max_streams:
+                return None
+            self.subscribers.setdefault(int(form_id), set()).add(q)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, form_id, q) -> None:
+        with self.lock:
+            clients = self.subscribers.get(int(form_id))
+            if clients is None:
+                return
+            clients.discard(q)
+            if not clients:
+                del self.subscribers[int(form_id)]
+
+    def is_subscribed(self, form_id, q) -> bool:
+        with self.lock:
+            return q in self.subscribers.get(int(form_id), ())
+
+    def _connect(self):
+        connection = self.database.connect(autocommit=True)
+        cursor = connection.cursor()
+        cursor.execute(f"LISTEN {FORM_UPDATES_CHANNEL};")
+        cursor.close()
+        return connection
+
+    def _run(self) -> None:
+        connection = None
+        while True:
+            try:
+                if connection is None:
+                    connection = self._connect()
+
+                # Blocks in the kernel until Postgres sends something, so an
+                # idle dashboard costs no queries at all.
+                if select.select([connection], [], [], 60) == ([], [], []):
+                    continue
+
+                connection.poll()
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    # Rows are read on the LISTEN connection itself, never
+                    # holding a slot of the request pool
+                    with self.database.dedicated(connection=connection):
+                        self._dispatch(json.loads(notify.payload))
+
+            except (Exception, psycopg2.Error) as error:
+                logger.exception(error)
+                if connection is not None:
+                    connection.close()
+                connection = None
+                threading.Event().wait(5)
+
+    def _dispatch(self, update: dict) -> None:
+        with self.lock:
+            clients = list(self.subscribers.get(update['form_id'], ()))
+        if not clients:
+            return
+
+        event = {'event': update['event'], 'submission_id': update['submission_id']}
+
+        if update['event'] == 'submitted':
+            # Fetched once per process, however many dashboards are watching
+            # Clients load images through /<form_id>/image/<answer_id>
+            row = self.database.get_submission(update['form_id'], update['submission_id'], images=False)
+            if row is None:
+                return
+            event['row'] = row
+
+        message = f"event: {update['event']}\ndata: {records.ENCODER.encode(event).decode()}\n\n"
+        for q in clients:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Client stopped reading, it will resync on reconnect
+                self.unsubscribe(update['form_id'], q)
+
+
+def stream(listener: FormListener, form_id, heartbeat=15):
+    q = listener.subscribe(form_id)
+    if q is None:
+        # Filled up since the route checked. The client reconnects and is
+        # then turned away with a 204.
+        return
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                yield q.get(timeout=heartbeat)
+            except queue.Empty:
+                if not listener.is_subscribed(form_id, q):
+                    return
+                yield ": keep-alive\n\n"
+    finally:
+        listener.unsubscribe(form_id, q)
@@ -0,0 +1,15 @@
+-- Per-form counters used to build cheap HTTP validators (ETag / Last-Modified)
+-- for the dashboard and entry pages without loading any responses.
+
+CREATE TABLE IF NOT EXISTS form_versions (
+    form_id INTEGER PRIMARY KEY REFERENCES forms (form_id) ON DELETE CASCADE,
+    delete_count INTEGER NOT NULL DEFAULT 0,
+    schema_version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- Lets MAX(form_submission_id) / MAX(submitted_at) per form use an index scan
+CREATE INDEX IF NOT EXISTS form_submissions_form_id_submission_id_idx
+    ON form_submissions (form_id, form_submission_id);
+CREATE INDEX IF NOT EXISTS form_submissions_form_id_submitted_at_idx
+    ON form_submissions (form_id, submitted_at);
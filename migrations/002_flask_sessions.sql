@@ -0,0 +1,10 @@
+-- Shared server-side session store (SESSION_BACKEND=postgres), so logins
+-- survive across worker processes.
+
+CREATE TABLE IF NOT EXISTS flask_sessions (
+    session_id VARCHAR(255) PRIMARY KEY,
+    data BYTEA NOT NULL,
+    expiry TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS flask_sessions_expiry_idx ON flask_sessions (expiry);
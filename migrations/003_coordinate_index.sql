@@ -0,0 +1,29 @@
+-- Numeric copies of coordinates answers (the text stays in text_answers),
+-- indexed by geohash so a bounding box becomes a few btree range scans.
+-- COLLATE "C" keeps prefix ranges in plain byte order.
+
+CREATE TABLE IF NOT EXISTS coordinate_answers (
+    answer_id INTEGER PRIMARY KEY REFERENCES form_answers (form_answer_id) ON DELETE CASCADE,
+    form_id INTEGER NOT NULL,
+    form_submission_id INTEGER NOT NULL,
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL,
+    geohash TEXT COLLATE "C" NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS coordinate_answers_form_id_geohash_idx
+    ON coordinate_answers (form_id, geohash);
+
+-- Per-cell counts and coordinate sums for geohash precisions 1..6, kept up to
+-- date by submit_form / delete_entry so zoomed-out maps read at most a few
+-- thousand rows whatever the number of responses.
+
+CREATE TABLE IF NOT EXISTS coordinate_clusters (
+    form_id INTEGER NOT NULL,
+    precision SMALLINT NOT NULL,
+    cell TEXT COLLATE "C" NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    sum_lat DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_lon DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (form_id, precision, cell)
+);
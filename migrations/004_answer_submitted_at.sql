@@ -0,0 +1,39 @@
+-- Answer rows carry their submission's time so that form_submissions and
+-- the answer tables can share one monthly partition key (see partitions.py).
+-- Nullable and without a default, so adding the columns is instant.
+
+ALTER TABLE form_answers ADD COLUMN IF NOT EXISTS submitted_at TIMESTAMP;
+ALTER TABLE text_answers ADD COLUMN IF NOT EXISTS submitted_at TIMESTAMP;
+ALTER TABLE numeric_answers ADD COLUMN IF NOT EXISTS submitted_at TIMESTAMP;
+ALTER TABLE date_answers ADD COLUMN IF NOT EXISTS submitted_at TIMESTAMP;
+ALTER TABLE dropdown_answers ADD COLUMN IF NOT EXISTS submitted_at TIMESTAMP;
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS submitted_at TIMESTAMP;
+
+-- Backfill existing rows from their submission, 10000 answer ids per
+-- transaction so the tables are never locked for long. Rows that already
+-- have a time are skipped, so running this again is cheap. The COMMITs need
+-- psql's default autocommit (no -1 / --single-transaction).
+DO $$
+DECLARE
+    lo BIGINT;
+    last BIGINT;
+BEGIN
+    SELECT min(form_answer_id), max(form_answer_id) INTO lo, last FROM form_answers;
+    WHILE lo <= last LOOP
+        UPDATE form_answers fa SET submitted_at = s.submitted_at FROM form_submissions s
+        WHERE fa.form_submission_id = s.form_submission_id AND fa.submitted_at IS NULL
+          AND fa.form_answer_id >= lo AND fa.form_answer_id < lo + 10000;
+        UPDATE text_answers t SET submitted_at = fa.submitted_at FROM form_answers fa
+        WHERE t.answer_id = fa.form_answer_id AND t.submitted_at IS NULL AND t.answer_id >= lo AND t.answer_id < lo + 10000;
+        UPDATE numeric_answers t SET submitted_at = fa.submitted_at FROM form_answers fa
+        WHERE t.answer_id = fa.form_answer_id AND t.submitted_at IS NULL AND t.answer_id >= lo AND t.answer_id < lo + 10000;
+        UPDATE date_answers t SET submitted_at = fa.submitted_at FROM form_answers fa
+        WHERE t.answer_id = fa.form_answer_id AND t.submitted_at IS NULL AND t.answer_id >= lo AND t.answer_id < lo + 10000;
+        UPDATE dropdown_answers t SET submitted_at = fa.submitted_at FROM form_answers fa
+        WHERE t.answer_id = fa.form_answer_id AND t.submitted_at IS NULL AND t.answer_id >= lo AND t.answer_id < lo + 10000;
+        UPDATE image_answers t SET submitted_at = fa.submitted_at FROM form_answers fa
+        WHERE t.answer_id = fa.form_answer_id AND t.submitted_at IS NULL AND t.answer_id >= lo AND t.answer_id < lo + 10000;
+        COMMIT;
+        lo := lo + 10000;
+    END LOOP;
+END $$;
@@ -0,0 +1,22 @@
+-- Per-form choice between the typed answer tables ('eav') and one JSONB
+-- document per submission ('document'). See storage.py for moving a form
+-- between the two.
+
+ALTER TABLE forms ADD COLUMN IF NOT EXISTS storage_mode TEXT NOT NULL DEFAULT 'eav'
+    CHECK (storage_mode IN ('eav', 'document'));
+
+-- Keys are question ids. Images stay in image_answers and are referenced
+-- as {"image": answer_id}; dropdowns hold the option id.
+CREATE TABLE IF NOT EXISTS submission_documents (
+    form_submission_id INTEGER PRIMARY KEY,
+    form_id INTEGER NOT NULL REFERENCES forms (form_id),
+    answers JSONB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS submission_documents_form_id_idx ON submission_documents (form_id);
+CREATE INDEX IF NOT EXISTS submission_documents_answers_idx ON submission_documents USING GIN (answers jsonb_path_ops);
+
+-- Map points of document submissions have no form_answers row to point at
+ALTER TABLE coordinate_answers DROP CONSTRAINT IF EXISTS coordinate_answers_answer_id_fkey;
+
+CREATE INDEX IF NOT EXISTS coordinate_answers_form_submission_id_idx ON coordinate_answers (form_submission_id);
@@ -0,0 +1,27 @@
+-- Per-form submission totals for the home page, kept up to date by
+-- submit_form / delete_entry instead of counting form_submissions.
+
+CREATE TABLE IF NOT EXISTS form_counters (
+    form_id INTEGER PRIMARY KEY REFERENCES forms (form_id) ON DELETE CASCADE,
+    submission_count BIGINT NOT NULL DEFAULT 0,
+    last_submitted_at TIMESTAMP
+);
+
+-- Submissions per hour, enough to sum the last 24 hours. Hours older than a
+-- day are deleted as new submissions come in.
+CREATE TABLE IF NOT EXISTS form_hourly_counts (
+    form_id INTEGER NOT NULL REFERENCES forms (form_id) ON DELETE CASCADE,
+    hour TIMESTAMP NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (form_id, hour)
+);
+
+INSERT INTO form_counters (form_id, submission_count, last_submitted_at)
+SELECT form_id, count(*), max(submitted_at) FROM form_submissions GROUP BY form_id
+ON CONFLICT (form_id) DO NOTHING;
+
+INSERT INTO form_hourly_counts (form_id, hour, count)
+SELECT form_id, date_trunc('hour', submitted_at), count(*) FROM form_submissions
+WHERE submitted_at >= date_trunc('hour', LOCALTIMESTAMP - INTERVAL '24 hours')
+GROUP BY 1, 2
+ON CONFLICT (form_id, hour) DO NOTHING;
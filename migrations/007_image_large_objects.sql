@@ -0,0 +1,8 @@
+-- Uploaded images are streamed into large objects instead of a bytea
+-- parameter. Rows written before keep their bytes in answer.
+
+ALTER TABLE image_answers ALTER COLUMN answer DROP NOT NULL;
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS content_oid OID;
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS mime_type TEXT;
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS size BIGINT;
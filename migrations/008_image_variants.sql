@@ -0,0 +1,23 @@
+-- Compact WebP copies made by transcoder.py. get_image and the dashboard
+-- serve these when present, the original columns stay as uploaded (unless
+-- IMAGE_KEEP_ORIGINAL=0).
+
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS compact_oid OID;
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS compact_mime_type TEXT;
+ALTER TABLE image_answers ADD COLUMN IF NOT EXISTS compact_size BIGINT;
+
+-- Images waiting to be transcoded. Failed attempts are retried with backoff.
+CREATE TABLE IF NOT EXISTS image_transcode_queue (
+    answer_id INTEGER PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),
+    last_error TEXT,
+    enqueued_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS image_transcode_queue_next_attempt_at_idx ON image_transcode_queue (next_attempt_at);
+
+-- Everything uploaded so far is the initial backlog
+INSERT INTO image_transcode_queue (answer_id)
+SELECT answer_id FROM image_answers WHERE compact_oid IS NULL
+ON CONFLICT (answer_id) DO NOTHING;
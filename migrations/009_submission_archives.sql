@@ -0,0 +1,32 @@
+-- Per-form retention: submissions older than archive_after_days are moved
+-- out of the live tables into Parquet files by retention.py.
+
+CREATE TABLE IF NOT EXISTS form_retention_policies (
+    form_id INTEGER PRIMARY KEY REFERENCES forms (form_id) ON DELETE CASCADE,
+    archive_after_days INTEGER NOT NULL CHECK (archive_after_days > 0),
+    last_run_at TIMESTAMP
+);
+
+-- One row per archive, a batch of one form's submissions. Paths are relative
+-- to ARCHIVE_DIR. images_path is NULL when the batch had no images.
+CREATE TABLE IF NOT EXISTS submission_archives (
+    archive_id SERIAL PRIMARY KEY,
+    form_id INTEGER NOT NULL REFERENCES forms (form_id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    images_path TEXT,
+    submission_count INTEGER NOT NULL,
+    first_submission_id INTEGER NOT NULL,
+    last_submission_id INTEGER NOT NULL,
+    first_submitted_at TIMESTAMP NOT NULL,
+    last_submitted_at TIMESTAMP NOT NULL,
+    first_image_id INTEGER,
+    last_image_id INTEGER,
+    bytes BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS submission_archives_form_id_idx ON submission_archives (form_id, last_submitted_at);
+
+-- Archiving deletes submissions in bulk, each checked against form_answers'
+-- foreign key. Same name as the index partitions.py creates.
+CREATE INDEX IF NOT EXISTS form_answers_form_submission_id_question_id_idx ON form_answers (form_submission_id, question_id);
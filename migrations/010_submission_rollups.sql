@@ -0,0 +1,47 @@
+-- Submissions per hour, day and week for the dashboard chart, overall
+-- (option_id 0) and per dropdown option. submit_form / delete_entry append
+-- +1 / -1 rows to submission_rollup_deltas, rollups.py folds them in.
+
+CREATE TABLE IF NOT EXISTS submission_rollups (
+    form_id INTEGER NOT NULL REFERENCES forms (form_id) ON DELETE CASCADE,
+    bucket TEXT NOT NULL CHECK (bucket IN ('hour', 'day', 'week')),
+    option_id INTEGER NOT NULL DEFAULT 0,
+    period_start TIMESTAMP NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (form_id, bucket, option_id, period_start)
+);
+
+-- Append-only, so concurrent submissions never wait on each other's rows
+CREATE TABLE IF NOT EXISTS submission_rollup_deltas (
+    form_id INTEGER NOT NULL REFERENCES forms (form_id) ON DELETE CASCADE,
+    hour TIMESTAMP NOT NULL,
+    option_id INTEGER NOT NULL DEFAULT 0,
+    delta SMALLINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS submission_rollup_deltas_form_id_idx ON submission_rollup_deltas (form_id, hour);
+
+-- Existing submissions. Hourly rows only for the last 31 days, as
+-- rollups.HOURLY_DAYS keeps them.
+WITH counted AS (
+    SELECT form_id, submitted_at, 0 AS option_id FROM form_submissions
+    UNION ALL
+    SELECT s.form_id, s.submitted_at, dd.dropdown_question_option_id
+    FROM dropdown_answers dd
+    JOIN form_answers fa ON fa.form_answer_id = dd.answer_id
+    JOIN form_submissions s ON s.form_submission_id = fa.form_submission_id
+    WHERE dd.dropdown_question_option_id IS NOT NULL
+    UNION ALL
+    SELECT s.form_id, s.submitted_at, o.dropdown_question_option_id
+    FROM submission_documents d
+    JOIN form_submissions s ON s.form_submission_id = d.form_submission_id
+    JOIN questions q ON q.form_id = d.form_id
+    JOIN dropdown_question_options o ON o.question_id = q.question_id
+        AND o.dropdown_question_option_id::text = d.answers->>(q.question_id::text)
+)
+INSERT INTO submission_rollups (form_id, bucket, option_id, period_start, count)
+SELECT form_id, b.bucket, option_id, date_trunc(b.bucket, submitted_at), count(*)
+FROM counted, (VALUES ('hour'), ('day'), ('week')) b (bucket)
+WHERE b.bucket <> 'hour' OR submitted_at >= date_trunc('hour', LOCALTIMESTAMP - INTERVAL '31 days')
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (form_id, bucket, option_id, period_start) DO NOTHING;
@@ -0,0 +1,265 @@
+"""Optional monthly range partitioning of form_submissions and its answer
+tables on submitted_at.
+
+    flask partition-tables          one-time conversion of the existing tables
+    flask create-partitions         make sure the coming months exist
+    flask detach-month 2023-01      take a month out of the live tables
+
+A running app keeps partitions created ahead of time by itself, see
+start_maintenance().
+"""
+import datetime
+import logging
+import threading
+
+import psycopg2
+
+import geo
+from database_helper import Database
+from errors import AppError
+
+logger = logging.getLogger(__name__)
+
+# (table, id column, secondary indexes). Parents come before children.
+TABLES = [
+    ('form_submissions', 'form_submission_id', ['(form_id, submitted_at)', '(form_id, form_submission_id)']),
+    ('form_answers', 'form_answer_id', ['(form_submission_id, question_id)']),
+    ('text_answers', 'answer_id', []),
+    ('numeric_answers', 'answer_id', []),
+    ('date_answers', 'answer_id', []),
+    ('dropdown_answers', 'answer_id', []),
+    ('image_answers', 'answer_id', []),
+]
+
+ARCHIVE_SCHEMA = 'archive'
+
+
+def month_start(day) -> datetime.date:
+    return datetime.date(day.year, day.month, 1)
+
+
+def add_months(month, n) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month) -> str:
+    return f'{table}_y{month:%Y}m{month:%m}'
+
+
+def _create_month(cursor, month) -> None:
+    for table, _, _ in TABLES:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+                       "FOR VALUES FROM (%s) TO (%s)", (month, add_months(month, 1)))
+
+
+def create_partitions(db: Database, months_ahead=3) -> int:
+    # Current month plus months_ahead, so inserts never land in the default partition
+    if not db.partitioned:
+        return 0
+
+    connection = db.connection
+    cursor = connection.cursor()
+    created = 0
+    this_month = month_start(datetime.date.today())
+
+    for n in range(months_ahead + 1):
+        try:
+            _create_month(cursor, add_months(this_month, n))
+            connection.commit()
+            created += 1
+        except (psycopg2.Error) as error:
+            # Usually another worker creating the same month at the same time
+            logger.warning(error)
+            connection.rollback()
+
+    cursor.close()
+    return created
+
+
+def convert(db: Database, months_ahead=3) -> bool:
+    """Rebuilds the seven tables as partitioned tables in one transaction.
+    The old tables are kept as <table>_unpartitioned until dropped by hand.
+    Raises AppError, changing nothing, if some row has no submitted_at."""
+    if db.partitioned:
+        return False
+
+    connection = db.connection
+    cursor = connection.cursor()
+    try:
+        # Backfill the partition key onto answer rows written before migration 004
+        cursor.execute("UPDATE form_answers fa SET submitted_at = fs.submitted_at FROM form_submissions fs "
+                       "WHERE fa.form_submission_id = fs.form_submission_id AND fa.submitted_at IS NULL")
+        for table, _, _ in TABLES[2:]:
+            cursor.execute(f"UPDATE {table} t SET submitted_at = fa.submitted_at FROM form_answers fa "
+                           "WHERE t.answer_id = fa.form_answer_id AND t.submitted_at IS NULL")
+
+        # Whatever is still NULL belongs to no submission. Such rows can not be
+        # placed in a month, so stop rather than leave them behind.
+        unkeyed = []
+        for table, _, _ in TABLES:
+            cursor.execute(f"SELECT count(*) FROM {table} WHERE submitted_at IS NULL")
+            count = cursor.fetchone()[0]
+            if count:
+                unkeyed.append(f'{table}: {count}')
+        if unkeyed:
+            connection.rollback()
+            raise AppError('Rows without submitted_at, not partitioned (' + ', '.join(unkeyed) + '). '
+                           'Set submitted_at on them or delete them, then run this again.')
+
+        cursor.execute("SELECT min(submitted_at) FROM form_submissions")
+        first = cursor.fetchone()[0] or datetime.date.today()
+
+        # A foreign key into a partitioned table would make detaching a month
+        # scan the referencing rows, so answer tables only reference by value
+        cursor.execute("ALTER TABLE coordinate_answers DROP CONSTRAINT IF EXISTS coordinate_answers_answer_id_fkey")
+
+        for table, id_column, indexes in TABLES:
+            old = f'{table}_unpartitioned'
+            cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, id_column))
+            sequence = cursor.fetchone()[0]
+
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+            cursor.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (submitted_at)")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN submitted_at SET NOT NULL")
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_part_pkey PRIMARY KEY ({id_column}, submitted_at)")
+            for columns in indexes:
+                cursor.execute(f"CREATE INDEX ON {table} {columns}")
+            if sequence is not None:
+                # Keep ids increasing from where the old table left off
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.{id_column}")
+            cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        month = month_start(first)
+        last = add_months(month_start(datetime.date.today()), months_ahead)
+        while month <= last:
+            _create_month(cursor, month)
+            month = add_months(month, 1)
+
+        for table, _, _ in TABLES:
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned")
+
+        connection.commit()
+        cursor.close()
+        db._partitioned = True
+        return True
+
+    except (psycopg2.Error) as error:
+        logger.exception(error)
+        connection.rollback()
+        return False
+
+
+def detach_month(db: Database, month, drop=False) -> bool:
+    """Takes one month out of the live tables without deleting row by row.
+    The partitions move to the archive schema, or are dropped."""
+    month = month_start(month)
+    if not db.partitioned or month >= month_start(datetime.date.today()):
+        return False
+
+    connection = db.connection
+    cursor = connection.cursor()
+    submissions = partition_name('form_submissions', month)
+    try:
+        cursor.execute("SELECT to_regclass(%s)", (submissions,))
+        if cursor.fetchone()[0] is None:
+            return False
+
+        # Map points of the month leave the spatial index and its rollups
+        cursor.execute("CREATE TEMP TABLE detached_points (form_id INTEGER, lat DOUBLE PRECISION, "
+                       "lon DOUBLE PRECISION, geohash TEXT COLLATE \"C\") ON COMMIT DROP")
+        cursor.execute("WITH gone AS (DELETE FROM coordinate_answers ca USING " + submissions + " s "
+                       "WHERE ca.form_submission_id = s.form_submission_id RETURNING ca.form_id, ca.lat, ca.lon, ca.geohash) "
+                       "INSERT INTO detached_points SELECT * FROM gone")
+        for p in range(1, geo.ROLLUP_PRECISION + 1):
+            cursor.execute("UPDATE coordinate_clusters c SET count = c.count - g.n, sum_lat = c.sum_lat - g.lat, sum_lon = c.sum_lon - g.lon "
+                           "FROM (SELECT form_id, left(geohash, %s) AS cell, count(*) AS n, sum(lat) AS lat, sum(lon) AS lon "
+                           "FROM detached_points GROUP BY 1, 2) g "
+                           "WHERE c.form_id = g.form_id AND c.precision = %s AND c.cell = g.cell", (p, p))
+
+        # Chart rollups, -1 per submission and per dropdown option chosen, as
+        # delete_entry does. Read before the documents go.
+        answers, dropdowns = partition_name('form_answers', month), partition_name('dropdown_answers', month)
+        cursor.execute("INSERT INTO submission_rollup_deltas (form_id, hour, option_id, delta) "
+                       "SELECT form_id, hour, option_id, -count(*) FROM ("
+                       f"SELECT s.form_id, date_trunc('hour', s.submitted_at) AS hour, 0 AS option_id FROM {submissions} s "
+                       f"UNION ALL SELECT s.form_id, date_trunc('hour', s.submitted_at), d.dropdown_question_option_id FROM {submissions} s "
+                       f"JOIN {answers} fa ON fa.form_submission_id = s.form_submission_id "
+                       f"JOIN {dropdowns} d ON d.answer_id = fa.form_answer_id WHERE d.dropdown_question_option_id IS NOT NULL "
+                       f"UNION ALL SELECT s.form_id, date_trunc('hour', s.submitted_at), o.dropdown_question_option_id FROM {submissions} s "
+                       "JOIN submission_documents d ON d.form_submission_id = s.form_submission_id "
+                       "JOIN questions q ON q.form_id = d.form_id "
+                       "JOIN dropdown_question_options o ON o.question_id = q.question_id "
+                       "AND o.dropdown_question_option_id::text = d.answers->>(q.question_id::text)"
+                       ") g GROUP BY 1, 2, 3")
+
+        # Documents of the month go with it, they are not partitioned
+        cursor.execute("DELETE FROM submission_documents d USING " + submissions + " s "
+                       "WHERE d.form_submission_id = s.form_submission_id")
+
+        # Home page counters
+        cursor.execute("UPDATE form_counters c SET submission_count = GREATEST(c.submission_count - g.n, 0) "
+                       f"FROM (SELECT form_id, count(*) AS n FROM {submissions} GROUP BY form_id) g WHERE c.form_id = g.form_id")
+        cursor.execute("UPDATE form_hourly_counts h SET count = GREATEST(h.count - g.n, 0) "
+                       f"FROM (SELECT form_id, date_trunc('hour', submitted_at) AS hour, count(*) AS n FROM {submissions} GROUP BY 1, 2) g "
+                       "WHERE h.form_id = g.form_id AND h.hour = g.hour")
+
+        # Dashboards of these forms are no longer current
+        cursor.execute("INSERT INTO form_versions (form_id, delete_count, updated_at) "
+                       f"SELECT DISTINCT form_id, 1, now() FROM {submissions} "
+                       "ON CONFLICT (form_id) DO UPDATE SET delete_count = form_versions.delete_count + 1, updated_at = now()")
+
+        if not drop:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+
+        for table, _, _ in reversed(TABLES):
+            partition = partition_name(table, month)
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+            if drop:
+                if table == 'image_answers':
+                    cursor.execute(f"SELECT lo_unlink(v.oid) FROM {partition}, LATERAL (VALUES (content_oid), (compact_oid)) v(oid) "
+                                   "WHERE v.oid IS NOT NULL")
+                cursor.execute(f"DROP TABLE {partition}")
+            else:
+                cursor.execute(f"ALTER TABLE {partition} SET SCHEMA {ARCHIVE_SCHEMA}")
+
+        # Forms whose latest submission was in the detached month
+        cursor.execute("UPDATE form_counters c SET last_submitted_at = "
+                       "(SELECT max(submitted_at) FROM form_submissions s WHERE s.form_id = c.form_id) "
+                       "WHERE c.last_submitted_at < %s", (add_months(month, 1),))
+
+        connection.commit()
+        db.rollups_pending.set()
+        cursor.close()
+        return True
+
+    except (psycopg2.Error) as error:
+        logger.exception(error)
+        connection.rollback()
+        return False
+
+
+def start_maintenance(db: Database, months_ahead=3, interval=12 * 60 * 60) -> threading.Thread:
+    # Each run opens a connection of its own and closes it again. The thread
+    # ends as soon as it finds the tables unpartitioned, so processes started
+    # before `flask partition-tables` need a restart to pick it up. Checking
+    # here rather than in create_app keeps booting free of queries.
+    def run():
+        while True:
+            wait = interval
+            try:
+                with db.dedicated():
+                    # Picks up a conversion done by another process
+                    db._partitioned = None
+                    if not db.partitioned:
+                        return
+                    create_partitions(db, months_ahead)
+            except (Exception, psycopg2.Error) as error:
+                logger.exception(error)
+                # Usually the database not being up yet
+                wait = min(interval, 60)
+            threading.Event().wait(wait)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,216 @@
+"""Opt-in sampling profiler for single requests.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>`, or at
+random with probability PROFILE_SAMPLE_RATE. A background thread samples the
+request thread's stack every PROFILE_INTERVAL seconds. When the request ends,
+two files are written to PROFILE_DIR (the oldest beyond PROFILE_KEEP are
+removed):
+
+    <id>.collapsed   one "frame;frame;frame count" line per stack, for
+                     flamegraph.pl or speedscope
+    <id>.json        route, form_id, status, duration, statement count and
+                     time per Database method and per template
+
+The id is returned in the X-Profile-Id response header. Unprofiled requests
+cost one comparison; statements are counted by CountingConnection on every
+connection, one increment per execute.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+import psycopg2.extensions
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.001))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+
+_counts = threading.local()
+_counting_factories = {}
+
+
+def query_count() -> int:
+    # Statements executed by this thread so far
+    return getattr(_counts, 'queries', 0)
+
+
+def _counting(factory):
+    # Subclass of a cursor class that counts execute calls
+    if factory not in _counting_factories:
+        def execute(self, query, vars=None):
+            _counts.queries = getattr(_counts, 'queries', 0) + 1
+            return factory.execute(self, query, vars)
+
+        def executemany(self, query, vars_list):
+            _counts.queries = getattr(_counts, 'queries', 0) + 1
+            return factory.executemany(self, query, vars_list)
+
+        _counting_factories[factory] = type(f'Counting{factory.__name__}', (factory,),
+                                            {'execute': execute, 'executemany': executemany})
+    return _counting_factories[factory]
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    # connection_factory for the pools, whatever cursor_factory callers ask for
+
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = _counting(kwargs.get('cursor_factory') or self.cursor_factory
+                                             or psycopg2.extensions.cursor)
+        return super().cursor(*args, **kwargs)
+
+
+def _label(code):
+    return f'{os.path.basename(code.co_filename)}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+class Sampler:
+    """Samples one thread's stack from a background thread until stopped."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        # Samples per outermost Database method and per template file
+        self.database = {}
+        self.templates = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _record(self, frame) -> None:
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+
+        stack = ';'.join(_label(code) for code in codes)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+        method = next((c for c in codes if c.co_filename.endswith('database_helper.py')
+                       and getattr(c, 'co_qualname', '').startswith('Database.')), None)
+        if method is not None:
+            name = method.co_qualname.split('.')[1]
+            self.database[name] = self.database.get(name, 0) + 1
+        # Compiled templates keep the template's file name, loading and
+        # compiling them shows up as jinja2 itself
+        template = next((c for c in codes if c.co_filename.endswith('.html')), None)
+        if template is not None:
+            name = os.path.basename(template.co_filename)
+        elif any(f'{os.sep}jinja2{os.sep}' in c.co_filename for c in codes):
+            name = 'jinja2'
+        else:
+            return
+        self.templates[name] = self.templates.get(name, 0) + 1
+
+
+def _wanted() -> bool:
+    header = request.headers.get('X-Profile')
+    if header and PROFILE_TOKEN and hmac.compare_digest(header, PROFILE_TOKEN):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _start() -> None:
+    if not _wanted():
+        return
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    g.profile = {
+        'id': f'{time.strftime("%Y%m%d-%H%M%S")}-{re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"}-{uuid.uuid4().hex[:6]}',
+        'sampler': Sampler(threading.get_ident()),
+        'started': time.perf_counter(),
+        'queries': query_count(),
+        'route': route,
+    }
+    g.profile['sampler'].start()
+
+
+def _tag(response):
+    profile = g.get('profile')
+    if profile is not None:
+        profile['status'] = response.status_code
+        response.headers['X-Profile-Id'] = profile['id']
+    return response
+
+
+def _finish(exc) -> None:
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    sampler = profile['sampler']
+    sampler.stop()
+    duration = time.perf_counter() - profile['started']
+    # Each sample stands for an equal share of the request's wall time
+    per_sample = duration / sampler.samples if sampler.samples else 0
+
+    summary = {
+        'id': profile['id'],
+        'method': request.method,
+        'route': profile['route'],
+        'path': request.path,
+        'form_id': (request.view_args or {}).get('form_id'),
+        'status': profile.get('status', 500 if exc is not None else None),
+        'error': repr(exc) if exc is not None else None,
+        'duration_ms': round(duration * 1000, 2),
+        'queries': query_count() - profile['queries'],
+        'samples': sampler.samples,
+        'database_ms': {k: round(v * per_sample * 1000, 2) for k, v in sorted(sampler.database.items(), key=lambda i: -i[1])},
+        'templates_ms': {k: round(v * per_sample * 1000, 2) for k, v in sorted(sampler.templates.items(), key=lambda i: -i[1])},
+    }
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, profile['id'])
+        with open(path + '.collapsed', 'w') as file:
+            file.writelines(f'{stack} {count}\n' for stack, count in sampler.stacks.items())
+        with open(path + '.json', 'w') as file:
+            json.dump(summary, file, indent=2, default=str)
+        _rotate()
+    except OSError as error:
+        logger.exception(error)
+
+
+def _rotate() -> None:
+    profiles = sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith('.json')),
+                      key=lambda f: os.path.getmtime(os.path.join(PROFILE_DIR, f)))
+    for name in profiles[:max(0, len(profiles) - PROFILE_KEEP)]:
+        for suffix in ('.json', '.collapsed'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-len('.json')] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def init_app(app) -> None:
+    if not PROFILE_TOKEN and PROFILE_SAMPLE_RATE <= 0:
+        # Nothing can turn profiling on, leave the request path untouched
+        return
+    app.before_request(_start)
+    app.after_request(_tag)
+    app.teardown_request(_finish)
@@ -0,0 +1,43 @@
+"""Compact records for form responses.
+
+A form's questions are read once, as Question structs shared by every row.
+A Response holds one value per question, in question order:
+
+    None                        not answered
+    str, Decimal or date        the answer as stored, dropdowns as the option text
+    Image                       answer_id, plus the bytes when they were loaded
+
+Responses and images are array_like and not tracked by the garbage collector,
+so a row costs one small object plus its values instead of a dict per cell.
+ENCODER writes them to JSON directly: a Response as [submission_id, [values]],
+an Image as [answer_id, base64 or null].
+"""
+import base64
+from typing import Optional
+
+import msgspec
+
+
+class Question(msgspec.Struct, frozen=True, gc=False):
+    question_id: int
+    text: str
+    type: str
+    form_id: int
+
+
+class Image(msgspec.Struct, array_like=True, gc=False):
+    answer_id: int
+    data: Optional[bytes] = None
+
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode('ascii') if self.data is not None else ''
+
+
+class Response(msgspec.Struct, array_like=True, gc=False):
+    submission_id: int
+    # None when the caller already had the row rendered (is_cached)
+    answers: Optional[list] = None
+
+
+# Decimals and dates come out as strings
+ENCODER = msgspec.json.Encoder()
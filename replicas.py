@@ -0,0 +1,151 @@
+import logging
+import random
+import threading
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+from profiling import CountingConnection
+
+logger = logging.getLogger(__name__)
+
+
+def parse_lsn(lsn):
+    # '16/B374D848' -> int, so positions compare with <
+    if not lsn:
+        return None
+    high, low = str(lsn).split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class Replica:
+
+    def __init__(self, dsn) -> None:
+        self.dsn = dsn
+        self.pool = None
+        self.healthy = False
+        self.lag = None
+        # Replayed WAL position as of the last check, None for a server
+        # that is not a streaming standby
+        self.replay_lsn = None
+
+
+class ReplicaSet:
+    """Read replicas of the primary Database, checked every `check_interval`
+    seconds. A replica serves reads while it answers and is at most
+    `max_lag` seconds behind the primary."""
+
+    def __init__(self, primary, dsns, pool_size=10, max_lag=5.0, check_interval=2.0) -> None:
+        self.primary = primary
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self.pool_size = pool_size
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        # The health thread's own autocommit connection to the primary, so it
+        # neither holds a pool slot nor sits idle in a transaction
+        self.primary_connection = None
+
+        threading.Thread(target=self._check_forever, daemon=True).start()
+
+    def _check_forever(self) -> None:
+        while True:
+            try:
+                self.check()
+            except (Exception, psycopg2.Error) as error:
+                logger.exception(error)
+            threading.Event().wait(self.check_interval)
+
+    def _primary_lsn(self):
+        try:
+            if self.primary_connection is None or self.primary_connection.closed:
+                self.primary_connection = self.primary.connect(autocommit=True)
+            cursor = self.primary_connection.cursor()
+            cursor.execute("SELECT pg_current_wal_lsn()::text")
+            lsn = parse_lsn(cursor.fetchone()[0])
+            cursor.close()
+            return lsn
+
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            if self.primary_connection is not None:
+                self.primary_connection.close()
+            self.primary_connection = None
+            return None
+
+    def check(self) -> None:
+        primary_lsn = self._primary_lsn()
+        for replica in self.replicas:
+            self._check(replica, primary_lsn)
+
+    def _check(self, replica, primary_lsn) -> None:
+        try:
+            if replica.pool is None:
+                replica.pool = ThreadedConnectionPool(1, self.pool_size, replica.dsn, connect_timeout=3,
+                                                      connection_factory=CountingConnection)
+
+            connection = self.getconn(replica, key='health')
+            cursor = connection.cursor()
+            cursor.execute("SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text, "
+                           "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())")
+            in_recovery, replay_lsn, behind = cursor.fetchone()
+            cursor.close()
+
+            if not in_recovery:
+                replica.replay_lsn, replica.lag = None, 0
+            else:
+                replica.replay_lsn = parse_lsn(replay_lsn)
+                # The replay timestamp only moves when something is replayed, so a
+                # standby that has replayed everything is not behind however old it is
+                caught_up = primary_lsn is not None and replica.replay_lsn is not None and replica.replay_lsn >= primary_lsn
+                replica.lag = 0 if caught_up else float(behind or 0)
+
+            replica.healthy = replica.lag <= self.max_lag
+
+        except (Exception, psycopg2.Error) as error:
+            logger.warning('replica %s: %s', replica.dsn, error)
+            self.mark_down(replica, key='health')
+
+    def getconn(self, replica, key=None):
+        connection = replica.pool.getconn(key=key or threading.get_ident())
+        if not connection.autocommit:
+            # No transaction left open on the standby between queries
+            connection.autocommit = True
+        return connection
+
+    def release(self, key=None) -> None:
+        # Gives the thread's replica connections back at the end of a request
+        key = key or threading.get_ident()
+        for replica in self.replicas:
+            try:
+                if replica.pool is not None and key in replica.pool._used:
+                    replica.pool.putconn(replica.pool._used[key], key=key)
+            except (Exception, psycopg2.Error) as error:
+                logger.exception(error)
+
+    def mark_down(self, replica, key=None) -> None:
+        # Back in rotation once a health check passes again
+        replica.healthy = False
+        key = key or threading.get_ident()
+        try:
+            if replica.pool is not None and key in replica.pool._used:
+                replica.pool.putconn(replica.pool._used[key], key=key, close=True)
+        except (Exception, psycopg2.Error) as error:
+            logger.exception(error)
+
+    def choose(self, min_lsn=None, pinned=None):
+        # A healthy replica that has replayed min_lsn, preferring `pinned`.
+        # None means read from the primary.
+        candidates = [r for r in self.replicas if r.healthy and
+                      (min_lsn is None or r.replay_lsn is None or r.replay_lsn >= min_lsn)]
+        if not candidates:
+            return None
+        if pinned in candidates:
+            return pinned
+        return random.choice(candidates)
+
+    def close(self) -> None:
+        if self.primary_connection is not None:
+            self.primary_connection.close()
+        for replica in self.replicas:
+            if replica.pool is not None:
+                replica.pool.closeall()
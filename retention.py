@@ -0,0 +1,353 @@
+"""Per-form retention: old submissions move out of the database into
+compressed Parquet files on local disk.
+
+    flask retention 12 365                      archive form 12's submissions after a year
+    flask archive-submissions --interval 3600   apply every policy, once an hour
+
+Each chunk of a form's oldest submissions past its policy is written to
+ARCHIVE_DIR/form-<id>/ as
+
+    <archive_id>.submissions.parquet   one row per submission, the answers as a
+                                       JSON object in the submission_documents format
+    <archive_id>.images.parquet        image bytes, original and compact copy
+
+and deleted from the live tables in the transaction that records the files in
+submission_archives. The files are renamed into place just before the commit
+and removed again if it fails, so a chunk is either live or archived.
+
+Reads fall back to the archives (see Database.get_all_responses and friends),
+so ARCHIVE_DIR has to be the same directory for every worker. The map index
+and the home page counters keep archived submissions; deleting single
+archived entries is not supported.
+"""
+import json
+import logging
+import os
+import time
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import uploads
+from database_helper import Database, PERIOD_STARTS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+COMPRESSION = os.environ.get('ARCHIVE_COMPRESSION', 'zstd')
+
+# Images per Parquet row group, bounds memory while writing and reading
+IMAGE_ROW_GROUP = 64
+# Advisory lock namespace, one archiver per form at a time
+LOCK_KEY = 8401
+
+ANSWER_TABLES = ['text_answers', 'numeric_answers', 'date_answers', 'dropdown_answers', 'image_answers']
+
+
+def _schemas():
+    import pyarrow as pa
+    submissions = pa.schema([('form_submission_id', pa.int64()), ('user_id', pa.int64()),
+                             ('submitted_at', pa.timestamp('us')), ('answers', pa.string())])
+    images = pa.schema([('answer_id', pa.int64()), ('form_submission_id', pa.int64()), ('question_id', pa.int64()),
+                        ('submitted_at', pa.timestamp('us')), ('mime_type', pa.string()), ('data', pa.binary()),
+                        ('compact_mime_type', pa.string()), ('compact', pa.binary())])
+    return submissions, images
+
+
+def set_policy(db: Database, form_id, days) -> bool:
+    # days=0 removes the policy, already archived submissions stay archived
+    connection = db.connection
+    try:
+        cursor = connection.cursor()
+        if days:
+            cursor.execute("INSERT INTO form_retention_policies (form_id, archive_after_days) VALUES (%s, %s) "
+                           "ON CONFLICT (form_id) DO UPDATE SET archive_after_days = EXCLUDED.archive_after_days",
+                           (form_id, days))
+        else:
+            cursor.execute("DELETE FROM form_retention_policies WHERE form_id=%s", (form_id,))
+        connection.commit()
+        cursor.close()
+        return True
+
+    except (psycopg2.Error) as error:
+        logger.exception(error)
+        connection.rollback()
+        return False
+
+
+def _document(questions, rows) -> dict:
+    # submission_documents answers from EAV rows, as _write_document stores them
+    document = {}
+    for row in rows:
+        kind = questions.get(row['question_id'])
+        key = str(row['question_id'])
+        if kind is None or key in document:
+            continue
+        if kind == 'image':
+            document[key] = {'image': row['form_answer_id']}
+        elif kind == 'numeric':
+            document[key] = str(row['numeric']) if row['numeric'] is not None else None
+        elif kind == 'date':
+            document[key] = str(row['date']) if row['date'] is not None else None
+        elif kind == 'dropdown':
+            document[key] = row['option']
+        else:
+            document[key] = row['text']
+    return document
+
+
+def _write_images(connection, path, image_ids) -> tuple:
+    # Streams the images through a server-side cursor, one row group at a
+    # time. Returns the large objects to unlink.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schemas()[1]
+    oids = []
+    cursor = connection.cursor(f'archive_images_{os.getpid()}', cursor_factory=RealDictCursor)
+    cursor.itersize = IMAGE_ROW_GROUP
+    cursor.execute("SELECT i.answer_id, fa.form_submission_id, fa.question_id, s.submitted_at, i.mime_type, "
+                   "COALESCE(i.answer, lo_get(i.content_oid)) AS data, i.compact_mime_type, lo_get(i.compact_oid) AS compact, "
+                   "i.content_oid, i.compact_oid "
+                   "FROM image_answers i JOIN form_answers fa ON fa.form_answer_id = i.answer_id "
+                   "JOIN form_submissions s ON s.form_submission_id = fa.form_submission_id "
+                   "WHERE i.answer_id = ANY(%s) ORDER BY i.answer_id", (image_ids,))
+
+    # No compression, images are already compressed
+    with pq.ParquetWriter(path, schema, compression='none') as writer:
+        batch = []
+        for row in cursor:
+            data = bytes(row['data']) if row['data'] is not None else None
+            if row['mime_type'] is None and data is not None:
+                # Stored before uploads recorded their type
+                row['mime_type'] = uploads.sniff(data[:16])
+            batch.append({**row, 'data': data, 'compact': bytes(row['compact']) if row['compact'] is not None else None})
+            oids += [oid for oid in (row['content_oid'], row['compact_oid']) if oid is not None]
+            if len(batch) == IMAGE_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist(batch, schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema))
+    cursor.close()
+    return oids
+
+
+def _archive_chunk(db: Database, connection, cursor, form_id, days, questions, batch_size) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s, %s) AS locked", (LOCK_KEY, form_id))
+    if not cursor.fetchone()['locked']:
+        logger.info('form %s is being archived by another process', form_id)
+        return 0
+
+    cursor.execute("SELECT s.form_submission_id, s.user_id, s.submitted_at, d.answers AS document FROM form_submissions s "
+                   "LEFT JOIN submission_documents d ON d.form_submission_id = s.form_submission_id "
+                   "WHERE s.form_id=%s AND s.submitted_at < LOCALTIMESTAMP - make_interval(days => %s) "
+                   "ORDER BY s.submitted_at, s.form_submission_id LIMIT %s", (form_id, days, batch_size))
+    submissions = cursor.fetchall()
+    if not submissions:
+        return 0
+
+    ids = [sub['form_submission_id'] for sub in submissions]
+    first, last = submissions[0]['submitted_at'], submissions[-1]['submitted_at']
+    # With partitioned tables the time range prunes every statement to the
+    # chunk's months
+    key, key_params = ('', ())
+    if db.partitioned:
+        key, key_params = (' AND submitted_at BETWEEN %s AND %s', (first, last))
+
+    cursor.execute("SELECT fa.form_submission_id, fa.form_answer_id, fa.question_id, t.answer AS text, "
+                   "n.answer AS numeric, d.answer AS date, dd.dropdown_question_option_id AS option "
+                   "FROM form_answers fa "
+                   "LEFT JOIN text_answers t ON t.answer_id = fa.form_answer_id "
+                   "LEFT JOIN numeric_answers n ON n.answer_id = fa.form_answer_id "
+                   "LEFT JOIN date_answers d ON d.answer_id = fa.form_answer_id "
+                   "LEFT JOIN dropdown_answers dd ON dd.answer_id = fa.form_answer_id "
+                   "WHERE fa.form_submission_id = ANY(%s)" + key.replace('submitted_at', 'fa.submitted_at') +
+                   " ORDER BY fa.form_answer_id", (ids, *key_params))
+    answers = {sub_id: [] for sub_id in ids}
+    for row in cursor.fetchall():
+        answers[row['form_submission_id']].append(row)
+    answer_ids = [row['form_answer_id'] for rows in answers.values() for row in rows]
+    image_ids = [row['form_answer_id'] for rows in answers.values() for row in rows
+                 if questions.get(row['question_id']) == 'image']
+
+    cursor.execute("SELECT nextval(pg_get_serial_sequence('submission_archives', 'archive_id')) AS archive_id")
+    archive_id = cursor.fetchone()['archive_id']
+    directory = os.path.join(ARCHIVE_DIR, f'form-{form_id}')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(f'form-{form_id}', f'{archive_id}.submissions.parquet')
+    images_path = os.path.join(f'form-{form_id}', f'{archive_id}.images.parquet') if image_ids else None
+    # Written under temporary names, renamed once the deletes went through
+    files = [(os.path.join(ARCHIVE_DIR, p + '.tmp'), os.path.join(ARCHIVE_DIR, p)) for p in (path, images_path) if p]
+
+    try:
+        rows = [{'form_submission_id': sub['form_submission_id'], 'user_id': sub['user_id'],
+                 'submitted_at': sub['submitted_at'],
+                 'answers': json.dumps(sub['document'] if sub['document'] is not None
+                                       else _document(questions, answers[sub['form_submission_id']]))}
+                for sub in submissions]
+        pq.write_table(pa.Table.from_pylist(rows, _schemas()[0]), files[0][0], compression=COMPRESSION)
+        oids = _write_images(connection, files[1][0], image_ids) if image_ids else []
+
+        cursor.execute("INSERT INTO submission_archives (archive_id, form_id, path, images_path, submission_count, "
+                       "first_submission_id, last_submission_id, first_submitted_at, last_submitted_at, "
+                       "first_image_id, last_image_id, bytes) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                       (archive_id, form_id, path, images_path, len(ids), min(ids), max(ids), first, last,
+                        min(image_ids, default=None), max(image_ids, default=None),
+                        sum(os.path.getsize(temporary) for temporary, _ in files)))
+
+        cursor.execute("SELECT lo_unlink(oid) FROM unnest(%s::oid[]) oid", (oids,))
+        cursor.execute("DELETE FROM image_transcode_queue WHERE answer_id = ANY(%s)", (image_ids,))
+        for table in ANSWER_TABLES:
+            cursor.execute(f"DELETE FROM {table} WHERE answer_id = ANY(%s)" + key, (answer_ids, *key_params))
+        cursor.execute("DELETE FROM form_answers WHERE form_answer_id = ANY(%s)" + key, (answer_ids, *key_params))
+        cursor.execute("DELETE FROM submission_documents WHERE form_submission_id = ANY(%s)", (ids,))
+        cursor.execute("DELETE FROM form_submissions WHERE form_submission_id = ANY(%s)" + key, (ids, *key_params))
+
+        for temporary, final in files:
+            os.replace(temporary, final)
+        connection.commit()
+
+    except BaseException:
+        for temporary, final in files:
+            for name in (temporary, final):
+                if os.path.exists(name):
+                    os.remove(name)
+        raise
+
+    return len(ids)
+
+
+def archive_form(db: Database, form_id, days, batch_size=5000) -> int:
+    # One transaction per chunk, returns how many submissions were archived
+    connection = db.connection
+    cursor = connection.cursor(cursor_factory=RealDictCursor)
+    archived = 0
+    try:
+        cursor.execute("SELECT q.question_id, t.question_type FROM questions q "
+                       "JOIN question_types t ON t.question_type_id = q.question_type_id WHERE q.form_id=%s", (form_id,))
+        questions = {row['question_id']: row['question_type'] for row in cursor.fetchall()}
+        connection.commit()
+
+        while True:
+            # Archived submissions drop out of the next chunk's query
+            done = _archive_chunk(db, connection, cursor, form_id, days, questions, batch_size)
+            if not done:
+                break
+            archived += done
+            logger.info('form %s: %s submissions archived', form_id, archived)
+
+        cursor.execute("UPDATE form_retention_policies SET last_run_at = now() WHERE form_id=%s", (form_id,))
+        connection.commit()
+        cursor.close()
+
+    except (Exception, psycopg2.Error) as error:
+        logger.exception(error)
+        connection.rollback()
+
+    return archived
+
+
+def run_policies(db: Database, batch_size=5000) -> int:
+    connection = db.connection
+    cursor = connection.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("SELECT form_id, archive_after_days FROM form_retention_policies ORDER BY form_id")
+    policies = cursor.fetchall()
+    connection.commit()
+    cursor.close()
+    return sum(archive_form(db, p['form_id'], p['archive_after_days'], batch_size) for p in policies)
+
+
+def run(db: Database, batch_size=5000, interval=None) -> int:
+    # Once, or every interval seconds until stopped
+    archived = 0
+    while True:
+        archived += run_policies(db, batch_size)
+        if not interval:
+            return archived
+        time.sleep(interval)
+
+
+def _archives(cursor, form_id, period='at', where='', params=()) -> list:
+    # Index rows of the form's archives overlapping the period, newest first,
+    # with the period's start as period_start
+    start = PERIOD_STARTS[period]
+    cursor.execute(f"SELECT *, ({start or 'NULL'})::timestamp AS period_start FROM submission_archives "
+                   f"WHERE form_id=%s {f'AND last_submitted_at >= {start}' if start else ''} {where} "
+                   "ORDER BY last_submitted_at DESC, archive_id DESC", (form_id, *params))
+    return cursor.fetchall()
+
+
+def _filters(archive, filters=()):
+    start = archive['period_start']
+    filters = list(filters) + ([('submitted_at', '>=', start)] if start is not None else [])
+    return filters or None
+
+
+def read_submissions(cursor, form_id, period='at', columns=None, skip=None) -> list:
+    """Archived submissions of the form in the period, newest first, as dicts
+    of form_submission_id, user_id, submitted_at and answers (a JSON string in
+    the submission_documents format). Archives where skip(submission_id) holds
+    for every row are only read for their ids and times."""
+    import pyarrow.parquet as pq
+
+    submissions = []
+    for archive in _archives(cursor, form_id, period):
+        path = os.path.join(ARCHIVE_DIR, archive['path'])
+        table = None
+        if skip is not None:
+            table = pq.read_table(path, columns=['form_submission_id', 'submitted_at'], filters=_filters(archive))
+            if not all(skip(sub_id) for sub_id in table.column('form_submission_id').to_pylist()):
+                table = None
+        if table is None:
+            table = pq.read_table(path, columns=columns, filters=_filters(archive))
+        table = table.sort_by([('submitted_at', 'descending'), ('form_submission_id', 'descending')])
+        submissions += table.to_pylist()
+    return submissions
+
+
+def find_submission(cursor, form_id, submission_id):
+    import pyarrow.parquet as pq
+
+    for archive in _archives(cursor, form_id, where='AND %s BETWEEN first_submission_id AND last_submission_id',
+                             params=(int(submission_id),)):
+        rows = pq.read_table(os.path.join(ARCHIVE_DIR, archive['path']),
+                             filters=[('form_submission_id', '=', int(submission_id))]).to_pylist()
+        if rows:
+            return rows[0]
+    return None
+
+
+def read_images(cursor, form_id, answer_ids, original=False) -> dict:
+    # {answer_id: bytes}, the compact copy when there is one unless original
+    import pyarrow.parquet as pq
+
+    answer_ids = [int(a) for a in answer_ids]
+    if not answer_ids:
+        return {}
+    images = {}
+    for archive in _archives(cursor, form_id, where='AND images_path IS NOT NULL AND first_image_id <= %s '
+                             'AND last_image_id >= %s', params=(max(answer_ids), min(answer_ids))):
+        table = pq.read_table(os.path.join(ARCHIVE_DIR, archive['images_path']), columns=['answer_id', 'data', 'compact'],
+                              filters=[('answer_id', 'in', answer_ids)])
+        for row in table.to_pylist():
+            variants = [row['data'], row['compact']] if original else [row['compact'], row['data']]
+            images[row['answer_id']] = next((v for v in variants if v is not None), None)
+    return {k: v for k, v in images.items() if v is not None}
+
+
+def iter_images(cursor, form_id, period='at'):
+    """Archived image rows of the form in the period, oldest first, one row
+    group in memory at a time. Same columns as the images file."""
+    import pyarrow.parquet as pq
+
+    archives = _archives(cursor, form_id, period, where='AND images_path IS NOT NULL')
+    for archive in reversed(archives):
+        start = archive['period_start']
+        images = pq.ParquetFile(os.path.join(ARCHIVE_DIR, archive['images_path']))
+        for batch in images.iter_batches(batch_size=IMAGE_ROW_GROUP):
+            for row in batch.to_pylist():
+                if start is None or row['submitted_at'] >= start:
+                    yield row
@@ -0,0 +1,86 @@
+"""Submission counts over time for the dashboard chart.
+
+submit_form and delete_entry append a +1 / -1 row per dropdown option chosen
+(and option 0 for the submission itself) to submission_rollup_deltas, and
+partitions.detach_month a -n row for each hour of the month it takes out.
+compact() folds pending deltas into submission_rollups, all three buckets at
+once, and drops hourly rows older than HOURLY_DAYS. Reads add whatever is
+still pending, so the chart stays exact between compactions.
+
+    flask compact-rollups
+
+A running app compacts by itself, see start_compaction(). Each process
+compacts after its own submissions and deletions; deltas of a process that
+stopped first are folded in with the next compaction anywhere.
+"""
+import logging
+import os
+import threading
+
+import psycopg2
+
+from database_helper import Database
+
+logger = logging.getLogger(__name__)
+
+HOURLY_DAYS = int(os.environ.get('ROLLUP_HOURLY_DAYS', 31))
+COMPACT_INTERVAL = int(os.environ.get('ROLLUP_COMPACT_INTERVAL', 60))
+# Advisory lock, one compaction at a time across workers
+LOCK_KEY = 8402
+
+
+def compact(db: Database) -> int:
+    # Returns how many deltas were folded in
+    connection = db.connection
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (LOCK_KEY,))
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            return 0
+
+        cursor.execute("WITH moved AS (DELETE FROM submission_rollup_deltas RETURNING form_id, hour, option_id, delta), "
+                       "hourly AS (SELECT form_id, hour, option_id, sum(delta) AS delta, count(*) AS n FROM moved GROUP BY 1, 2, 3), "
+                       "folded AS (INSERT INTO submission_rollups (form_id, bucket, option_id, period_start, count) "
+                       "SELECT form_id, b.bucket, option_id, date_trunc(b.bucket, hour), sum(delta) "
+                       "FROM hourly, (VALUES ('hour'), ('day'), ('week')) b (bucket) "
+                       "WHERE b.bucket <> 'hour' OR hour >= date_trunc('hour', LOCALTIMESTAMP - make_interval(days => %s)) "
+                       "GROUP BY 1, 2, 3, 4 "
+                       "ON CONFLICT (form_id, bucket, option_id, period_start) "
+                       "DO UPDATE SET count = submission_rollups.count + EXCLUDED.count) "
+                       "SELECT COALESCE(sum(n), 0) FROM hourly", (HOURLY_DAYS,))
+        folded = int(cursor.fetchone()[0])
+
+        # Days and weeks cover everything older
+        cursor.execute("DELETE FROM submission_rollups WHERE bucket = 'hour' "
+                       "AND period_start < date_trunc('hour', LOCALTIMESTAMP - make_interval(days => %s))", (HOURLY_DAYS,))
+        cursor.execute("DELETE FROM submission_rollups WHERE count = 0")
+        connection.commit()
+        cursor.close()
+        return folded
+
+    except (psycopg2.Error) as error:
+        logger.exception(error)
+        connection.rollback()
+        return 0
+
+
+def start_compaction(db: Database, interval=COMPACT_INTERVAL) -> threading.Thread:
+    # Idle until this process writes deltas, then folds them in `interval`
+    # seconds later on a connection opened for the run
+    def run():
+        while True:
+            db.rollups_pending.wait()
+            threading.Event().wait(interval)
+            # Deltas written during the run set it again
+            db.rollups_pending.clear()
+            try:
+                with db.dedicated():
+                    compact(db)
+            except (Exception, psycopg2.Error) as error:
+                logger.exception(error)
+                db.rollups_pending.set()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
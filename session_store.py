@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+import logging
+import threading
+
+import psycopg2
+from flask import Flask
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+from itsdangerous import want_bytes
+
+from database_helper import Database
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresSessionInterface(ServerSideSessionInterface):
+    """Server-side sessions in the flask_sessions table, so every worker
+    process sees the same logins. Expired rows are swept by a background
+    thread every `sweep_interval` seconds."""
+
+    session_class = ServerSideSession
+    ttl = False
+
+    def __init__(self, app: Flask, database: Database, permanent=False, key_prefix='session:', sweep_interval=300) -> None:
+        self.database = database
+        self.sweep_interval = sweep_interval
+
+        super().__init__(app, key_prefix=key_prefix, permanent=permanent, cleanup_n_requests=None)
+
+        if sweep_interval:
+            threading.Thread(target=self._sweep, daemon=True).start()
+
+    def _sweep(self) -> None:
+        while True:
+            threading.Event().wait(self.sweep_interval)
+            try:
+                # Own connection, the request pool is for requests
+                with self.database.dedicated():
+                    self._delete_expired_sessions()
+            except (Exception, psycopg2.Error) as error:
+                logger.exception(error)
+
+    def _execute(self, query, params, fetch=False):
+        connection = self.database.connection
+        try:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            row = cursor.fetchone() if fetch else None
+            connection.commit()
+            cursor.close()
+            return row
+
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            connection.close()
+            self.database.reconnect()
+            raise
+
+    def _delete_expired_sessions(self) -> None:
+        self._execute("DELETE FROM flask_sessions WHERE expiry <= %s", (datetime.utcnow(),))
+
+    def _retrieve_session_data(self, store_id: str):
+        row = self._execute("SELECT data FROM flask_sessions WHERE session_id=%s AND expiry > %s",
+                            (store_id, datetime.utcnow()), fetch=True)
+        if row is None:
+            return None
+        return self.serializer.decode(want_bytes(row[0]))
+
+    def _delete_session(self, store_id: str) -> None:
+        self._execute("DELETE FROM flask_sessions WHERE session_id=%s", (store_id,))
+
+    def _upsert_session(self, session_lifetime: timedelta, session: ServerSideSession, store_id: str) -> None:
+        data = self.serializer.encode(session)
+        self._execute("INSERT INTO flask_sessions (session_id, data, expiry) VALUES (%s, %s, %s) "
+                      "ON CONFLICT (session_id) DO UPDATE SET data = EXCLUDED.data, expiry = EXCLUDED.expiry",
+                      (store_id, psycopg2.Binary(data), datetime.utcnow() + session_lifetime))
@@ -0,0 +1,188 @@
+"""Moves a form between the two answer layouts.
+
+    eav       form_answers plus one typed table per question type
+    document  one submission_documents row (JSONB) per submission
+
+    flask migrate-storage 12 document
+
+The form's mode is switched first so new submissions already use the target
+layout, then existing submissions are converted in batches, one transaction
+per batch. Reads handle both layouts, so the form stays usable meanwhile and
+an interrupted run can simply be started again.
+"""
+import logging
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from database_helper import Database
+
+logger = logging.getLogger(__name__)
+
+MODES = ('eav', 'document')
+
+# Typed tables a non-image answer can live in
+ANSWER_TABLES = ['text_answers', 'numeric_answers', 'date_answers', 'dropdown_answers']
+
+
+def _questions(db: Database, cursor, form_id) -> dict:
+    cursor.execute("SELECT question_id FROM questions WHERE form_id=%s ORDER BY position", (form_id,))
+    return {row['question_id']: db.get_question(row['question_id']) for row in cursor.fetchall()}
+
+
+def _to_document(db: Database, cursor, form_id, questions, batch_size) -> int:
+    cursor.execute("SELECT s.form_submission_id, s.submitted_at FROM form_submissions s "
+                   "WHERE s.form_id=%s AND NOT EXISTS "
+                   "(SELECT 1 FROM submission_documents d WHERE d.form_submission_id = s.form_submission_id) "
+                   "ORDER BY s.form_submission_id LIMIT %s", (form_id, batch_size))
+    submissions = cursor.fetchall()
+    if not submissions:
+        return 0
+
+    ids = [sub['form_submission_id'] for sub in submissions]
+    cursor.execute("SELECT fa.form_submission_id, fa.form_answer_id, fa.question_id, t.answer AS text, "
+                   "n.answer AS numeric, d.answer AS date, dd.dropdown_question_option_id AS option "
+                   "FROM form_answers fa "
+                   "LEFT JOIN text_answers t ON t.answer_id = fa.form_answer_id "
+                   "LEFT JOIN numeric_answers n ON n.answer_id = fa.form_answer_id "
+                   "LEFT JOIN date_answers d ON d.answer_id = fa.form_answer_id "
+                   "LEFT JOIN dropdown_answers dd ON dd.answer_id = fa.form_answer_id "
+                   "WHERE fa.form_submission_id = ANY(%s)", (ids,))
+
+    collected = {sub_id: [] for sub_id in ids}
+    moved = []
+    for row in cursor.fetchall():
+        q = questions.get(row['question_id'])
+        if q is None:
+            continue
+        if q['type'] == 'image':
+            # Image rows stay where they are, the document points at them
+            value = row['form_answer_id']
+        else:
+            moved.append(row['form_answer_id'])
+            value = {'text': row['text'], 'coordinates': row['text'], 'numeric': row['numeric'],
+                     'date': row['date'], 'dropdown': row['option']}.get(q['type'])
+        collected[row['form_submission_id']].append((q, value))
+
+    for answer_id in moved:
+        db.unindex_coordinates(cursor, answer_id)
+    for table in ANSWER_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE answer_id = ANY(%s)", (moved,))
+    cursor.execute("DELETE FROM form_answers WHERE form_answer_id = ANY(%s)", (moved,))
+
+    for sub in submissions:
+        db._write_document(cursor, form_id, sub['form_submission_id'], sub['submitted_at'],
+                           collected[sub['form_submission_id']])
+
+    return len(submissions)
+
+
+def _to_eav(db: Database, cursor, form_id, questions, batch_size) -> int:
+    cursor.execute("SELECT d.form_submission_id, d.answers, s.submitted_at FROM submission_documents d "
+                   "JOIN form_submissions s ON s.form_submission_id = d.form_submission_id "
+                   "WHERE d.form_id=%s ORDER BY d.form_submission_id LIMIT %s", (form_id, batch_size))
+    documents = cursor.fetchall()
+
+    for doc in documents:
+        sub_id = doc['form_submission_id']
+        cursor.execute("SELECT answer_id FROM coordinate_answers WHERE form_submission_id=%s", (sub_id,))
+        for point in cursor.fetchall():
+            db.unindex_coordinates(cursor, point['answer_id'])
+        cursor.execute("DELETE FROM submission_documents WHERE form_submission_id=%s", (sub_id,))
+
+        for key, value in doc['answers'].items():
+            q = questions.get(int(key))
+            if q is None:
+                continue
+            if q['type'] == 'image':
+                # Already stored, _write_eav_answer leaves ints alone
+                continue
+            db._write_eav_answer(cursor, form_id, sub_id, doc['submitted_at'], q, value)
+
+    return len(documents)
+
+
+def create_projections(db: Database, form_id) -> int:
+    """Typed expression indexes on the form's documents, one per numeric,
+    dropdown or date question, plus a form_<id>_documents view exposing the
+    same expressions as columns q<question_id>. Filters on the view use the
+    indexes. Text answers are served by the GIN index on answers.
+
+    Indexes are built CONCURRENTLY, so submissions keep coming in while they
+    build. That cannot run in a transaction, hence the autocommit connection."""
+    form_id = int(form_id)
+    columns = []
+    created = 0
+    with db.dedicated(autocommit=True) as connection:
+        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            for question_id, q in _questions(db, cursor, form_id).items():
+                question_id = int(question_id)
+                expression = {
+                    'numeric': f"((answers->>'{question_id}')::numeric)",
+                    'dropdown': f"((answers->>'{question_id}')::integer)",
+                    # ISO dates sort as text, and a text to date cast is not immutable
+                    'date': f"(answers->>'{question_id}')",
+                    'image': f"((answers->'{question_id}'->>'image')::integer)",
+                }.get(q['type'], f"(answers->>'{question_id}')")
+                columns.append(f"{expression} AS q{question_id}")
+
+                if q['type'] in ('numeric', 'dropdown', 'date'):
+                    name = f'submission_documents_q{question_id}_idx'
+                    # A concurrent build that failed part way leaves an invalid
+                    # index that IF NOT EXISTS would keep skipping
+                    cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+                    row = cursor.fetchone()
+                    if row is not None and not row['indisvalid']:
+                        cursor.execute(f"DROP INDEX CONCURRENTLY {name}")
+                    cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                                   f"ON submission_documents ({expression}) WHERE form_id = {form_id}")
+                    created += 1
+
+            cursor.execute(f"CREATE OR REPLACE VIEW form_{form_id}_documents AS "
+                           f"SELECT form_submission_id{''.join(', ' + c for c in columns)} "
+                           f"FROM submission_documents WHERE form_id = {form_id}")
+            cursor.close()
+            return created
+
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            return 0
+
+
+def migrate_form(db: Database, form_id, mode, batch_size=500) -> int:
+    if mode not in MODES:
+        raise ValueError(f'storage mode must be one of {MODES}')
+
+    connection = db.connection
+    cursor = connection.cursor(cursor_factory=RealDictCursor)
+    converted = 0
+    try:
+        cursor.execute("UPDATE forms SET storage_mode=%s WHERE form_id=%s", (mode, form_id))
+        connection.commit()
+
+        questions = _questions(db, cursor, form_id)
+        convert = _to_document if mode == 'document' else _to_eav
+        while True:
+            # Converted submissions drop out of the next batch's query
+            done = convert(db, cursor, form_id, questions, batch_size)
+            if not done:
+                break
+            connection.commit()
+            converted += done
+            print(converted, 'submissions converted')
+
+        # Rendered dashboard rows of this form are rebuilt from the new layout
+        cursor.execute("INSERT INTO form_versions (form_id, schema_version, updated_at) VALUES (%s, 1, now()) "
+                       "ON CONFLICT (form_id) DO UPDATE SET schema_version = form_versions.schema_version + 1, updated_at = now()",
+                       (form_id,))
+        connection.commit()
+        cursor.close()
+
+    except (psycopg2.Error) as error:
+        logger.exception(error)
+        connection.rollback()
+
+    if mode == 'document':
+        create_projections(db, form_id)
+    return converted
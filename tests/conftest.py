@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# database_helper reads it at import time
+os.environ.setdefault('DB_password', '')
+
+
+@pytest.fixture
+def database_url():
+    # Tests against a real server run only when one is given, e.g.
+    # TEST_DATABASE_URL='postgresql://postgres@/test?host=/tmp/pgdata'
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL not set')
+    return url
@@ -0,0 +1,55 @@
+import datetime
+import io
+import zipfile
+
+from archives import stream_zip
+
+MODIFIED = datetime.datetime(2024, 3, 5, 14, 30, 12)
+
+
+def read(pieces):
+    return zipfile.ZipFile(io.BytesIO(b''.join(pieces)))
+
+
+def test_entries_round_trip():
+    entries = [
+        ('1/7.png', MODIFIED, [b'\x89PNG', b'\r\n', b'rest']),
+        ('2/été.txt', MODIFIED, iter([b'hello ', b'world'])),
+        ('empty', MODIFIED, []),
+    ]
+    archive = read(stream_zip(entries))
+
+    assert archive.testzip() is None
+    assert archive.namelist() == ['1/7.png', '2/été.txt', 'empty']
+    assert archive.read('1/7.png') == b'\x89PNG\r\nrest'
+    assert archive.read('2/été.txt') == b'hello world'
+    assert archive.read('empty') == b''
+    info = archive.getinfo('1/7.png')
+    assert info.compress_type == zipfile.ZIP_STORED
+    assert info.date_time == (2024, 3, 5, 14, 30, 12)
+
+
+def test_no_entries():
+    archive = read(stream_zip([]))
+    assert archive.namelist() == []
+
+
+def test_streams_lazily():
+    pulled = []
+
+    def chunks(name):
+        for i in range(3):
+            pulled.append((name, i))
+            yield bytes(64 * 1024)
+
+    def entries():
+        for name in ('a', 'b'):
+            yield name, MODIFIED, chunks(name)
+
+    pieces = stream_zip(entries())
+    first = next(pieces)
+    # The first bytes go out before the second entry is read
+    assert ('b', 0) not in pulled
+
+    archive = read([first, *pieces])
+    assert archive.read('a') == archive.read('b') == bytes(3 * 64 * 1024)
@@ -0,0 +1,41 @@
+import pytest
+
+import geo
+
+
+@pytest.mark.parametrize('lat, lon, precision, expected', [
+    (57.64911, 10.40744, 11, 'u4pruydqqvj'),
+    (42.6, -5.6, 5, 'ezs42'),
+    (-25.382708, -49.265506, 8, '6gkzwgjz'),
+    (0, 0, 4, 's000'),
+])
+def test_encode(lat, lon, precision, expected):
+    assert geo.encode(lat, lon, precision) == expected
+
+
+def test_encode_prefixes_nest():
+    full = geo.encode(43.6532, -79.3832)
+    assert len(full) == geo.MAX_PRECISION
+    for precision in range(1, geo.MAX_PRECISION):
+        assert full.startswith(geo.encode(43.6532, -79.3832, precision))
+
+
+def test_encode_edges():
+    assert geo.encode(90, 180, 3) == 'zzz'
+    assert geo.encode(-90, -180, 3) == '000'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('43.6532, -79.3832', (43.6532, -79.3832)),
+    ('(43.6532,-79.3832)', (43.6532, -79.3832)),
+    ('  -33.9 ; 151.2 ', (-33.9, 151.2)),
+    ('+10 20', (10.0, 20.0)),
+    ('90,180', (90.0, 180.0)),
+])
+def test_parse_coordinates(text, expected):
+    assert geo.parse_coordinates(text) == expected
+
+
+@pytest.mark.parametrize('text', [None, '', 'Toronto', '91, 0', '0, -180.5', '1.2.3, 4', '43.6', '43.6, -79.4, 12'])
+def test_parse_coordinates_rejects(text):
+    assert geo.parse_coordinates(text) is None
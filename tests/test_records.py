@@ -0,0 +1,48 @@
+import datetime
+import gc
+import json
+from decimal import Decimal
+
+import msgspec
+
+from records import ENCODER, Image, Question, Response
+
+
+def test_response_encoding():
+    response = Response(12, ['text', Decimal('1.50'), datetime.date(2024, 1, 2), None, Image(7)])
+    assert json.loads(ENCODER.encode(response)) == [12, ['text', '1.50', '2024-01-02', None, [7, None]]]
+
+
+def test_image_with_data():
+    image = Image(7, b'\x89PNG')
+    assert ENCODER.encode(image) == b'[7,"iVBORw=="]'
+    assert image.base64() == 'iVBORw=='
+    assert Image(7).base64() == ''
+
+
+def test_cached_response():
+    assert ENCODER.encode(Response(3)) == b'[3,null]'
+
+
+def test_question_encoding():
+    question = Question(4, 'Where?', 'location', 2)
+    assert json.loads(ENCODER.encode(question)) == {'question_id': 4, 'text': 'Where?', 'type': 'location', 'form_id': 2}
+
+
+def test_document():
+    questions = [Question(1, 'Name', 'text', 2)]
+    encoded = ENCODER.encode({'questions': questions, 'responses': [Response(5, ['Ann'])]})
+    assert json.loads(encoded) == {
+        'questions': [{'question_id': 1, 'text': 'Name', 'type': 'text', 'form_id': 2}],
+        'responses': [[5, ['Ann']]],
+    }
+
+
+def test_round_trip():
+    encoded = ENCODER.encode([Response(1, ['a', None]), Response(2)])
+    assert msgspec.json.decode(encoded, type=list[Response]) == [Response(1, ['a', None]), Response(2)]
+
+
+def test_not_tracked_by_gc():
+    assert not gc.is_tracked(Response(1, ['a']))
+    assert not gc.is_tracked(Image(1, b'x'))
@@ -0,0 +1,197 @@
+import os
+import time
+
+import psycopg2
+import pytest
+
+from replicas import ReplicaSet, parse_lsn
+
+PRIMARY_LSN = '0/3000000'
+
+
+class FakeCursor:
+    def __init__(self, row) -> None:
+        self.row = row
+
+    def execute(self, sql):
+        if isinstance(self.row, Exception):
+            raise self.row
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, row) -> None:
+        self.row = row
+        self.autocommit = False
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self.row)
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    def __init__(self, row) -> None:
+        self.row = row
+        self._used = {}
+
+    def getconn(self, key=None):
+        self._used.setdefault(key, FakeConnection(self.row))
+        return self._used[key]
+
+    def putconn(self, connection, key=None, close=False):
+        del self._used[key]
+
+
+class FakePrimary:
+    def __init__(self, lsn=PRIMARY_LSN) -> None:
+        self.lsn = lsn
+        self.connections = 0
+
+    def connect(self, autocommit=False):
+        self.connections += 1
+        return FakeConnection(self.lsn if isinstance(self.lsn, Exception) else (self.lsn,))
+
+
+@pytest.fixture(autouse=True)
+def no_health_thread(monkeypatch):
+    # Checks run when the test calls them
+    monkeypatch.setattr(ReplicaSet, '_check_forever', lambda self: None)
+
+
+def replica_set(*rows, primary=None, max_lag=5.0):
+    replica_set = ReplicaSet(primary or FakePrimary(), [f'replica-{i}' for i in range(len(rows))], max_lag=max_lag)
+    for replica, row in zip(replica_set.replicas, rows):
+        replica.pool = FakePool(row)
+    return replica_set
+
+
+def test_parse_lsn():
+    assert parse_lsn('16/B374D848') == (0x16 << 32) + 0xB374D848
+    assert parse_lsn('0/3000000') < parse_lsn('0/3000001') < parse_lsn('1/0')
+    assert parse_lsn(None) is None
+
+
+def test_caught_up_standby_is_healthy_however_old():
+    # Nothing written for an hour: old replay timestamp, same position
+    rs = replica_set((True, PRIMARY_LSN, 3600.0))
+    rs.check()
+    replica = rs.replicas[0]
+    assert replica.healthy and replica.lag == 0
+    assert replica.replay_lsn == parse_lsn(PRIMARY_LSN)
+
+
+def test_lagging_standby_is_out_of_rotation():
+    rs = replica_set((True, '0/2000000', 30.0), (True, '0/2FFFFFF', 1.0))
+    rs.check()
+    behind, close = rs.replicas
+    assert not behind.healthy and behind.lag == 30.0
+    assert close.healthy and close.lag == 1.0
+
+
+def test_primary_unreachable_falls_back_to_replay_timestamp():
+    rs = replica_set((True, PRIMARY_LSN, 30.0), primary=FakePrimary(psycopg2.OperationalError('down')))
+    rs.check()
+    assert not rs.replicas[0].healthy
+
+
+def test_primary_connection_is_reused():
+    primary = FakePrimary()
+    rs = replica_set((True, PRIMARY_LSN, 0.0), primary=primary)
+    rs.check()
+    rs.check()
+    assert primary.connections == 1
+
+
+def test_not_a_standby():
+    rs = replica_set((False, None, None))
+    rs.check()
+    replica = rs.replicas[0]
+    assert replica.healthy and replica.replay_lsn is None
+
+
+def test_failing_replica_is_marked_down():
+    rs = replica_set((True, PRIMARY_LSN, 0.0))
+    rs.check()
+    assert rs.replicas[0].healthy
+
+    rs.replicas[0].pool._used['health'].row = psycopg2.OperationalError('gone')
+    rs.check()
+    assert not rs.replicas[0].healthy
+    # The broken health connection is dropped
+    assert 'health' not in rs.replicas[0].pool._used
+
+
+def test_choose_by_lsn():
+    rs = replica_set((True, '0/2000000', 1.0), (True, PRIMARY_LSN, 0.0))
+    rs.check()
+    behind, current = rs.replicas
+
+    assert rs.choose(parse_lsn(PRIMARY_LSN)) is current
+    assert rs.choose(parse_lsn('0/2000000'), pinned=behind) is behind
+    # Nobody has replayed the write yet: read from the primary
+    assert rs.choose(parse_lsn('0/3000001')) is None
+    assert rs.choose() in (behind, current)
+
+
+def test_choose_skips_unhealthy():
+    rs = replica_set((True, '0/2000000', 30.0))
+    rs.check()
+    assert rs.choose() is None
+    assert rs.choose(pinned=rs.replicas[0]) is None
+
+
+def test_server_that_is_not_a_standby(database_url):
+    # A single local server listed as its own replica
+    from database_helper import Database
+
+    primary = Database(dsn=database_url, replicas='')
+    rs = ReplicaSet(primary, [database_url])
+    try:
+        rs.check()
+        replica = rs.replicas[0]
+        assert replica.healthy and replica.replay_lsn is None
+        assert rs.choose(rs._primary_lsn()) is replica
+    finally:
+        rs.close()
+        primary.close()
+
+
+def test_streaming_standby():
+    # Two local instances: TEST_DATABASE_URL and a streaming standby of it
+    primary_url, standby_url = os.environ.get('TEST_DATABASE_URL'), os.environ.get('TEST_REPLICA_URL')
+    if not (primary_url and standby_url):
+        pytest.skip('TEST_DATABASE_URL and TEST_REPLICA_URL not set')
+    from database_helper import Database
+
+    primary = Database(dsn=primary_url, replicas='')
+    rs = ReplicaSet(primary, [standby_url])
+    connection = primary.connect(autocommit=True)
+    try:
+        cursor = connection.cursor()
+        # A committed write the standby has to replay
+        cursor.execute("SELECT txid_current()")
+        cursor.execute("SELECT pg_current_wal_lsn()::text")
+        written = parse_lsn(cursor.fetchone()[0])
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            rs.check()
+            if rs.choose(written) is not None:
+                break
+            time.sleep(0.2)
+        replica = rs.replicas[0]
+        assert replica.replay_lsn is not None and replica.replay_lsn >= written
+        assert rs.choose(written) is replica
+        assert rs.choose(written + (1 << 40)) is None
+    finally:
+        connection.close()
+        rs.close()
+        primary.close()
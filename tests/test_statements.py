@@ -0,0 +1,111 @@
+import psycopg2
+import psycopg2.errors
+import pytest
+
+from database_helper import StatementRegistry
+
+STATEMENTS = {'ok': 'SELECT $1::int', 'boom': 'SELECT 1 / $1::int'}
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        # What the server has prepared, which a rollback does not undo
+        self.prepared = set()
+        self.sent = []
+
+
+class FakeCursor:
+    """Runs a batch the way the server does: statement by statement, up to
+    the first error."""
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+
+    def mogrify(self, sql, params):
+        return (sql % tuple(repr(p) for p in params)).encode()
+
+    def execute(self, sql, params=None):
+        if params:
+            sql = self.mogrify(sql, params).decode()
+        self.connection.sent.append(sql)
+        for statement in sql.split(';\n'):
+            if statement == 'DEALLOCATE ALL':
+                self.connection.prepared.clear()
+            elif statement.startswith('PREPARE '):
+                name = statement.split()[1]
+                if name in self.connection.prepared:
+                    raise psycopg2.errors.DuplicatePreparedStatement(f'prepared statement "{name}" already exists')
+                self.connection.prepared.add(name)
+            elif statement.startswith('EXECUTE '):
+                name = statement.split()[1]
+                if name not in self.connection.prepared:
+                    raise psycopg2.errors.InvalidSqlStatementName(f'prepared statement "{name}" does not exist')
+                if name == 'boom' and statement.endswith('(0)'):
+                    raise psycopg2.errors.DivisionByZero('division by zero')
+
+
+@pytest.fixture
+def cursor():
+    return FakeCursor(FakeConnection())
+
+
+def test_pipeline_prepares_once(cursor):
+    registry = StatementRegistry(STATEMENTS)
+    registry.pipeline(cursor, [('ok', (1,)), ('ok', (2,))])
+    registry.pipeline(cursor, [('ok', (3,))])
+
+    first, second = cursor.connection.sent
+    assert first.count('PREPARE ok') == 1
+    assert 'PREPARE' not in second
+
+
+def test_failed_pipeline_is_retried(cursor):
+    registry = StatementRegistry(STATEMENTS)
+    with pytest.raises(psycopg2.errors.DivisionByZero):
+        registry.pipeline(cursor, [('ok', (1,)), ('boom', (0,))])
+    # Both PREPAREs ran before the failing EXECUTE
+    assert cursor.connection.prepared == {'ok', 'boom'}
+
+    registry.pipeline(cursor, [('ok', (1,)), ('boom', (1,))])
+    assert cursor.connection.sent[-1].startswith('DEALLOCATE ALL;\nPREPARE ok')
+
+    # Reset only once
+    registry.pipeline(cursor, [('boom', (2,))])
+    assert cursor.connection.sent[-1] == 'EXECUTE boom (2)'
+
+
+def test_execute_after_failed_pipeline(cursor):
+    registry = StatementRegistry(STATEMENTS)
+    with pytest.raises(psycopg2.errors.DivisionByZero):
+        registry.pipeline(cursor, [('ok', (1,)), ('boom', (0,))])
+
+    registry.execute(cursor, 'ok', (5,))
+    assert cursor.connection.sent[-3:] == ['DEALLOCATE ALL', 'PREPARE ok AS SELECT $1::int', 'EXECUTE ok (5)']
+
+
+def test_failure_with_everything_prepared(cursor):
+    registry = StatementRegistry(STATEMENTS)
+    registry.pipeline(cursor, [('ok', (1,)), ('boom', (1,))])
+    with pytest.raises(psycopg2.errors.DivisionByZero):
+        registry.pipeline(cursor, [('boom', (0,))])
+
+    # Nothing was prepared by the failed batch, so nothing to reset
+    registry.pipeline(cursor, [('ok', (2,))])
+    assert cursor.connection.sent[-1] == 'EXECUTE ok (2)'
+
+
+def test_pipeline_recovers_on_postgres(database_url):
+    connection = psycopg2.connect(database_url)
+    try:
+        registry = StatementRegistry({'probe_ok': 'SELECT $1::int', 'probe_boom': 'SELECT 1 / $1::int'})
+        with connection.cursor() as cur:
+            with pytest.raises(psycopg2.errors.DivisionByZero):
+                registry.pipeline(cur, [('probe_ok', (1,)), ('probe_boom', (0,))])
+            connection.rollback()
+
+            registry.pipeline(cur, [('probe_ok', (2,)), ('probe_boom', (1,))])
+            assert cur.fetchone() == (1,)
+            registry.execute(cur, 'probe_ok', (3,))
+            assert cur.fetchone() == (3,)
+    finally:
+        connection.close()
@@ -0,0 +1,144 @@
+import datetime
+import http.server
+import json
+import threading
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, exceptions, jwt
+
+from token_verifier import TokenVerifier
+
+AUDIENCE = 'client-id.apps.example.com'
+ISSUER = 'https://accounts.google.com'
+
+
+def make_key(kid):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+    return crypt.RSASigner.from_string(private, key_id=kid), cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def token(signer, **claims):
+    now = int(time.time())
+    payload = {'iss': ISSUER, 'aud': AUDIENCE, 'sub': '42', 'email': 'user@example.com', 'iat': now, 'exp': now + 600}
+    payload.update(claims)
+    return jwt.encode(signer, payload).decode()
+
+
+class Issuer:
+    """Local stand-in for Google's certs endpoint."""
+
+    def __init__(self) -> None:
+        self.certs = {}
+        self.headers = {'Cache-Control': 'public, max-age=3600'}
+        self.hits = 0
+        issuer = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                issuer.hits += 1
+                body = json.dumps(issuer.certs).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                for name, value in issuer.headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/certs'
+
+
+@pytest.fixture
+def issuer():
+    issuer = Issuer()
+    yield issuer
+    issuer.server.shutdown()
+
+
+@pytest.fixture
+def key(issuer):
+    signer, cert = make_key('key-1')
+    issuer.certs['key-1'] = cert
+    return signer
+
+
+def verifier(issuer, **kwargs):
+    kwargs.setdefault('min_refresh_interval', 0)
+    return TokenVerifier(AUDIENCE, certs_url=issuer.url, issuers=(ISSUER,), **kwargs)
+
+
+def test_verifies_locally_after_one_fetch(issuer, key):
+    v = verifier(issuer)
+    for _ in range(5):
+        assert v.verify(token(key))['email'] == 'user@example.com'
+    assert issuer.hits == 1
+
+
+def test_honours_max_age(issuer, key):
+    issuer.headers = {'Cache-Control': 'max-age=600', 'Age': '100'}
+    v = verifier(issuer)
+    v.verify(token(key))
+    assert v.expires_at - v.fetched_at == pytest.approx(500)
+
+
+def test_no_cache_expires_immediately(issuer, key):
+    issuer.headers = {'Cache-Control': 'no-cache'}
+    # Keeps the background refresher from refetching in a loop
+    v = verifier(issuer, min_refresh_interval=60)
+    v.verify(token(key))
+    assert v.expires_at == v.fetched_at
+
+
+def test_default_max_age_without_headers(issuer, key):
+    issuer.headers = {}
+    v = verifier(issuer, default_max_age=60)
+    v.verify(token(key))
+    assert v.expires_at - v.fetched_at == 60
+
+
+def test_rotated_key_is_fetched(issuer, key):
+    v = verifier(issuer)
+    v.verify(token(key))
+
+    rotated, cert = make_key('key-2')
+    issuer.certs = {'key-2': cert}
+    assert v.verify(token(rotated))['sub'] == '42'
+    assert issuer.hits == 2
+
+
+def test_unknown_signer_rejected(issuer, key):
+    v = verifier(issuer)
+    forged, _ = make_key('key-1')
+    with pytest.raises(ValueError):
+        v.verify(token(forged))
+
+
+def test_wrong_audience_rejected(issuer, key):
+    with pytest.raises(ValueError):
+        verifier(issuer).verify(token(key, aud='someone-else'))
+
+
+def test_wrong_issuer_rejected(issuer, key):
+    with pytest.raises(exceptions.GoogleAuthError):
+        verifier(issuer).verify(token(key, iss='https://evil.example.com'))
+
+
+def test_expired_token_rejected(issuer, key):
+    with pytest.raises(ValueError):
+        verifier(issuer).verify(token(key, iat=int(time.time()) - 7200, exp=int(time.time()) - 3600))
@@ -0,0 +1,107 @@
+import logging
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth import exceptions, jwt
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+
+class TokenVerifier:
+    """Verifies Google ID tokens locally against a cached copy of the
+    issuer's signing certificates.
+
+    The certificates are fetched over one pooled HTTP session, kept for as
+    long as the issuer's Cache-Control/Expires headers allow, and refreshed
+    by a background thread before they go stale, so logins never wait on
+    the network unless the issuer rotates to a key we have not seen yet.
+    """
+
+    def __init__(self, audience, certs_url=GOOGLE_CERTS_URL, issuers=GOOGLE_ISSUERS,
+                 default_max_age=3600, min_refresh_interval=30, clock_skew_in_seconds=10) -> None:
+        self.audience = audience
+        self.certs_url = certs_url
+        self.issuers = issuers
+        self.default_max_age = default_max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.clock_skew_in_seconds = clock_skew_in_seconds
+
+        self.http = requests.Session()
+        self.http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        self.http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=10))
+
+        self.certs = {}
+        self.expires_at = 0
+        self.fetched_at = 0
+        self.lock = threading.Lock()
+        self.refresher = None
+
+    def _max_age(self, response) -> float:
+        cache_control = response.headers.get('Cache-Control', '')
+        if 'no-store' in cache_control or 'no-cache' in cache_control:
+            return 0
+
+        match = re.search(r'max-age=(\d+)', cache_control)
+        if match:
+            return max(int(match.group(1)) - int(response.headers.get('Age', 0)), 0)
+
+        if 'Expires' in response.headers:
+            try:
+                return max(parsedate_to_datetime(response.headers['Expires']).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+
+        return self.default_max_age
+
+    def refresh(self) -> None:
+        with self.lock:
+            # Another thread may have refreshed while this one waited
+            if time.time() - self.fetched_at < self.min_refresh_interval:
+                return
+
+            response = self.http.get(self.certs_url, timeout=10)
+            response.raise_for_status()
+
+            self.certs = response.json()
+            self.fetched_at = time.time()
+            self.expires_at = self.fetched_at + self._max_age(response)
+
+    def _refresh_forever(self) -> None:
+        while True:
+            # Refresh once 80% of the lifetime has passed
+            wait = (self.expires_at - self.fetched_at) * 0.8 - (time.time() - self.fetched_at)
+            threading.Event().wait(max(wait, self.min_refresh_interval))
+            try:
+                self.refresh()
+            except (requests.RequestException, ValueError) as error:
+                logger.exception(error)
+
+    def _start_refresher(self) -> None:
+        if self.refresher is None or not self.refresher.is_alive():
+            self.refresher = threading.Thread(target=self._refresh_forever, daemon=True)
+            self.refresher.start()
+
+    def verify(self, token) -> dict:
+        if not self.certs or time.time() >= self.expires_at:
+            self.refresh()
+            self._start_refresher()
+
+        kid = jwt.decode_header(token).get('kid')
+        if kid not in self.certs:
+            # Key rotation, fetch once more before rejecting
+            self.refresh()
+
+        id_info = jwt.decode(token, certs=self.certs, audience=self.audience,
+                             clock_skew_in_seconds=self.clock_skew_in_seconds)
+
+        if id_info.get('iss') not in self.issuers:
+            raise exceptions.GoogleAuthError(f"Wrong issuer. 'iss' should be one of the following: {self.issuers}")
+
+        return id_info
@@ -0,0 +1,161 @@
+"""Background transcoding of uploaded images into compact WebP copies.
+
+    flask transcode-images --processes 4
+
+Uploads are queued in image_transcode_queue by submit_form. A dispatcher
+claims a batch of queued images (FOR UPDATE SKIP LOCKED, so several
+dispatchers can share the queue), transcodes them in a process pool and
+stores the results next to the originals in one transaction per batch.
+Failed images are retried with exponential backoff up to MAX_ATTEMPTS.
+"""
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+from PIL import Image, ImageOps
+from psycopg2.extras import RealDictCursor
+
+from database_helper import Database
+
+logger = logging.getLogger(__name__)
+
+MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 1600))
+QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+KEEP_ORIGINAL = os.environ.get('IMAGE_KEEP_ORIGINAL', '1') != '0'
+COMPACT_MIME_TYPE = 'image/webp'
+MAX_ATTEMPTS = 5
+
+
+def transcode(data: bytes, max_dimension=MAX_DIMENSION, quality=QUALITY) -> bytes:
+    # Runs in a worker process
+    with Image.open(io.BytesIO(data)) as image:
+        # Phones store rotation in EXIF, which the copy would otherwise lose
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+
+        out = io.BytesIO()
+        image.save(out, 'WEBP', quality=quality, method=4)
+        return out.getvalue()
+
+
+class Transcoder:
+
+    def __init__(self, db: Database, processes=None, batch_size=None, poll_interval=5, keep_original=KEEP_ORIGINAL,
+                 report_interval=60) -> None:
+        self.db = db
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size or self.processes * 2
+        self.poll_interval = poll_interval
+        self.keep_original = keep_original
+        self.report_interval = report_interval
+
+        self.started = time.monotonic()
+        self.stats = {'transcoded': 0, 'kept_original': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def metrics(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        metrics = dict(self.stats, elapsed=round(elapsed, 1),
+                       per_second=round((self.stats['transcoded'] + self.stats['kept_original']) / elapsed, 2) if elapsed else 0,
+                       size_ratio=round(self.stats['bytes_out'] / self.stats['bytes_in'], 3) if self.stats['bytes_in'] else None)
+
+        cursor = self.db.connection.cursor()
+        cursor.execute("SELECT count(*) FILTER (WHERE attempts < %s), count(*) FILTER (WHERE attempts >= %s) "
+                       "FROM image_transcode_queue", (MAX_ATTEMPTS, MAX_ATTEMPTS))
+        metrics['backlog'], metrics['given_up'] = cursor.fetchone()
+        cursor.close()
+        self.db.connection.commit()
+        return metrics
+
+    def _claim(self, cursor) -> list:
+        cursor.execute("SELECT q.answer_id, q.attempts, COALESCE(i.answer, lo_get(i.content_oid)) AS original "
+                       "FROM image_transcode_queue q LEFT JOIN image_answers i ON i.answer_id = q.answer_id "
+                       "WHERE q.next_attempt_at <= now() AND q.attempts < %s "
+                       "ORDER BY q.next_attempt_at LIMIT %s FOR UPDATE OF q SKIP LOCKED", (MAX_ATTEMPTS, self.batch_size))
+        return cursor.fetchall()
+
+    def _store(self, connection, cursor, job, compact) -> None:
+        original = bytes(job['original'])
+        self.stats['bytes_in'] += len(original)
+
+        if len(compact) >= len(original):
+            # Already small, the original doubles as the compact copy
+            self.stats['kept_original'] += 1
+            self.stats['bytes_out'] += len(original)
+            return
+
+        lobject = connection.lobject(0, 'wb')
+        lobject.write(compact)
+        lobject.close()
+
+        cursor.execute("UPDATE image_answers SET compact_oid=%s, compact_mime_type=%s, compact_size=%s "
+                       "WHERE answer_id=%s", (lobject.oid, COMPACT_MIME_TYPE, len(compact), job['answer_id']))
+        if cursor.rowcount == 0:
+            # Entry deleted while this batch was transcoding
+            lobject.unlink()
+            return
+
+        if not self.keep_original:
+            cursor.execute("SELECT lo_unlink(content_oid) FROM image_answers WHERE answer_id=%s AND content_oid IS NOT NULL",
+                           (job['answer_id'],))
+            cursor.execute("UPDATE image_answers SET answer=NULL, content_oid=NULL WHERE answer_id=%s", (job['answer_id'],))
+
+        self.stats['transcoded'] += 1
+        self.stats['bytes_out'] += len(compact)
+
+    def run_once(self, pool) -> int:
+        # One batch in one transaction, returns how many images were claimed
+        connection = self.db.connection
+        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            jobs = self._claim(cursor)
+            futures = [(job, pool.submit(transcode, bytes(job['original']))) for job in jobs if job['original'] is not None]
+
+            for job, future in futures:
+                try:
+                    compact = future.result()
+                except Exception as error:
+                    self.stats['failed'] += 1
+                    cursor.execute("UPDATE image_transcode_queue SET attempts = attempts + 1, last_error=%s, "
+                                   "next_attempt_at = now() + INTERVAL '1 minute' * power(2, attempts) WHERE answer_id=%s",
+                                   (f'{type(error).__name__}: {error}'[:500], job['answer_id']))
+                    continue
+
+                self._store(connection, cursor, job, compact)
+                cursor.execute("DELETE FROM image_transcode_queue WHERE answer_id=%s", (job['answer_id'],))
+
+            # Queue entries whose image no longer exists
+            cursor.execute("DELETE FROM image_transcode_queue WHERE answer_id = ANY(%s)",
+                           ([job['answer_id'] for job in jobs if job['original'] is None],))
+
+            connection.commit()
+            cursor.close()
+            return len(jobs)
+
+        except (psycopg2.Error) as error:
+            logger.exception(error)
+            connection.close()
+            self.db.reconnect()
+            return 0
+
+    def run(self, once=False) -> dict:
+        # Until stopped, or with once=True until the queue has nothing ready
+        reported = time.monotonic()
+        with ProcessPoolExecutor(self.processes) as pool:
+            while True:
+                claimed = self.run_once(pool)
+
+                if time.monotonic() - reported >= self.report_interval:
+                    logger.info('%s', self.metrics())
+                    reported = time.monotonic()
+
+                if not claimed:
+                    if once:
+                        break
+                    time.sleep(self.poll_interval)
+
+        return self.metrics()
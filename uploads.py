@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+from errors import AppError
+
+# Limits for uploaded images, in bytes
+MAX_FILE_BYTES = int(os.environ.get('UPLOAD_MAX_FILE_BYTES', 10 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.environ.get('UPLOAD_MAX_REQUEST_BYTES', 32 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the image formats phones and browsers produce
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+]
+# ISO base media brands, found at offset 8 after the 'ftyp' box type
+HEIF_BRANDS = {b'heic': 'image/heic', b'heix': 'image/heic', b'mif1': 'image/heif', b'msf1': 'image/heif',
+               b'avif': 'image/avif', b'avis': 'image/avif'}
+
+# File name extensions for downloads
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/bmp': 'bmp', 'image/tiff': 'tif',
+              'image/webp': 'webp', 'image/heic': 'heic', 'image/heif': 'heif', 'image/avif': 'avif'}
+
+
+def sniff(head: bytes):
+    # MIME type from the first bytes of a file, None if it is not an image we know
+    for signature, mime in SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        return HEIF_BRANDS.get(head[8:12])
+    return None
+
+
+class StoredUpload:
+
+    def __init__(self, oid, size, sha256, mime_type) -> None:
+        self.oid = oid
+        self.size = size
+        self.sha256 = sha256
+        self.mime_type = mime_type
+
+
+def store(connection, stream, max_bytes=MAX_FILE_BYTES, chunk_size=CHUNK_SIZE):
+    """Copies an uploaded file into a new large object chunk by chunk, hashing
+    and sniffing it on the way. Runs inside the caller's transaction, so a
+    rollback discards the object. Returns None for an empty upload."""
+    lobject = connection.lobject(0, 'wb')
+    digest = hashlib.sha256()
+    head = b''
+    size = 0
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        size += len(chunk)
+        if size > max_bytes:
+            raise AppError('Upload is too large', 413)
+
+        if len(head) < 16:
+            head += chunk[:16 - len(head)]
+        digest.update(chunk)
+        lobject.write(chunk)
+
+    if size == 0:
+        lobject.unlink()
+        return None
+
+    mime_type = sniff(head)
+    if mime_type is None:
+        raise AppError('Only image files can be uploaded', 415)
+
+    lobject.close()
+    return StoredUpload(lobject.oid, size, digest.hexdigest(), mime_type)